@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+"""
+重建索引时准备文档的吞吐量：模板渲染(原来的 article_text.txt) 对比 ArticleIndex.prepare_text
+
+在临时的 SQLite 数据库中生成带标签的文章，分别准备所有文档，统计耗时和 SQL 查询次数；
+--backend 时再加上写入内存中的 whoosh 索引(包括 jieba 分词)的完整重建耗时。
+用法：python benchmarks/bench_index_prepare.py [--articles 5000] [--repeat 3] [--backend]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoloo.settings')
+
+# 原来的 search/indexes/blog/article_text.txt
+LEGACY_TEMPLATE = """{{ object.article_title }}
+{{ object.tags }}
+{{ object.content_md }}
+{{ object.author }}
+"""
+
+
+def setup(tmp):
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+    # haystack 在导入时读取连接配置，必须在 django.setup() 之前修改
+    settings.HAYSTACK_CONNECTIONS = {
+        'default': {'ENGINE': 'blog.whoosh_cn_backend.WhooshEngine', 'STORAGE': 'ram'},
+    }
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def populate(count):
+    from blog.models import Article, Author, Category, Tag
+
+    authors = [Author.objects.create_user(username='bench%d' % i, password='bench') for i in range(20)]
+    categories = [Category.objects.create(name='category%d' % i) for i in range(10)]
+    tags = [Tag.objects.create(name='tag%d' % i) for i in range(50)]
+    Article.objects.bulk_create((
+        Article(article_link='a%d' % i, article_title='文章%d' % i, author=authors[i % 20],
+                category=categories[i % 10], content_md='内容' * 500, content_html='<p>%s</p>' % ('内容' * 500),
+                views=0, status='p')
+        for i in range(count)), batch_size=400)
+    through = Article.tags.through
+    through.objects.bulk_create((
+        through(article_id=pk, tag_id=tags[(pk + j) % 50].pk)
+        for pk in Article.objects.values_list('pk', flat=True) for j in range(3)), batch_size=400)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--backend', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup(tmp)
+        populate(args.articles)
+
+        from django.db import connection
+        from django.template import Context, Template
+        from django.test.utils import CaptureQueriesContext
+        from haystack import connections
+        from blog.models import Article
+
+        index = connections['default'].get_unified_index().get_index(Article)
+        template = Template(LEGACY_TEMPLATE)
+
+        def legacy():
+            for obj in Article.posted.all():
+                template.render(Context({'object': obj}))
+
+        def prepare():
+            for obj in index.index_queryset():
+                index.full_prepare(obj)
+
+        print('articles: %d' % args.articles)
+        for name, func in (('template', legacy), ('prepare_text', prepare)):
+            with CaptureQueriesContext(connection) as queries:
+                func()
+            best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+            print('%-14s %8.0f docs/s  %6d queries' % (name, args.articles / best, len(queries)))
+
+        if args.backend:
+            backend = connections['default'].get_backend()
+            backend.clear()
+            start = time.perf_counter()
+            queryset = index.index_queryset().order_by('pk')
+            for offset in range(0, args.articles, 1000):
+                backend.update(index, list(queryset[offset:offset + 1000]))
+            elapsed = time.perf_counter() - start
+            print('%-14s %8.0f docs/s' % ('reindex', args.articles / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+"""
+对比文章 Markdown 渲染的三种方式(大文档)：
+
+* markdown.markdown(...)       原来的做法，每次新建 Markdown 实例、重新加载扩展
+* MarkdownRenderer (未命中)     复用线程内的 Markdown 实例
+* MarkdownRenderer (命中)       内容没有变化，直接返回缓存的结果
+
+用法：python benchmarks/bench_markdown.py [--size 200] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import markdown  # noqa: E402
+
+from blog.lib.markdown_renderer import MarkdownRenderer  # noqa: E402
+
+EXTENSIONS = ('markdown.extensions.extra', 'markdown.extensions.nl2br')
+
+SECTION = """
+## 第 {n} 节
+
+Django 是一个高级的 Python Web 框架，鼓励快速开发和简洁实用的设计。*强调* 和 **加粗**，
+还有 `行内代码` 以及一个[链接](http://example.com/{n})。[^note{n}]
+
+* 列表项一
+* 列表项二
+    * 嵌套列表项
+
+| 名称 | 数量 |
+| ---- | ---- |
+| tag{n} | {n} |
+
+```python
+def hello_{n}():
+    return 'hello world'
+```
+
+> 引用的内容，第 {n} 段
+
+[^note{n}]: 第 {n} 个脚注
+"""
+
+
+def make_document(size_kb):
+    parts = []
+    n = 0
+    while sum(len(p) for p in parts) < size_kb * 1024:
+        parts.append(SECTION.format(n=n))
+        n += 1
+    return '\n'.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=200, help='文档大小(KB)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    text = make_document(args.size)
+    uncached = MarkdownRenderer(extensions=EXTENSIONS, cache_size=0)
+    cached = MarkdownRenderer(extensions=EXTENSIONS, cache_size=8)
+    assert uncached.render(text) == markdown.markdown(text, extensions=list(EXTENSIONS))
+    cached.render(text)
+
+    cases = [
+        ('markdown.markdown', lambda: markdown.markdown(text, extensions=list(EXTENSIONS))),
+        ('MarkdownRenderer (miss)', lambda: uncached.render(text)),
+        ('MarkdownRenderer (hit)', lambda: cached.render(text)),
+    ]
+    print('document: %d KB, %d chars' % (args.size, len(text)))
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print('%-26s %10.3f ms' % (name, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+"""
+深层页面的分页耗时：OFFSET 页码分页(Paginator) 对比 游标分页(KeysetPaginator)
+
+在临时的 SQLite 数据库中生成文章，分别取第 1 页、中间页和最后一页。
+用法：python benchmarks/bench_pagination.py [--articles 20000] [--per-page 10] [--repeat 5]
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import timeit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoloo.settings')
+
+
+def setup_database(path):
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = path
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def populate(count):
+    from django.utils import timezone
+    from blog.models import Article, Author, Category
+
+    author = Author.objects.create_user(username='bench', password='bench')
+    category = Category.objects.create(name='bench')
+    start = timezone.now()
+    Article.objects.bulk_create((
+        Article(article_link='a%d' % i, article_title='文章%d' % i, author=author, category=category,
+                content_md='x' * 2000, content_html='<p>%s</p>' % ('x' * 2000), views=0, status='p',
+                # 每 3 篇文章的创建时间相同，检验 id 作为第二排序键
+                created_time=start - datetime.timedelta(minutes=i // 3))
+        for i in range(count)), batch_size=400)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=20000)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_database(os.path.join(tmp, 'bench.sqlite3'))
+        populate(args.articles)
+
+        from django.core.paginator import Paginator
+        from blog.lib.paginator import KeysetPaginator
+        from blog.models import Article
+
+        queryset = Article.posted.select_related('author').defer(*Article.CONTENT_FIELDS)
+        paginator = Paginator(queryset.order_by('-created_time', '-pk'), args.per_page)
+        keyset = KeysetPaginator(queryset, args.per_page)
+
+        # 先顺着游标走一遍，记下每一页的游标
+        cursors, page = [None], keyset.page()
+        while page.has_next():
+            cursors.append(page.next_cursor)
+            page = keyset.page(cursors[-1])
+
+        print('articles: %d, pages: %d' % (args.articles, paginator.num_pages))
+        for number in sorted({1, paginator.num_pages // 2, paginator.num_pages}):
+            offset = min(timeit.repeat(lambda: list(paginator.page(number)), number=1, repeat=args.repeat))
+            cursor = cursors[number - 1]
+            seek = min(timeit.repeat(lambda: list(keyset.page(cursor)), number=1, repeat=args.repeat))
+            print('page %6d  offset: %8.2f ms  keyset: %8.2f ms' % (number, offset * 1000, seek * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+"""
+重建 whoosh 索引的耗时：逐批 update(rebuild_index 的做法) 对比多进程并行重建
+
+在临时的 SQLite 数据库中生成文章(内容是从 jieba 词典中随机挑选的词)，分别重建一次索引。
+用法：python benchmarks/bench_rebuild_index.py [--articles 5000] [--workers 4]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoloo.settings')
+
+
+def setup(tmp):
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+    # haystack 在导入时读取连接配置，必须在 django.setup() 之前修改
+    settings.HAYSTACK_CONNECTIONS = {
+        'default': {
+            'ENGINE': 'blog.whoosh_cn_backend.WhooshEngine',
+            'PATH': os.path.join(tmp, 'whoosh_index'),
+        },
+    }
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def populate(count, seed=0):
+    import jieba
+    from blog.models import Article, Author, Category
+
+    jieba.initialize()
+    rnd = random.Random(seed)
+    words = rnd.sample(sorted(w for w, f in jieba.dt.FREQ.items() if f >= 1000 and len(w) >= 2), 3000)
+    author = Author.objects.create_user(username='bench', password='bench')
+    category = Category.objects.create(name='bench')
+    articles = []
+    for i in range(count):
+        content = ''.join(rnd.choice(words) for _ in range(300))
+        articles.append(Article(article_link='a%d' % i, article_title=''.join(rnd.sample(words, 4)),
+                                author=author, category=category, content_md=content,
+                                content_html='<p>%s</p>' % content, views=0, status='p'))
+    Article.objects.bulk_create(articles, batch_size=400)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup(tmp)
+        populate(args.articles)
+
+        from haystack import connections
+        from blog.models import Article
+        from blog.search_rebuild import rebuild_index
+
+        backend = connections['default'].get_backend()
+        index = connections['default'].get_unified_index().get_index(Article)
+
+        start = time.perf_counter()
+        backend.clear()
+        queryset = index.index_queryset().order_by('pk')
+        for offset in range(0, args.articles, 1000):
+            backend.update(index, list(queryset[offset:offset + 1000]))
+        serial = time.perf_counter() - start
+        serial_count = backend.index.refresh().doc_count()
+
+        start = time.perf_counter()
+        parallel_count = rebuild_index(workers=args.workers)
+        parallel = time.perf_counter() - start
+
+        print('articles: %d, workers: %s' % (args.articles, args.workers or os.cpu_count()))
+        print('update (serial)   %8.2f s  %d docs' % (serial, serial_count))
+        print('parallel rebuild  %8.2f s  %d docs' % (parallel, parallel_count))
+
+
+if __name__ == '__main__':
+    main()
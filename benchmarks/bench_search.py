@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+"""
+搜索延迟：每次请求都打开新的 searcher(原来的做法) 对比 SearcherManager 共享的 searcher
+
+在临时目录中建立一个多段(segment)的 whoosh 索引，对同一组查询分别计时。
+用法：python benchmarks/bench_search.py [--docs 20000] [--segments 8] [--queries 200] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoloo.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from whoosh.fields import ID, TEXT, Schema  # noqa: E402
+from whoosh.filedb.filestore import FileStorage  # noqa: E402
+from whoosh.qparser import QueryParser  # noqa: E402
+
+from blog.whoosh_cn_backend import SearcherManager  # noqa: E402
+
+# 词表足够大，每个查询只命中少量文档，和博客的真实搜索差不多
+WORDS = ['word%d' % i for i in range(5000)]
+
+
+def build_index(path, docs, segments, seed=0):
+    rnd = random.Random(seed)
+    schema = Schema(id=ID(stored=True, unique=True), text=TEXT(stored=True))
+    ix = FileStorage(path).create_index(schema)
+    per_segment = docs // segments
+    for segment in range(segments):
+        writer = ix.writer()
+        for i in range(segment * per_segment, (segment + 1) * per_segment):
+            writer.add_document(id=str(i), text=' '.join(rnd.choice(WORDS) for _ in range(60)))
+        # merge=False 保留多个段，和增量写入的线上索引一样
+        writer.commit(merge=False)
+    return ix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--segments', type=int, default=8)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        ix = build_index(path, args.docs, args.segments)
+        query_parser = QueryParser('text', schema=ix.schema)
+        rnd = random.Random(1)
+        queries = [query_parser.parse('%s %s' % (rnd.choice(WORDS), rnd.choice(WORDS)))
+                   for _ in range(args.queries)]
+
+        def open_per_request():
+            index = ix
+            for query in queries:
+                index = index.refresh()
+                searcher = index.searcher()
+                searcher.search_page(query, 1, pagelen=10)
+                searcher.close()
+
+        manager = SearcherManager(ix)
+
+        def shared_searcher():
+            for query in queries:
+                with manager.searcher() as searcher:
+                    searcher.search_page(query, 1, pagelen=10)
+
+        print('docs: %d, segments: %d, queries: %d' % (args.docs, args.segments, args.queries))
+        for name, func in (('searcher per request', open_per_request), ('SearcherManager', shared_searcher)):
+            best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+            print('%-22s %8.3f ms/query' % (name, best * 1000 / args.queries))
+
+
+if __name__ == '__main__':
+    main()
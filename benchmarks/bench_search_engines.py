@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+"""
+whoosh 后端对比 SQLite FTS5 后端：建索引耗时、查询延迟和索引大小
+
+在临时的 SQLite 数据库中生成文章(内容是从 jieba 词典中随机挑选的词)，两个后端分别建立索引，
+再对同一组查询计时。whoosh 后端关闭了结果缓存，比较的是每次真正执行查询的耗时。
+用法：python benchmarks/bench_search_engines.py [--articles 5000] [--queries 200] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoloo.settings')
+
+# (名称, 连接)
+ENGINES = (('whoosh', 'default'), ('sqlite', 'sqlite'))
+
+
+def setup(tmp):
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+    # haystack 在导入时读取连接配置，必须在 django.setup() 之前修改
+    settings.HAYSTACK_CONNECTIONS = {
+        'default': {
+            'ENGINE': 'blog.whoosh_cn_backend.WhooshEngine',
+            'PATH': os.path.join(tmp, 'whoosh_index'),
+            'RESULT_CACHE_SIZE': 0,
+        },
+        'sqlite': {
+            'ENGINE': 'blog.sqlite_fts_backend.SQLiteFTSEngine',
+            'PATH': os.path.join(tmp, 'search_index.sqlite3'),
+        },
+    }
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def vocabulary(size, seed=0):
+    import jieba
+    jieba.initialize()
+    words = sorted(word for word, freq in jieba.dt.FREQ.items() if freq >= 1000 and len(word) >= 2)
+    return random.Random(seed).sample(words, min(size, len(words)))
+
+
+def populate(count, words, seed=0):
+    from blog.models import Article, Author, Category
+
+    rnd = random.Random(seed)
+    author = Author.objects.create_user(username='bench', password='bench')
+    category = Category.objects.create(name='bench')
+    articles = []
+    for i in range(count):
+        content = ''.join(rnd.choice(words) + ('。' if rnd.random() < 0.1 else '') for _ in range(300))
+        articles.append(Article(article_link='a%d' % i, article_title=''.join(rnd.sample(words, 4)),
+                                author=author, category=category, content_md=content,
+                                content_html='<p>%s</p>' % content, views=0, status='p'))
+    Article.objects.bulk_create(articles, batch_size=400)
+
+
+def index_size(path):
+    if os.path.isfile(path):
+        return sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup(tmp)
+        words = vocabulary(3000)
+        populate(args.articles, words)
+
+        from haystack import connections
+        from haystack.inputs import AutoQuery
+        from haystack.query import SQ
+        from blog.models import Article
+
+        rnd = random.Random(1)
+        queries = ['%s %s' % (rnd.choice(words), rnd.choice(words)) for _ in range(args.queries)]
+        print('articles: %d, queries: %d' % (args.articles, args.queries))
+
+        for name, alias in ENGINES:
+            backend = connections[alias].get_backend()
+            index = connections[alias].get_unified_index().get_index(Article)
+            backend.clear()
+
+            start = time.perf_counter()
+            queryset = index.index_queryset().order_by('pk')
+            for offset in range(0, args.articles, 1000):
+                backend.update(index, list(queryset[offset:offset + 1000]))
+            build = time.perf_counter() - start
+
+            if name == 'sqlite':
+                backend.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            size = index_size(connections.connections_info[alias]['PATH'])
+
+            # 和搜索页一样用 auto_query 生成各个后端的查询语句，只对后端执行查询计时
+            query_strings = []
+            for query in queries:
+                search_query = connections[alias].get_query()
+                search_query.add_filter(SQ(content=AutoQuery(query)))
+                query_strings.append(search_query.build_query())
+
+            def run_queries():
+                for query_string in query_strings:
+                    backend.search(query_string, end_offset=10)
+
+            latency = min(timeit.repeat(run_queries, number=1, repeat=args.repeat))
+            print('%-8s build: %8.2f s  query: %8.3f ms  size: %8.2f MB'
+                  % (name, build, latency * 1000 / args.queries, size / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+"""
+标签云字体大小计算(get_font_sizes)在不同分布的大量标签上的耗时
+
+用法：python benchmarks/bench_tag_cloud.py [--tags 100000] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blog.lib.tag_cloud import get_font_sizes  # noqa: E402
+
+
+def distributions(n, seed=0):
+    rnd = random.Random(seed)
+    names = ['tag%d' % i for i in range(n)]
+    return [
+        ('uniform(1, 1000)', {name: rnd.randint(1, 1000) for name in names}),
+        ('zipf-like', {name: max(1, int(10000 / (i + 1))) for i, name in enumerate(names)}),
+        ('all equal', {name: 7 for name in names}),
+        ('two values', {name: rnd.choice((1, 50)) for name in names}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tags', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('tags: %d' % args.tags)
+    for name, tag_counts in distributions(args.tags):
+        best = min(timeit.repeat(lambda: get_font_sizes(tag_counts), number=1, repeat=args.repeat))
+        print('%-18s %10.3f ms' % (name, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,13 @@
 # Author: LooEv
 
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .lib.navigation import CategoryNav
 from .models import Category
 
+category_nav = CategoryNav(Category)
+
 
 def hello_blog_global_settings(request):
     """
@@ -13,5 +18,6 @@ def hello_blog_global_settings(request):
     blog_data = dict()
     blog_data['site_domain'] = getattr(settings, 'SITE_DOMAIN', 'http://example.com/')
     blog_data['site_title'] = getattr(settings, 'SITE_TITLE', 'Hello Blog')
-    blog_data['categories'] = Category.objects.all().order_by('created_time')
+    # 只有模板用到分类时才会读取
+    blog_data['categories'] = SimpleLazyObject(category_nav.get_categories)
     return {'blog_data': blog_data}
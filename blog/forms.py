@@ -4,15 +4,28 @@
 
 import re
 
-import markdown
-
 from django import forms
+from django.conf import settings
 from django.contrib.auth import password_validation
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.utils.translation import ugettext_lazy as _
+from haystack import connections
+from haystack.forms import FacetedSearchForm
+from haystack.inputs import Exact
+from .lib.excerpt import make_excerpt
+from .lib.markdown_renderer import MarkdownRenderer
 from .models import Article, Category, Author, Tag
+from .page_cache import purge_article_pages
+
+ARTICLE_MARKDOWN_EXTENSIONS = ('markdown.extensions.extra', 'markdown.extensions.nl2br')
+
+article_markdown = MarkdownRenderer(
+    extensions=ARTICLE_MARKDOWN_EXTENSIONS,
+    cache_size=getattr(settings, 'MARKDOWN_RENDER_CACHE_SIZE', 128),
+)
 
 
 class ArticlePostForm(forms.Form):
@@ -20,6 +33,8 @@ class ArticlePostForm(forms.Form):
     required_css_class = 'required'
 
     tags_str_set = None
+    editable_fields = ['article_title', 'content_md', 'content_html', 'excerpt_html',
+                       'excerpt_text', 'status', 'category', 'updated_time']
 
     article_title = forms.CharField(
         label='文章标题',
@@ -77,43 +92,56 @@ class ArticlePostForm(forms.Form):
             tags.append(Tag.objects.get_or_create(name=tag)[0])
         return tags
 
+    @transaction.atomic
     def save(self, user_id, article_id=None):
         article_title = self.cleaned_data['article_title'].strip()
         content_md = self.cleaned_data['content']
-        content_html = markdown.markdown(
-            self.cleaned_data['content'],
-            extensions=['markdown.extensions.extra', 'markdown.extensions.nl2br', ]
-        )
+        content_html = article_markdown.render(content_md)
+        excerpt_html, excerpt_text = make_excerpt(content_html)
         new_tags = self.get_tags()
         status = self.cleaned_data['status']
         category = Category.objects.get(name=self.cleaned_data['category'])
         if article_id:
-            Article.objects.filter(pk=article_id). \
-                update(article_title=article_title,
-                       content_md=content_md,
-                       content_html=content_html,
-                       status=status,
-                       category=category,
-                       updated_time=timezone.now())
+            # 通过模型实例保存，信号处理函数才能知道哪些字段、状态发生了变化
             article = Article.objects.get(pk=article_id)
-            clear_tags = [tag.id for tag in article.tags.all() if tag not in new_tags]
+            was_published = article.status == 'p'
+            old_category_id = article.category_id
+            article.article_title = article_title
+            article.content_md = content_md
+            article.content_html = content_html
+            article.excerpt_html = excerpt_html
+            article.excerpt_text = excerpt_text
+            article.status = status
+            article.category = category
+            article.updated_time = timezone.now()
+            # 不写 views 字段，避免覆盖 ViewCounter 写回的浏览量
+            article.save(update_fields=self.editable_fields)
+            old_tag_ids = [tag.id for tag in article.tags.all()]
+            clear_tags = [pk for pk in old_tag_ids if pk not in {tag.id for tag in new_tags}]
+            article.tags.set(new_tags)
             if clear_tags:
-                article.tags.filter(pk__in=clear_tags).delete()
-            article.tags.clear()
-            article.tags.add(*new_tags)
-            article.save()
+                # 只删除已经没有任何文章使用的标签
+                Tag.objects.filter(pk__in=clear_tags, article=None).delete()
         else:
+            was_published, old_category_id, old_tag_ids = False, None, []
             article_link = self.gen_article_link(user_id)
             article = Article(article_link=article_link,
                               article_title=article_title,
                               author_id=user_id,
                               content_md=content_md,
                               content_html=content_html,
+                              excerpt_html=excerpt_html,
+                              excerpt_text=excerpt_text,
                               views=0,
                               status=status,
                               category=category)
             article.save()
             article.tags.add(*new_tags)
+
+        if was_published or article.status == 'p':
+            purge_article_pages(article, old_tag_ids + [tag.id for tag in new_tags],
+                                [old_category_id, article.category_id],
+                                status_changed=was_published != (article.status == 'p'))
         return article
 
 
@@ -164,3 +192,41 @@ class RegisterForm(forms.ModelForm):
         if commit:
             user.save()
         return user
+
+
+def supports_facets(searchqueryset):
+    """搜索后端是否支持分面统计和按年份过滤，SQLite FTS 后端不支持"""
+    backend = connections[searchqueryset.query._using].get_backend()
+    return getattr(backend, 'supports_facets', True)
+
+
+class ArticleSearchForm(FacetedSearchForm):
+    """
+    按 tags/category/year 分面过滤搜索结果，selected_facets 的格式为 "字段:值"，
+    例如 tags:django、year:2019；后端不支持分面时忽略
+    """
+    facet_fields = ('tags', 'category')
+
+    def search(self):
+        # 跳过 FacetedSearchForm 的处理，它生成的短语查询不能匹配 KEYWORD 字段中带空格的标签
+        sqs = super(FacetedSearchForm, self).search()
+        for field, value in self.get_selected_facets():
+            if field == 'year':
+                start = timezone.make_aware(timezone.datetime(value, 1, 1))
+                sqs = sqs.filter(created_time__gte=start, created_time__lt=start.replace(year=value + 1))
+            else:
+                sqs = sqs.filter(**{field: Exact(value)})
+        return sqs
+
+    def get_selected_facets(self):
+        """返回合法的 (字段, 值)，忽略格式不对的"""
+        selected = []
+        if not supports_facets(self.searchqueryset):
+            return selected
+        for facet in self.selected_facets:
+            field, _sep, value = facet.partition(':')
+            if field == 'year' and value.isdigit() and 1900 < int(value) < 10000:
+                selected.append((field, int(value)))
+            elif field in self.facet_fields and value:
+                selected.append((field, value))
+        return selected
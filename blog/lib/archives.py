@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+
+class ArchivesOverview:
+    # 缓存的是每年每月已发布文章的数量，发布/撤回/删除文章时失效(见 blog/signals.py)
+    cache_key = 'blog:archives:overview'
+    cache_timeout = 60 * 60 * 24
+
+    def __init__(self, article_model):
+        self.article_model = article_model
+
+    def get_month_counts(self):
+        month_counts = cache.get(self.cache_key)
+        if month_counts is None:
+            month_counts = list(self.article_model.posted.month_counts())
+            cache.set(self.cache_key, month_counts, self.cache_timeout)
+        return month_counts
+
+    def get_overview(self):
+        """
+        :return: [(年, 文章数量, [(月, 文章数量), ...]), ...]，按时间倒序
+        """
+        years = OrderedDict()
+        for year, month, count in self.get_month_counts():
+            years.setdefault(year, []).append((month, count))
+        return [(year, sum(count for _, count in months), months) for year, months in years.items()]
+
+    @classmethod
+    def invalidate(cls):
+        cache.delete(cls.cache_key)
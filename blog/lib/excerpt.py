@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+from html import unescape
+
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+EXCERPT_WORDS = 50
+
+
+def make_excerpt(content_html, words=EXCERPT_WORDS):
+    """
+    根据文章的 Html 内容生成摘要，返回 (Html 摘要, 纯文本摘要)
+    截断规则与模板过滤器 truncatewords_html 保持一致
+    """
+    if not content_html:
+        return '', ''
+    excerpt_html = Truncator(content_html).words(words, html=True, truncate=' …')
+    excerpt_text = Truncator(unescape(strip_tags(content_html))).words(words, truncate=' …')
+    return excerpt_html, excerpt_text
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+import hashlib
+import threading
+
+import markdown
+
+from .lru import LRUCache
+
+_MISSING = object()
+
+
+class MarkdownRenderer:
+    """
+    可复用的 Markdown 渲染器
+
+    * 每个线程复用同一个 Markdown 实例，使用前 reset()，不必每次都重新加载扩展
+    * 渲染结果按 (内容哈希, 扩展集合) 缓存在有容量上限的 LRU 中，
+      内容没有变化时(例如自动保存草稿)直接返回上次的结果
+    """
+
+    def __init__(self, extensions=(), cache_size=128):
+        self.extensions = tuple(extensions)
+        self.cache = LRUCache(maxsize=cache_size)
+        self._local = threading.local()
+
+    @staticmethod
+    def content_hash(text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _get_markdown(self):
+        md = getattr(self._local, 'md', None)
+        if md is None:
+            md = self._local.md = markdown.Markdown(extensions=list(self.extensions))
+        return md
+
+    def render(self, text):
+        key = (self.content_hash(text), self.extensions)
+        html = self.cache.get(key, _MISSING)
+        if html is _MISSING:
+            html = self._get_markdown().reset().convert(text)
+            self.cache.set(key, html)
+        return html
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+import threading
+import uuid
+
+from django.core.cache import cache
+
+
+class CategoryNav:
+    """
+    导航栏中的分类列表(包括已发布文章数量)，保存在进程内存中
+
+    缓存中只保存一个版本号，分类或者分类下的文章数量变化时删除版本号(见 blog/signals.py)，
+    各个进程读取时发现版本号变化才重新查询数据库。版本号所在的缓存必须是进程间共享的
+    (settings.CACHES，例如 FileBasedCache)，否则其他进程看不到失效。
+    """
+    generation_key = 'blog:nav:generation'
+
+    def __init__(self, category_model):
+        self.category_model = category_model
+        self._generation = None
+        self._categories = None
+        self._lock = threading.Lock()
+
+    def get_generation(self):
+        generation = cache.get(self.generation_key)
+        if generation is None:
+            cache.add(self.generation_key, uuid.uuid4().hex, None)
+            generation = cache.get(self.generation_key)
+        return generation
+
+    def get_categories(self):
+        # 先读版本号再查询，查询期间发生的修改会在下一次读取时生效
+        generation = self.get_generation()
+        with self._lock:
+            if generation is None or generation != self._generation:
+                self._categories = list(self.category_model.objects.all().order_by('created_time'))
+                self._generation = generation
+            return self._categories
+
+    @classmethod
+    def invalidate(cls):
+        cache.delete(cls.generation_key)
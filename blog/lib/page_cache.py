@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+import hashlib
+import re
+import uuid
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+CSRF_TOKEN_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_PLACEHOLDER = '__page_cache_csrf_token__'
+
+
+class PageCache:
+    """
+    匿名用户的整页缓存
+
+    每个页面缓存时记录它依赖的标签(例如 article:1、tag:3、list)以及这些标签当前的版本号，
+    清除缓存时只需删除标签的版本号，依赖它的页面在下一次读取时就会失效。
+    只用到 get/set/add/get_many/delete_many，本地内存、文件等缓存后端都可以使用。
+
+    页面中的 CSRF token 是每个用户不同的，缓存时替换成占位符，返回页面时再填入当前用户的 token。
+
+    页面依赖哪些标签要在渲染之后才知道(例如详情页的上一篇/下一篇)，所以渲染之前用 snapshot()
+    记下全局的清除版本号，每次清除都会更新它；写入缓存时版本号已经变化，说明渲染期间有过清除，
+    页面可能是旧的内容，不写入缓存。
+    """
+    key_prefix = 'blog:page_cache'
+
+    def __init__(self, timeout=600, cache_alias='default'):
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def page_key(self, request):
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return '%s:page:%s' % (self.key_prefix, path)
+
+    def tag_key(self, tag):
+        return '%s:tag:%s' % (self.key_prefix, tag)
+
+    @property
+    def purge_key(self):
+        return '%s:purge' % self.key_prefix
+
+    def is_cacheable(self, request):
+        if not getattr(settings, 'PAGE_CACHE_ENABLED', True):
+            return False
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return False
+        # 页面上会显示一次性的消息
+        return not len(get_messages(request))
+
+    def get(self, request):
+        """命中时返回 (response, extra)，否则返回 None"""
+        entry = self.cache.get(self.page_key(request))
+        if entry is None:
+            return None
+        versions = self.cache.get_many([self.tag_key(tag) for tag in entry['tags']])
+        for tag, version in entry['tags'].items():
+            if versions.get(self.tag_key(tag)) != version:
+                return None
+
+        content = entry['content']
+        if CSRF_PLACEHOLDER in content:
+            content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+        response = HttpResponse(content, status=entry['status'], content_type=entry['content_type'])
+        return response, entry['extra']
+
+    def snapshot(self):
+        """在视图运行之前调用，返回当前的清除版本号，写入缓存时传给 set()"""
+        version = self.cache.get(self.purge_key)
+        if version is None:
+            # 还没有清除过或者被淘汰了，没有清除的版本号一定是在这之后生成的
+            self.cache.add(self.purge_key, uuid.uuid4().hex, None)
+            version = self.cache.get(self.purge_key)
+        return version
+
+    def set(self, request, response, tags, snapshot, extra=None, content=None):
+        """
+        :param snapshot: 视图运行之前 snapshot() 的返回值
+        :param content: 为 None 时使用 response.content，流式响应需要传入已经输出的内容
+        """
+        if snapshot is None:
+            return
+        tag_keys = {tag: self.tag_key(tag) for tag in tags}
+        versions = self.cache.get_many(tag_keys.values())
+        for tag, key in tag_keys.items():
+            if key not in versions:
+                # 标签第一次使用或者刚被清除，生成新的版本号(其他进程可能同时在生成，以缓存中的为准)
+                self.cache.add(key, uuid.uuid4().hex, None)
+        versions = self.cache.get_many(tag_keys.values())
+        if len(versions) != len(tag_keys):
+            return
+        # 必须在读取标签的版本号之后检查：purge() 先更新清除版本号再删除标签，
+        # 这里没有发现变化的话，读到的标签版本号之后也会被删除，页面不会被当作有效的
+        if self.cache.get(self.purge_key) != snapshot:
+            return
+
+        content = (response.content if content is None else content).decode(response.charset)
+        entry = {
+            'tags': {tag: versions[key] for tag, key in tag_keys.items()},
+            'content': CSRF_TOKEN_RE.sub(r'\g<1>%s\g<2>' % CSRF_PLACEHOLDER, content),
+            'status': response.status_code,
+            'content_type': response['Content-Type'],
+            'extra': extra or {},
+        }
+        self.cache.set(self.page_key(request), entry, self.timeout)
+
+    def purge(self, *tags):
+        """清除依赖这些标签的所有页面"""
+        # 正在渲染的页面写入缓存时会发现版本号变化
+        self.cache.set(self.purge_key, uuid.uuid4().hex, None)
+        self.cache.delete_many([self.tag_key(tag) for tag in tags])
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+import json
+
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+class KnownCountPaginator(Paginator):
+    """总数已经知道(例如 Tag.article_count)时，不再对列表执行 COUNT 查询"""
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            # 覆盖 Paginator.count 这个 cached_property
+            self.count = count
+
+
+class CachedCountPaginator(Paginator):
+    """总数在缓存中保存一段时间(近似值)，翻页时不必每次都 COUNT(*) 整个列表"""
+
+    def __init__(self, object_list, per_page, cache_key, cache_timeout=60, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.cache_timeout = cache_timeout
+
+    @cached_property
+    def count(self):
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = Paginator.count.func(self)
+            cache.set(self.cache_key, count, self.cache_timeout)
+        return count
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Keyset page of %d objects>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.encode_cursor(self.object_list[-1], 'n')
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.encode_cursor(self.object_list[0], 'p')
+
+
+class KeysetPaginator:
+    """
+    按 (created_time, id) 倒序的游标分页(keyset/seek pagination)
+
+    每一页都用 WHERE (created_time, id) < (上一页最后一条) 直接定位，不需要 COUNT(*)，
+    也不需要 OFFSET，翻到多深的页面耗时都一样。游标对外是不透明的字符串。
+    """
+
+    def __init__(self, queryset, per_page, time_field='created_time'):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.time_field = time_field
+
+    def encode_cursor(self, obj, direction):
+        value = [direction, getattr(obj, self.time_field).isoformat(), obj.pk]
+        return urlsafe_base64_encode(json.dumps(value).encode())
+
+    def decode_cursor(self, cursor):
+        try:
+            direction, time_value, pk = json.loads(urlsafe_base64_decode(cursor).decode())
+            time_value = parse_datetime(time_value)
+            if direction not in ('n', 'p') or time_value is None:
+                raise ValueError
+            return direction, time_value, int(pk)
+        except (TypeError, ValueError):
+            raise InvalidCursor('无效的分页游标')
+
+    def page(self, cursor=None):
+        time_field = self.time_field
+        if cursor is None:
+            direction = 'n'
+            queryset = self.queryset
+        else:
+            direction, time_value, pk = self.decode_cursor(cursor)
+            if direction == 'n':
+                queryset = self.queryset.filter(
+                    Q(**{time_field + '__lt': time_value}) | Q(**{time_field: time_value, 'pk__lt': pk}))
+            else:
+                queryset = self.queryset.filter(
+                    Q(**{time_field + '__gt': time_value}) | Q(**{time_field: time_value, 'pk__gt': pk}))
+
+        if direction == 'n':
+            queryset = queryset.order_by('-' + time_field, '-pk')
+        else:
+            queryset = queryset.order_by(time_field, 'pk')
+        # 多取一条用来判断是否还有下一页
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+
+        if direction == 'n':
+            return KeysetPage(object_list, self, has_next=has_more, has_previous=cursor is not None)
+        object_list.reverse()
+        return KeysetPage(object_list, self, has_next=True, has_previous=has_more)
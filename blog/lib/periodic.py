@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+import logging
+import os
+import threading
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker:
+    """
+    在后台守护线程中每隔 interval 秒执行一次 func
+
+    只有调用过 PeriodicWorker.enable() 的进程(即 Web 服务进程，见 djangoloo/wsgi.py)
+    才会真正启动线程，测试和管理命令中不会有后台线程访问数据库。
+    线程在第一次 ensure_started() 时才启动，所以 fork 出来的子进程会各自启动自己的线程。
+    """
+    enabled = False
+
+    def __init__(self, func, interval, name=None):
+        self.func = func
+        self.interval = interval
+        self.name = name
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @classmethod
+    def enable(cls):
+        cls.enabled = True
+
+    def ensure_started(self):
+        if not (self.enabled and self.interval) or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.func()
+            except Exception:
+                logger.exception('%s failed', self.name or self.func)
+            finally:
+                # 关闭的只是当前线程自己的数据库连接
+                connections.close_all()
@@ -2,35 +2,58 @@
 # -*- coding: utf-8 -*-
 # Author: LooEv
 
+from django.core.cache import cache
+
+
+def get_font_sizes(tag_counts, max_font_size=8, min_font_size=1):
+    """
+    根据每个标签下的文章数量计算标签云中的字体大小
+
+    :param tag_counts: {标签名: 文章数量}
+    :return: {标签名: 字体大小}
+    """
+    tag_font_size_dict = {}
+    if not tag_counts:
+        return tag_font_size_dict
+    max_tag_count = max(tag_counts.values())
+    min_tag_count = min(tag_counts.values())
+    if max_tag_count == min_tag_count:
+        for tag_name in tag_counts.keys():
+            tag_font_size_dict[tag_name] = 4
+    else:
+        if len(set(tag_counts.values())) == 2:
+            max_font_size, min_font_size = 5, 3
+        step = (max_font_size - min_font_size) * 1.0 / (max_tag_count - min_tag_count)
+        for tag_name, count in tag_counts.items():
+            font_size = min_font_size + (count - min_tag_count) * step
+            if 0.5 < (font_size - min_font_size) < 1.0:
+                font_size = min_font_size + 1
+            elif 0.5 < (max_font_size - font_size) < 1.0:
+                font_size = max_font_size
+            tag_font_size_dict[tag_name] = int(font_size)
+    return tag_font_size_dict
+
 
 class TagCloud:
+    # 缓存的是每个标签下已发布文章的数量，文章的标签或者状态变化时失效(见 blog/signals.py)
+    cache_key = 'blog:tag_cloud:counts'
+    cache_timeout = 60 * 60 * 24
+
     def __init__(self, tag_model):
-        self.get_tags = tag_model.objects.all
-        self.max_tag_count = self.min_tag_count = 0
+        self.tag_model = tag_model
+
+    def get_tag_counts(self):
+        tag_counts = cache.get(self.cache_key)
+        if tag_counts is None:
+            # article_count 是冗余存储的已发布文章数量，不需要再关联文章表统计
+            tag_counts = dict(self.tag_model.objects.filter(article_count__gt=0).
+                              values_list('name', 'article_count'))
+            cache.set(self.cache_key, tag_counts, self.cache_timeout)
+        return tag_counts
 
     def get_tag_cloud(self, max_font_size=8, min_font_size=1):
-        tag_font_size_dict = {}
-        tags = self.get_tags()
-        if not tags:
-            return tag_font_size_dict
-        tag_dict = {}
-        for tag in tags:
-            tag_dict[tag.name] = tag.article_set.count()
-        count_list = sorted(tag_dict.values())
-        max_tag_count = count_list[-1]
-        min_tag_count = count_list[0]
-        if max_tag_count == min_tag_count:
-            for tag_name in tag_dict.keys():
-                tag_font_size_dict[tag_name] = 4
-        else:
-            if len(set(count_list)) == 2:
-                max_font_size, min_font_size = 5, 3
-            step = (max_font_size - min_font_size) * 1.0 / (max_tag_count - min_tag_count)
-            for tag_name, count in tag_dict.items():
-                font_size = min_font_size + (count - min_tag_count) * step
-                if 0.5 < (font_size - min_font_size) < 1.0:
-                    font_size = min_font_size + 1
-                elif 0.5 < (max_font_size - font_size) < 1.0:
-                    font_size = max_font_size
-                tag_font_size_dict[tag_name] = int(font_size)
-        return tag_font_size_dict
+        return get_font_sizes(self.get_tag_counts(), max_font_size, min_font_size)
+
+    @classmethod
+    def invalidate(cls):
+        cache.delete(cls.cache_key)
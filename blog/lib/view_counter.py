@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.db import DatabaseError, transaction
+from django.db.models import F
+
+from .periodic import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """
+    浏览量缓冲计数器
+
+    每次访问只在内存中累加，达到阈值或者到了刷新周期时，才把累积的增量用
+    ``F(field) + n`` 批量写回数据库，避免每次访问都整行 UPDATE 抢占写锁。
+    进程退出时会把剩余的计数全部写回。
+    """
+
+    def __init__(self, model, field='views', flush_threshold=100, flush_interval=10):
+        self.model = model
+        self.field = field
+        self.flush_threshold = flush_threshold
+        self.flush_interval = flush_interval
+        self._pending = Counter()
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker = PeriodicWorker(self.flush, flush_interval, name='view-counter-flusher')
+        atexit.register(self.flush)
+
+    def incr(self, pk, n=1):
+        """累加一次访问，返回该对象尚未写回数据库的增量"""
+        with self._lock:
+            self._pending[pk] += n
+            self._pending_total += n
+            pending = self._pending[pk]
+            need_flush = self._pending_total >= self.flush_threshold
+        self._worker.ensure_started()
+        if need_flush:
+            self.flush()
+        return pending
+
+    def pending(self, pk):
+        with self._lock:
+            return self._pending.get(pk, 0)
+
+    def clear(self):
+        """丢弃所有尚未写回的计数"""
+        with self._lock:
+            self._pending = Counter()
+            self._pending_total = 0
+
+    def flush(self):
+        """把缓冲的计数写回数据库，返回写回的访问次数"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                self._pending_total = 0
+            if not pending:
+                return 0
+
+            # 增量相同的对象合并成一条 UPDATE
+            pks_by_count = defaultdict(list)
+            for pk, n in pending.items():
+                pks_by_count[n].append(pk)
+            try:
+                with transaction.atomic(using=self.model.objects.db):
+                    for n, pks in pks_by_count.items():
+                        self.model._base_manager.filter(pk__in=pks). \
+                            update(**{self.field: F(self.field) + n})
+            except DatabaseError:
+                logger.warning('Failed to flush %s, will retry later', self.field, exc_info=True)
+                with self._lock:
+                    self._pending.update(pending)
+                    self._pending_total += sum(pending.values())
+                return 0
+            return sum(pending.values())
+
+    def stop(self):
+        self._worker.stop()
+        self.flush()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+from django.core.management.base import BaseCommand
+
+from blog.models import Article
+
+
+class Command(BaseCommand):
+    help = '为已有的文章生成摘要(excerpt_html 和 excerpt_text)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='all',
+                            help='重新生成所有文章的摘要，默认只处理还没有摘要的文章')
+        parser.add_argument('--batch-size', type=int, default=500, dest='batch_size',
+                            help='每批处理的文章数量')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Article.objects.order_by('pk').only('pk', 'content_html')
+        if not options['all']:
+            queryset = queryset.filter(excerpt_html='')
+
+        total = 0
+        last_pk = 0
+        while True:
+            # 按主键分批，避免一次性把所有文章内容加载到内存
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            for article in batch:
+                article.refresh_excerpt()
+            Article.objects.bulk_update(batch, ['excerpt_html', 'excerpt_text'])
+            total += len(batch)
+            last_pk = batch[-1].pk
+            if options['verbosity'] >= 2:
+                self.stdout.write('已处理 %d 篇文章' % total)
+
+        self.stdout.write(self.style.SUCCESS('共生成 %d 篇文章的摘要' % total))
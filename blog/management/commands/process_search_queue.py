@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog.search_queue import drain_queue
+
+
+class Command(BaseCommand):
+    help = '把索引队列(IndexQueue)中等待处理的更新/删除全部写入搜索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, dest='batch_size',
+                            default=getattr(settings, 'HAYSTACK_QUEUE_BATCH_SIZE', 500),
+                            help='每批合并处理的队列记录数量')
+
+    def handle(self, *args, **options):
+        total = drain_queue(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('共处理 %d 条索引队列记录' % total))
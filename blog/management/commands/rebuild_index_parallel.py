@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from haystack import connections
+
+from blog.search_rebuild import rebuild_index
+
+
+class Command(BaseCommand):
+    help = '用多个进程重建 whoosh 搜索索引(代替 rebuild_index)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, dest='workers',
+                            help='进程数，默认为 CPU 核心数')
+        parser.add_argument('--batch-size', type=int, default=1000, dest='batch_size',
+                            help='每个段(segment)中的文档数量')
+        parser.add_argument('--using', default='default', dest='using',
+                            help='haystack 连接的名称')
+
+    def handle(self, *args, **options):
+        backend = connections[options['using']].get_backend()
+        if not hasattr(backend, 'rebuild_segments'):
+            raise CommandError('%s 不支持并行重建索引，请使用 rebuild_index' % backend.__class__.__name__)
+
+        def progress(done, total):
+            if options['verbosity'] >= 1:
+                self.stdout.write('已索引 %d/%d' % (done, total))
+
+        total = rebuild_index(options['using'], options['workers'], options['batch_size'], progress)
+        self.stdout.write(self.style.SUCCESS('共索引 %d 个文档' % total))
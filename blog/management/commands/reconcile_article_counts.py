@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+
+from blog.lib.tag_cloud import TagCloud
+from blog.models import Category, Tag
+
+
+class Command(BaseCommand):
+    help = '重新统计每个标签、分类下已发布文章的数量，修正 article_count 字段的偏差'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                            help='只显示有偏差的记录，不修改数据库')
+
+    def handle(self, *args, **options):
+        fixed = 0
+        for model in (Tag, Category):
+            counts = model.objects.annotate(
+                published=Count('article', filter=Q(article__status='p'))). \
+                values_list('pk', 'name', 'article_count', 'published')
+            with transaction.atomic():
+                for pk, name, article_count, published in counts:
+                    if article_count == published:
+                        continue
+                    fixed += 1
+                    self.stdout.write('%s %s: %d -> %d' % (
+                        model._meta.verbose_name, name, article_count, published))
+                    if not options['dry_run']:
+                        model.objects.filter(pk=pk).update(article_count=published)
+
+        if fixed and not options['dry_run']:
+            TagCloud.invalidate()
+        self.stdout.write(self.style.SUCCESS('共有 %d 条记录存在偏差' % fixed))
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+from django.core.management.base import BaseCommand
+
+from blog.search_sync import get_watermark, sync_index
+
+
+class Command(BaseCommand):
+    help = '增量同步搜索索引：重新索引上次同步之后更新过的文章，删除索引中已经不存在或者未发布的文章'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, dest='batch_size',
+                            help='每批处理的对象数量')
+        parser.add_argument('--overlap', type=int, default=60, dest='overlap',
+                            help='从水位之前多少秒开始同步')
+        parser.add_argument('--full', action='store_true', dest='full',
+                            help='忽略水位，重新索引所有对象')
+        parser.add_argument('--using', default='default', dest='using',
+                            help='haystack 连接的名称')
+
+    def handle(self, *args, **options):
+        if options['verbosity'] >= 2:
+            self.stdout.write('水位：%s' % (get_watermark(options['using']) or '无'))
+
+        updated, removed = sync_index(options['using'], options['batch_size'], options['overlap'], options['full'])
+        self.stdout.write(self.style.SUCCESS('更新 %d 个、删除 %d 个索引文档' % (updated, removed)))
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='excerpt_html',
+            field=models.TextField(blank=True, default='', verbose_name='摘要(Html格式)'),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='excerpt_text',
+            field=models.TextField(blank=True, default='', verbose_name='摘要(纯文本)'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:44
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_article_excerpt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexQueue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('using', models.CharField(default='default', max_length=50, verbose_name='搜索连接')),
+                ('identifier', models.CharField(max_length=255, verbose_name='索引标识')),
+                ('action', models.CharField(choices=[('u', '更新'), ('r', '删除')], max_length=1, verbose_name='操作')),
+                ('queued_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='入队时间')),
+            ],
+            options={
+                'verbose_name': '索引队列',
+                'verbose_name_plural': '索引队列',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:48
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_published_articles(apps, schema_editor):
+    for model_name in ('Tag', 'Category'):
+        model = apps.get_model('blog', model_name)
+        counts = model.objects.annotate(
+            published=Count('article', filter=Q(article__status='p'))).values_list('pk', 'published')
+        for pk, published in counts:
+            if published:
+                model.objects.filter(pk=pk).update(article_count=published)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_index_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='article_count',
+            field=models.IntegerField(default=0, verbose_name='已发布文章数'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='article_count',
+            field=models.IntegerField(default=0, verbose_name='已发布文章数'),
+        ),
+        migrations.RunPython(count_published_articles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_article_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['status', '-created_time', '-id'], name='article_status_created_idx'),
+        ),
+    ]
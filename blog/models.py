@@ -4,22 +4,70 @@
 
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import ExtractMonth, ExtractYear
 from django.utils import timezone
 from django.urls import reverse
 
+from .lib.excerpt import make_excerpt
 
-class ArchivesManager(models.Manager):
+
+class ChangeTrackingMixin:
+    """记下从数据库加载(或者上一次保存)时的字段值，保存时可以据此判断哪些字段发生了变化"""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        deferred_fields = self.get_deferred_fields()
+        self._loaded_values = {field.attname: getattr(self, field.attname)
+                               for field in self._meta.concrete_fields
+                               if field.attname not in deferred_fields}
+
+    def get_loaded_value(self, attname, default=None):
+        """字段在加载(或上一次保存)时的值，新建的对象返回 default"""
+        return getattr(self, '_loaded_values', {}).get(attname, default)
+
+    def get_changed_fields(self):
+        """与加载(或上一次保存)时相比发生了变化的字段(attname)集合，新建的对象返回 None"""
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            return None
+        return {attname for attname, value in loaded_values.items()
+                if getattr(self, attname) != value}
+
+
+class ArticleQuerySet(models.QuerySet):
+    def with_relations(self):
+        """一次性加载作者、分类和标签，避免列表页逐篇查询"""
+        return self.select_related('author', 'category').prefetch_related('tags')
+
+    def touch(self):
+        """标签、作者等关联对象变化时更新文章的 updated_time，增量同步索引和片段缓存都依赖它"""
+        return self.update(updated_time=timezone.now())
+
+    def month_counts(self):
+        """按 (年, 月) 聚合文章数量，一次查询完成，年月按当前时区计算"""
+        return self.annotate(year=ExtractYear('created_time'), month=ExtractMonth('created_time')). \
+            values_list('year', 'month').annotate(count=models.Count('id')).order_by('-year', '-month')
+
+
+class ArchivesManager(models.Manager.from_queryset(ArticleQuerySet)):
     def archives(self):
-        date_list = self.get_queryset().dates('created_time', 'year', order='DESC')
+        # 只统计已发布文章所在的年份
+        date_list = self.get_queryset().filter(status='p').dates('created_time', 'year', order='DESC')
         return [int(date.year) for date in date_list]
 
 
-class PostedArticleManager(models.Manager):
+class PostedArticleManager(models.Manager.from_queryset(ArticleQuerySet)):
     def get_queryset(self):
         return super(PostedArticleManager, self).get_queryset().filter(status='p')
 
 
-class Author(AbstractUser):
+class Author(ChangeTrackingMixin, AbstractUser):
     avatar = models.ImageField('头像', upload_to=r'user/avatar/', blank=True,
                                default=r'user/avatar/guest_a2b2c4z.png')
     bio = models.TextField('个人简介', max_length=1000, blank=True)
@@ -32,11 +80,16 @@ class Author(AbstractUser):
         return self.username
 
 
-class Article(models.Model):
+class Article(ChangeTrackingMixin, models.Model):
     STATUS_CHOICES = (
         ('d', '草稿'),
         ('p', '发布'),
     )
+    # 列表页用不到的大字段，查询时可以 defer 掉
+    CONTENT_FIELDS = ('content_md', 'content_html')
+    # 修改这些字段时自动更新 updated_time
+    TRACKED_FIELDS = ('article_title', 'content_md', 'content_html', 'author_id', 'category_id',
+                      'created_time', 'status')
 
     article_link = models.CharField('链接', max_length=12)
     article_title = models.CharField('文章标题', max_length=100)
@@ -46,6 +99,8 @@ class Article(models.Model):
                                  verbose_name='所属分类')
     content_md = models.TextField('文章内容(md格式)')
     content_html = models.TextField('文章内容(Html格式)', null=True)
+    excerpt_html = models.TextField('摘要(Html格式)', blank=True, default='')
+    excerpt_text = models.TextField('摘要(纯文本)', blank=True, default='')
     views = models.IntegerField('浏览量')
     created_time = models.DateTimeField('创建时间', default=timezone.now)
     updated_time = models.DateTimeField('更新时间', default=timezone.now)
@@ -57,12 +112,49 @@ class Article(models.Model):
 
     class Meta:
         ordering = ['-created_time', ]
+        # 列表页按 (status, created_time, id) 定位游标，见 blog/lib/paginator.py
+        indexes = [models.Index(fields=['status', '-created_time', '-id'], name='article_status_created_idx')]
         verbose_name = '文章'
         verbose_name_plural = '文章'
 
     def __str__(self):
         return self.article_title
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        extra_fields = set()
+        # 没有经过 ArticlePostForm 保存的文章(例如在后台或者脚本中创建、修改的)，在这里生成摘要
+        if self.excerpt_is_stale():
+            self.refresh_excerpt()
+            extra_fields |= {'excerpt_html', 'excerpt_text'}
+        if self.is_modified(update_fields):
+            self.updated_time = timezone.now()
+            extra_fields.add('updated_time')
+        if update_fields is not None and extra_fields:
+            kwargs['update_fields'] = set(update_fields) | extra_fields
+        super().save(*args, **kwargs)
+
+    def is_modified(self, update_fields=None):
+        """本次保存修改了 TRACKED_FIELDS 中的字段，并且没有同时设置 updated_time"""
+        changed_fields = self.get_changed_fields()
+        if not changed_fields or 'updated_time' in changed_fields:
+            return False
+        if update_fields is not None:
+            changed_fields &= {self._meta.get_field(name).attname for name in update_fields}
+        return bool(changed_fields & set(self.TRACKED_FIELDS))
+
+    def excerpt_is_stale(self):
+        """新建的文章没有摘要，或者修改了 content_html 但是没有同时修改摘要"""
+        if 'content_html' in self.get_deferred_fields():
+            return False
+        changed_fields = self.get_changed_fields()
+        if changed_fields is None:
+            return not self.excerpt_html
+        return 'content_html' in changed_fields and 'excerpt_html' not in changed_fields
+
+    def refresh_excerpt(self):
+        self.excerpt_html, self.excerpt_text = make_excerpt(self.content_html)
+
     def get_absolute_url(self):
         return reverse('blog:article_detail', kwargs={
             'author': self.author.username, 'article_link': self.article_link})
@@ -72,6 +164,7 @@ class Article(models.Model):
             'author': self.author.username, 'article_link': self.article_link})
 
     def tags_split(self):
+        # tags.all() 会直接使用 prefetch_related('tags') 的结果，不会再查询数据库
         return [tag.name for tag in self.tags.all()]
 
     def join_tags(self, join_with=','):
@@ -82,9 +175,11 @@ class Article(models.Model):
                        kwargs={'username': self.author.username})
 
 
-class Tag(models.Model):
+class Tag(ChangeTrackingMixin, models.Model):
     name = models.CharField('名称', max_length=30, db_index=True, unique=True)
     created_time = models.DateTimeField('创建时间', default=timezone.now)
+    # 已发布文章的数量，由 blog/signals.py 维护，reconcile_article_counts 命令可以修正偏差
+    article_count = models.IntegerField('已发布文章数', default=0)
 
     class Meta:
         ordering = ['name', ]
@@ -98,9 +193,11 @@ class Tag(models.Model):
         return self.name
 
 
-class Category(models.Model):
+class Category(ChangeTrackingMixin, models.Model):
     name = models.CharField('名称', max_length=30, db_index=True, unique=True)
     created_time = models.DateTimeField('创建时间', default=timezone.now)
+    # 同 Tag.article_count
+    article_count = models.IntegerField('已发布文章数', default=0)
 
     class Meta:
         ordering = ['name', ]
@@ -109,3 +206,24 @@ class Category(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class IndexQueue(models.Model):
+    """等待写入搜索索引的更新/删除操作，由 blog.search_queue 批量处理"""
+    ACTION_CHOICES = (
+        ('u', '更新'),
+        ('r', '删除'),
+    )
+
+    using = models.CharField('搜索连接', max_length=50, default='default')
+    identifier = models.CharField('索引标识', max_length=255)  # 例如 blog.article.1
+    action = models.CharField('操作', max_length=1, choices=ACTION_CHOICES)
+    queued_time = models.DateTimeField('入队时间', default=timezone.now)
+
+    class Meta:
+        ordering = ['id', ]
+        verbose_name = '索引队列'
+        verbose_name_plural = '索引队列'
+
+    def __str__(self):
+        return '%s %s' % (self.get_action_display(), self.identifier)
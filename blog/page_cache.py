@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+"""
+匿名用户整页缓存的依赖标签
+
+    site            所有页面(导航栏中的分类)
+    list            首页、标签云、归档等汇总了所有文章的页面
+    article:<id>    文章详情页，以及上一篇/下一篇链接指向它的文章详情页
+    author:<id>     作者的文章详情页
+    tag:<id>        标签下的文章列表
+    category:<id>   分类下的文章列表
+"""
+
+from django.conf import settings
+from django.db import transaction
+
+from .lib.page_cache import PageCache
+from .models import Article
+
+page_cache = PageCache(timeout=getattr(settings, 'PAGE_CACHE_TIMEOUT', 600))
+
+
+def article_neighbour_ids(article):
+    """已发布文章中 id 紧挨着这篇文章的两篇，它们的上一篇/下一篇链接可能指向这篇文章"""
+    ids = []
+    for lookup, order in (('pk__gt', 'pk'), ('pk__lt', '-pk')):
+        pk = Article.posted.filter(**{lookup: article.pk}).order_by(order). \
+            values_list('pk', flat=True).first()
+        if pk is not None:
+            ids.append(pk)
+    return ids
+
+
+def article_page_tags(article, tag_ids=(), category_ids=(), status_changed=False):
+    """
+    文章发布、修改或者删除后受影响的页面的标签
+
+    :param tag_ids: 修改前后文章的所有标签
+    :param category_ids: 修改前后文章的分类
+    :param status_changed: 文章发布、撤回或者删除时，相邻文章的上一篇/下一篇链接也会变化
+    """
+    tags = ['list', 'article:%s' % article.pk, 'author:%s' % article.author_id]
+    if status_changed:
+        tags += ['article:%s' % pk for pk in article_neighbour_ids(article)]
+    tags += ['tag:%s' % pk for pk in set(tag_ids)]
+    tags += ['category:%s' % pk for pk in set(category_ids) if pk is not None]
+    return tags
+
+
+def purge_pages(*tags):
+    """
+    事务提交之后再清除页面：提交之前清除的话，并发的请求读到的还是旧数据，
+    渲染出的旧页面会带着新的清除版本号写入缓存
+    """
+    transaction.on_commit(lambda: page_cache.purge(*tags))
+
+
+def purge_article_pages(article, tag_ids=(), category_ids=(), status_changed=False):
+    purge_pages(*article_page_tags(article, tag_ids, category_ids, status_changed))
+
+
+def purge_author_pages(author):
+    purge_pages('author:%s' % author.pk)
+
+
+def purge_all_pages():
+    purge_pages('site')
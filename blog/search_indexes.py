@@ -6,10 +6,62 @@ from haystack import indexes
 
 
 class ArticleIndex(indexes.SearchIndex, indexes.Indexable):
-    text = indexes.CharField(document=True, use_template=True)
+    # 文档内容在 prepare_text 中直接拼接，不经过模板渲染
+    text = indexes.CharField(document=True)
+    tags = indexes.MultiValueField()
+    author = indexes.CharField()
+    category = indexes.CharField()
+    created_time = indexes.DateTimeField(model_attr='created_time')
+
+    # 索引内容用到的字段，只有这些字段(或者文章状态)发生变化时才需要重新索引
+    indexed_fields = ('article_title', 'content_md', 'author_id', 'category_id', 'created_time', 'tags')
+    # 文档中用到的关联对象的字段，例如标签改名之后需要重新索引这个标签下的文章
+    related_fields = {'tags': 'name', 'category': 'name', 'author': 'username'}
 
     def get_model(self):
         return Article
 
+    def get_updated_field(self):
+        # sync_search_index 命令只重新索引这个时间晚于水位的文章
+        return 'updated_time'
+
     def index_queryset(self, using=None):
-        return self.get_model().objects.filter(status='p')
+        # 作者、分类和标签一次性加载，不再每篇文章查询一次
+        return self.get_model().posted.with_relations()
+
+    def prepare_text(self, obj):
+        return '\n'.join((obj.article_title, ' '.join(self.prepare_tags(obj)), obj.content_md,
+                          obj.author.username))
+
+    def prepare_tags(self, obj):
+        # 使用 prefetch_related 加载的标签
+        return [tag.name for tag in obj.tags.all()]
+
+    def prepare_author(self, obj):
+        return obj.author.username
+
+    def prepare_category(self, obj):
+        return obj.category.name if obj.category_id else ''
+
+    def should_update(self, instance, update_fields=None, related_field=None, **kwargs):
+        """草稿不进入索引；保存时没有改动被索引的字段也不需要重新写索引"""
+        if instance.status != 'p':
+            return False
+        if related_field is not None:
+            return related_field in self.indexed_fields
+
+        watched_fields = set(self.indexed_fields) | {'status'}
+        if update_fields is not None:
+            opts = instance._meta
+            update_fields = {opts.get_field(name).attname for name in update_fields}
+            if not update_fields & watched_fields:
+                return False
+
+        changed_fields = instance.get_changed_fields()
+        return changed_fields is None or bool(changed_fields & watched_fields)
+
+    def should_remove(self, instance, created=False, **kwargs):
+        """已发布的文章转成草稿后需要从索引中删除"""
+        if created or instance.status == 'p':
+            return False
+        return instance.get_loaded_value('status') != 'd'
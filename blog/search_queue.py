@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+"""
+队列化的搜索索引更新
+
+保存/删除文章时只往 IndexQueue 表里插入一条记录，由后台线程(或者
+process_search_queue 管理命令)定期把队列中的记录合并后批量写入索引：
+同一个对象的多次更新/删除只保留最后一次，每批只打开一个 writer、只提交一次。
+"""
+
+from collections import OrderedDict, defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models
+
+from haystack import connections
+from haystack.exceptions import NotHandled
+from haystack.signals import BaseSignalProcessor
+from haystack.utils import get_identifier, get_model_ct
+
+from .lib.periodic import PeriodicWorker
+from .models import IndexQueue
+
+
+def process_queue(batch_size=500):
+    """处理一批队列中的记录，返回处理的记录条数"""
+    items = list(IndexQueue.objects.order_by('pk')[:batch_size])
+    if not items:
+        return 0
+
+    # 按 (连接, 模型) 分组，同一个对象只保留最后一次操作
+    latest = defaultdict(OrderedDict)
+    for item in items:
+        app_label, model_name, pk = item.identifier.split('.', 2)
+        latest[(item.using, app_label, model_name)][pk] = item.action
+
+    for (using, app_label, model_name), actions in latest.items():
+        model = apps.get_model(app_label, model_name)
+        backend = connections[using].get_backend()
+        try:
+            index = connections[using].get_unified_index().get_index(model)
+        except NotHandled:
+            continue
+
+        update_pks = [pk for pk, action in actions.items() if action == 'u']
+        # 不在 index_queryset 范围内的对象(例如已被删除或者转成草稿)需要从索引中移除
+        objects = list(index.index_queryset(using=using).filter(pk__in=update_pks))
+        found_pks = {str(obj.pk) for obj in objects}
+        remove_identifiers = ['%s.%s.%s' % (app_label, model_name, pk)
+                              for pk, action in actions.items()
+                              if action == 'r' or pk not in found_pks]
+
+        if hasattr(backend, 'apply_batch'):
+            backend.apply_batch(index, objects, remove_identifiers)
+        else:
+            if objects:
+                backend.update(index, objects)
+            for identifier in remove_identifiers:
+                backend.remove(identifier)
+
+    IndexQueue.objects.filter(pk__lte=items[-1].pk).delete()
+    return len(items)
+
+
+def drain_queue(batch_size=500):
+    """处理队列直到队列为空，返回处理的记录条数"""
+    total = 0
+    while True:
+        processed = process_queue(batch_size)
+        if not processed:
+            return total
+        total += processed
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """
+    只监听建立了索引的模型，保存/删除时把操作放入 IndexQueue，
+    由后台线程每隔 HAYSTACK_QUEUE_FLUSH_INTERVAL 秒批量写入索引。
+    """
+
+    def setup(self):
+        self.batch_size = getattr(settings, 'HAYSTACK_QUEUE_BATCH_SIZE', 500)
+        self.worker = PeriodicWorker(self.drain, getattr(settings, 'HAYSTACK_QUEUE_FLUSH_INTERVAL', 10),
+                                     name='search-queue-worker')
+        # 多对多关系的中间表 -> (模型, 字段名)，例如文章的标签
+        self.m2m_fields = {}
+        # 关联的模型 -> [(模型, 关系字段名, 文档中用到的关联模型字段名)]，例如标签的名称
+        self.related_fields = defaultdict(list)
+        for model in self.get_indexed_models():
+            models.signals.post_save.connect(self.handle_save, sender=model)
+            models.signals.post_delete.connect(self.handle_delete, sender=model)
+            for field in model._meta.many_to_many:
+                through = field.remote_field.through
+                self.m2m_fields[through] = (model, field.name)
+                models.signals.m2m_changed.connect(self.handle_m2m_changed, sender=through)
+            for index in self.get_model_indexes(model):
+                for field_name, related_field in getattr(index, 'related_fields', {}).items():
+                    related_model = model._meta.get_field(field_name).related_model
+                    self.related_fields[related_model].append((model, field_name, related_field))
+        for related_model in self.related_fields:
+            models.signals.post_save.connect(self.handle_related_save, sender=related_model)
+
+    def teardown(self):
+        for model in self.get_indexed_models():
+            models.signals.post_save.disconnect(self.handle_save, sender=model)
+            models.signals.post_delete.disconnect(self.handle_delete, sender=model)
+        for through in self.m2m_fields:
+            models.signals.m2m_changed.disconnect(self.handle_m2m_changed, sender=through)
+        for related_model in self.related_fields:
+            models.signals.post_save.disconnect(self.handle_related_save, sender=related_model)
+
+    def drain(self):
+        return drain_queue(self.batch_size)
+
+    def get_indexed_models(self):
+        indexed_models = set()
+        for using in self.connections.connections_info:
+            indexed_models.update(self.connections[using].get_unified_index().get_indexed_models())
+        return indexed_models
+
+    def get_model_indexes(self, model):
+        for using in self.connections.connections_info:
+            try:
+                yield self.connections[using].get_unified_index().get_index(model)
+            except NotHandled:
+                continue
+
+    def get_indexes(self, sender, instance):
+        for using in self.connection_router.for_write(instance=instance):
+            try:
+                yield using, self.connections[using].get_unified_index().get_index(sender)
+            except NotHandled:
+                continue
+
+    def enqueue(self, using, instance, action):
+        IndexQueue.objects.create(using=using, identifier=get_identifier(instance), action=action)
+        self.worker.ensure_started()
+
+    def enqueue_many(self, using, identifiers, action):
+        items = [IndexQueue(using=using, identifier=identifier, action=action) for identifier in identifiers]
+        if items:
+            IndexQueue.objects.bulk_create(items)
+            self.worker.ensure_started()
+
+    def handle_save(self, sender, instance, **kwargs):
+        for using, index in self.get_indexes(sender, instance):
+            # 索引可以通过 should_remove/should_update 跳过不影响索引内容的保存
+            should_remove = getattr(index, 'should_remove', None)
+            if should_remove is not None and should_remove(instance, **kwargs):
+                self.enqueue(using, instance, 'r')
+            elif index.should_update(instance, **kwargs):
+                self.enqueue(using, instance, 'u')
+
+    def handle_delete(self, sender, instance, **kwargs):
+        for using, index in self.get_indexes(sender, instance):
+            self.enqueue(using, instance, 'r')
+
+    def handle_m2m_changed(self, sender, instance, action, reverse, model, pk_set, **kwargs):
+        indexed_model, field_name = self.m2m_fields[sender]
+        if action == 'pre_clear' and reverse:
+            # post_clear 时 pk_set 为 None，需要在清除之前记下关联的对象，例如 tag.article_set.clear()
+            instance._search_queue_cleared_pks = list(
+                indexed_model._default_manager.filter(**{field_name: instance}).values_list('pk', flat=True))
+            return
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+        if reverse:
+            if action == 'post_clear':
+                pk_set = instance.__dict__.pop('_search_queue_cleared_pks', None)
+            # 例如 tag.article_set.add(article)，pk_set 中是文章的主键
+            instances = indexed_model._default_manager.filter(pk__in=pk_set) if pk_set else []
+        else:
+            instances = [instance]
+        for obj in instances:
+            for using, index in self.get_indexes(indexed_model, obj):
+                if index.should_update(obj, related_field=field_name):
+                    self.enqueue(using, obj, 'u')
+
+    def handle_related_save(self, sender, instance, created, **kwargs):
+        """关联的对象改名(例如标签改名)之后，重新索引引用它的、在 index_queryset 中的对象"""
+        if created:
+            return
+        changed_fields = instance.get_changed_fields() if hasattr(instance, 'get_changed_fields') else None
+        for model, field_name, related_field in self.related_fields[sender]:
+            attname = sender._meta.get_field(related_field).attname
+            if changed_fields is not None and attname not in changed_fields:
+                continue
+            for using, index in self.get_indexes(model, instance):
+                pks = index.index_queryset(using=using).filter(**{field_name: instance}).values_list('pk', flat=True)
+                self.enqueue_many(using, ['%s.%s' % (get_model_ct(model), pk) for pk in pks], 'u')
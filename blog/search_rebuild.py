@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+"""
+并行重建 whoosh 索引
+
+重建索引的耗时主要在 jieba 分词上，而 update 只能用一个 CPU 核心。这里把每个模型的
+index_queryset 按主键切分成若干段，由进程池中的进程各自把一段写成索引中的一个新段(segment)，
+全部完成之后一次提交，只保留这些新段。提交之前搜索仍然使用原来的索引。
+"""
+
+import multiprocessing
+
+from django.apps import apps
+from django.db import connections as db_connections
+
+from haystack import connections
+
+
+def split_pks(queryset, batch_size):
+    """按主键把 queryset 切分成 [(起始主键, 结束主键, 数量)]"""
+    pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+    return [(pks[i], pks[min(i + batch_size, len(pks)) - 1], len(pks[i:i + batch_size]))
+            for i in range(0, len(pks), batch_size)]
+
+
+def build_segment(task):
+    """在子进程中执行：把一段文档写成一个新段，返回 (文档数量, 段)"""
+    using, model_label, first_pk, last_pk, count = task
+    backend = connections[using].get_backend()
+    index = connections[using].get_unified_index().get_index(apps.get_model(model_label))
+    queryset = index.index_queryset(using=using).filter(pk__gte=first_pk, pk__lte=last_pk).order_by('pk')
+    return count, backend.write_segment(index, queryset.iterator())
+
+
+def rebuild_index(using='default', workers=None, batch_size=1000, progress=None):
+    """
+    并行重建索引，返回处理的对象数量
+
+    :param workers: 进程数，默认为 CPU 核心数；为 1 时在当前进程中完成
+    :param progress: progress(已处理的对象数量, 总数)，每完成一段调用一次
+    """
+    backend = connections[using].get_backend()
+    unified_index = connections[using].get_unified_index()
+    workers = workers or multiprocessing.cpu_count()
+
+    tasks = []
+    for model in unified_index.get_indexed_models():
+        queryset = unified_index.get_index(model).index_queryset(using=using)
+        tasks += [(using, model._meta.label) + part for part in split_pks(queryset, batch_size)]
+    total = sum(task[-1] for task in tasks)
+
+    done = 0
+    with backend.rebuild_segments() as segments:
+        if workers == 1:
+            results = map(build_segment, tasks)
+        else:
+            # 子进程不能和父进程共用数据库连接；fork 之后子进程直接使用已经 setup 的 backend
+            db_connections.close_all()
+            pool = multiprocessing.get_context('fork').Pool(workers)
+            results = pool.imap_unordered(build_segment, tasks)
+
+        try:
+            for count, segment in results:
+                segments.append(segment)
+                done += count
+                if progress:
+                    progress(done, total)
+        finally:
+            if workers != 1:
+                pool.close()
+                pool.join()
+
+    return done
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+"""
+按更新时间增量同步搜索索引
+
+水位(watermark)记录上一次同步开始的时间，保存在 HAYSTACK_WATERMARK_FILE 中(每个 haystack 连接一个)。
+同步时只重新索引 updated_time 晚于水位的对象，再把索引中的 id 分批和数据库对比，
+删除已经不存在或者不在 index_queryset 中(例如转成草稿)的文档。
+索引服务中断、队列丢失之后，用它代替 rebuild_index 恢复索引。
+"""
+
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from haystack import connections
+from haystack.utils import get_model_ct
+
+
+def watermark_file():
+    return getattr(settings, 'HAYSTACK_WATERMARK_FILE', os.path.join(settings.BASE_DIR, 'search_index.watermark'))
+
+
+def read_watermarks():
+    try:
+        with open(watermark_file()) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def get_watermark(using='default'):
+    value = read_watermarks().get(using)
+    return parse_datetime(value) if value else None
+
+
+def set_watermark(value, using='default'):
+    watermarks = read_watermarks()
+    watermarks[using] = value.isoformat()
+    # 先写临时文件再替换，中途失败不会留下不完整的文件
+    tmp_file = '%s.tmp' % watermark_file()
+    with open(tmp_file, 'w') as f:
+        json.dump(watermarks, f)
+    os.replace(tmp_file, watermark_file())
+
+
+def apply_batch(backend, index, objects, remove_identifiers):
+    if hasattr(backend, 'apply_batch'):
+        backend.apply_batch(index, objects, remove_identifiers)
+    else:
+        if objects:
+            backend.update(index, objects)
+        for identifier in remove_identifiers:
+            backend.remove(identifier)
+
+
+def update_since(backend, index, since, using='default', batch_size=500):
+    """重新索引 since 之后更新过的对象(since 为 None 或者没有更新时间字段时为全部)，返回数量"""
+    queryset = index.index_queryset(using=using).order_by('pk')
+    updated_field = index.get_updated_field()
+    if since is not None and updated_field:
+        queryset = queryset.filter(**{'%s__gte' % updated_field: since})
+
+    total, last_pk = 0, None
+    while True:
+        batch_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        objects = list(batch_queryset[:batch_size])
+        if not objects:
+            return total
+        apply_batch(backend, index, objects, ())
+        total += len(objects)
+        last_pk = objects[-1].pk
+
+
+def remove_stale(backend, index, using='default', batch_size=500):
+    """删除索引中有、但是 index_queryset 中已经没有的对象，返回数量"""
+    model = index.get_model()
+    indexed_ids = backend.indexed_ids(model)
+    total = 0
+    for i in range(0, len(indexed_ids), batch_size):
+        batch = indexed_ids[i:i + batch_size]
+        existing = {str(pk) for pk in index.index_queryset(using=using).
+                    filter(pk__in=batch).values_list('pk', flat=True)}
+        stale = ['%s.%s' % (get_model_ct(model), pk) for pk in batch if pk not in existing]
+        if stale:
+            apply_batch(backend, index, [], stale)
+            total += len(stale)
+    return total
+
+
+def sync_index(using='default', batch_size=500, overlap=60, full=False):
+    """
+    增量同步所有建立了索引的模型，成功后把水位更新为这次同步开始的时间，返回 (更新数量, 删除数量)
+
+    :param overlap: 秒数，从水位之前这么久开始同步。保存时 updated_time 早于事务提交，
+                    同步开始时还没有提交的修改也能在下一次同步时被找到
+    :param full: 忽略水位，重新索引所有对象
+    """
+    started = timezone.now()
+    since = None if full else get_watermark(using)
+    if since is not None:
+        since -= timedelta(seconds=overlap)
+
+    backend = connections[using].get_backend()
+    unified_index = connections[using].get_unified_index()
+    updated = removed = 0
+    for model in unified_index.get_indexed_models():
+        index = unified_index.get_index(model)
+        updated += update_since(backend, index, since, using, batch_size)
+        removed += remove_stale(backend, index, using, batch_size)
+
+    set_watermark(started, using)
+    return updated, removed
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .lib.archives import ArchivesOverview
+from .lib.navigation import CategoryNav
+from .lib.tag_cloud import TagCloud
+from .models import Article, Author, Category, Tag
+from .page_cache import purge_all_pages
+
+
+def adjust_article_count(model, pks, delta):
+    """已发布文章数量的增减，用 F() 表达式在数据库中原子地完成"""
+    pks = [pk for pk in pks if pk is not None]
+    if pks and delta:
+        model.objects.filter(pk__in=pks).update(article_count=F('article_count') + delta)
+        if model is Category:
+            # 导航栏中显示了分类下的文章数量
+            transaction.on_commit(CategoryNav.invalidate)
+
+
+def touch_article(article):
+    """标签变化也算文章的修改，只保存 updated_time"""
+    article.updated_time = timezone.now()
+    article.save(update_fields=['updated_time'])
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def article_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    delta = -1 if action in ('post_remove', 'pre_clear') else 1
+
+    if action == 'pre_clear':
+        # post_clear 时已经不知道清除了哪些关系，需要在清除之前统计
+        if reverse:
+            adjust_article_count(Tag, [instance.pk], -instance.article_set.filter(status='p').count())
+            instance.article_set.all().touch()
+        else:
+            if instance.status == 'p':
+                adjust_article_count(Tag, instance.tags.values_list('pk', flat=True), -1)
+            touch_article(instance)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        if reverse:
+            # tag.article_set.add(...)，pk_set 中是文章的主键
+            published = Article.objects.filter(pk__in=pk_set, status='p').count()
+            adjust_article_count(Tag, [instance.pk], delta * published)
+            Article.objects.filter(pk__in=pk_set).touch()
+        else:
+            if instance.status == 'p':
+                adjust_article_count(Tag, pk_set, delta)
+            touch_article(instance)
+
+    if action != 'pre_clear' and (reverse or instance.status == 'p'):
+        transaction.on_commit(TagCloud.invalidate)
+
+
+@receiver(post_save, sender=Article)
+def article_saved(sender, instance, created, **kwargs):
+    if created:
+        # 新文章的标签是在保存之后才添加的，由 article_tags_changed 处理
+        if instance.status == 'p':
+            adjust_article_count(Category, [instance.category_id], 1)
+            transaction.on_commit(ArchivesOverview.invalidate)
+        return
+
+    changed_fields = instance.get_changed_fields()
+    if changed_fields is None:
+        # 不知道保存之前的状态，只能依靠 reconcile_article_counts 命令修正
+        transaction.on_commit(TagCloud.invalidate)
+        transaction.on_commit(ArchivesOverview.invalidate)
+        return
+    if changed_fields & {'status', 'created_time'}:
+        transaction.on_commit(ArchivesOverview.invalidate)
+    if not changed_fields & {'status', 'category_id'}:
+        return
+
+    was_published = instance.get_loaded_value('status') == 'p'
+    is_published = instance.status == 'p'
+    old_category_id = instance.get_loaded_value('category_id')
+    if was_published and (not is_published or old_category_id != instance.category_id):
+        adjust_article_count(Category, [old_category_id], -1)
+    if is_published and (not was_published or old_category_id != instance.category_id):
+        adjust_article_count(Category, [instance.category_id], 1)
+
+    if was_published != is_published:
+        adjust_article_count(Tag, instance.tags.values_list('pk', flat=True),
+                             1 if is_published else -1)
+        transaction.on_commit(TagCloud.invalidate)
+
+
+@receiver(pre_delete, sender=Article)
+def article_deleting(sender, instance, **kwargs):
+    # 文章与标签的关系在 post_delete 之前就已经被删除了
+    if instance.status == 'p':
+        adjust_article_count(Category, [instance.category_id], -1)
+        adjust_article_count(Tag, instance.tags.values_list('pk', flat=True), -1)
+
+
+@receiver(post_delete, sender=Article)
+def article_deleted(sender, instance, **kwargs):
+    if instance.status == 'p':
+        transaction.on_commit(TagCloud.invalidate)
+        transaction.on_commit(ArchivesOverview.invalidate)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    transaction.on_commit(TagCloud.invalidate)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    # 删除标签时文章与标签的关系被直接删除，不会发送 m2m_changed
+    instance.article_set.all().touch()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, **kwargs):
+    # 所有页面的导航栏中都有分类
+    transaction.on_commit(CategoryNav.invalidate)
+    purge_all_pages()
+
+
+# 文章中显示(并且索引)了标签名、分类名和作者的用户名：(字段, 文章的查询条件)
+RENAME_FIELDS = {
+    Tag: ('name', 'tags'),
+    Category: ('name', 'category'),
+    Author: ('username', 'author'),
+}
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Author)
+def related_renamed(sender, instance, created, **kwargs):
+    field_name, lookup = RENAME_FIELDS[sender]
+    changed_fields = instance.get_changed_fields()
+    # 不是从数据库加载的对象不知道原来的名称，当作改过名
+    if not created and (changed_fields is None or field_name in changed_fields):
+        Article.objects.filter(**{lookup: instance}).touch()
@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: LooEv
+
+"""
+基于 SQLite FTS5 的 haystack 搜索后端
+
+    HAYSTACK_CONNECTIONS = {
+        'default': {
+            'ENGINE': 'blog.sqlite_fts_backend.SQLiteFTSEngine',
+            'PATH': os.path.join(BASE_DIR, 'search_index.sqlite3'),  # ':memory:' 表示内存数据库
+        },
+    }
+
+索引保存在两张表中：search_document 保存每个文档的标识和需要返回的字段(JSON)，
+FTS5 虚拟表 search_fts 保存用 jieba 分词后以空格连接的文本，两张表通过 rowid 对应。
+FTS5 自带的 unicode61 分词器按空格和标点切分，所以索引和查询时都要先用 jieba 分词；
+索引时使用搜索引擎模式(和 whoosh 后端的 ChineseAnalyzer 一样)，查询时使用精确模式。
+"""
+
+import json
+import re
+import sqlite3
+import uuid
+import warnings
+from datetime import date, datetime
+
+import jieba
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import force_text
+from django.utils.html import escape
+from haystack.backends import BaseEngine, BaseSearchBackend, BaseSearchQuery, log_query
+from haystack.constants import DJANGO_CT, DJANGO_ID, ID
+from haystack.exceptions import SearchBackendError, SkipDocument
+from haystack.inputs import Clean, PythonData
+from haystack.models import SearchResult
+from haystack.utils import get_identifier, get_model_ct
+from haystack.utils import log as logging
+from haystack.utils.app_loading import haystack_get_model
+
+from .whoosh_cn_backend import process_local
+
+DOCUMENT_TABLE = 'search_document'
+FTS_TABLE = 'search_fts'
+VOCAB_TABLE = 'search_fts_vocab'
+
+# FTS5 的关键字，作为普通的词查询时需要改成小写(unicode61 分词器不区分大小写)
+RESERVED_WORDS = ('AND', 'OR', 'NOT', 'NEAR')
+NON_WORD_RE = re.compile(r'\W+')
+WORD_RE = re.compile(r'\w+')
+
+
+def index_tokens(text):
+    """索引时的分词：搜索引擎模式，长词会再切分出其中的短词"""
+    return [token for token in jieba.cut_for_search(text) if token.strip()]
+
+
+def query_tokens(text):
+    """
+    查询时的分词：精确模式，每个词都是 FTS5 的 bareword(只包含字母、数字、下划线和非 ASCII 字符)
+
+    精确模式切分出的词在索引时都会出现，而搜索引擎模式多出来的短词会让查询变得过于严格。
+    """
+    tokens = []
+    for token in jieba.cut(NON_WORD_RE.sub(' ', text)):
+        token = token.strip()
+        if token:
+            tokens.append(token.lower() if token in RESERVED_WORDS else token)
+    return tokens
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    # 不支持分面统计，也不支持范围过滤(例如按年份过滤的 created_time__gte)，见 blog/forms.py
+    supports_facets = False
+
+    def __init__(self, connection_alias, **connection_options):
+        super().__init__(connection_alias, **connection_options)
+        self.setup_complete = False
+        self.path = connection_options.get('PATH')
+
+        if not self.path:
+            raise ImproperlyConfigured("You must specify a 'PATH' in your settings for connection '%s'." % connection_alias)
+
+        self.log = logging.getLogger('haystack')
+
+    def setup(self):
+        from haystack import connections
+
+        if self.path == ':memory:':
+            # 每个线程各自打开连接，共享同一个内存数据库；进程中保留一个连接，数据库才不会被释放
+            uri = process_local(('sqlite_fts', self.connection_alias),
+                                lambda: 'file:haystack-%s?mode=memory&cache=shared' % uuid.uuid4().hex)
+            process_local(('sqlite_fts_keepalive', uri),
+                          lambda: sqlite3.connect(uri, uri=True, check_same_thread=False))
+            self.conn = sqlite3.connect(uri, uri=True)
+        else:
+            self.conn = sqlite3.connect(self.path, timeout=30)
+            # 写索引时不阻塞搜索
+            self.conn.execute('PRAGMA journal_mode=WAL')
+
+        fields = connections[self.connection_alias].get_unified_index().all_searchfields()
+        self.content_field_name, self.fields = self.build_schema(fields)
+        self.create_tables()
+        self.setup_complete = True
+
+    def build_schema(self, fields):
+        """返回 (文档字段名, {索引中的字段名: 字段})"""
+        content_field_name = ''
+        schema_fields = {}
+
+        for field_name, field_class in fields.items():
+            schema_fields[field_class.index_fieldname] = field_class
+
+            if field_class.document is True:
+                content_field_name = field_class.index_fieldname
+
+        if not schema_fields:
+            raise SearchBackendError("No fields were found in any search_indexes. Please correct this before attempting to search.")
+
+        return content_field_name, schema_fields
+
+    def create_tables(self):
+        columns = sorted(self.fields)
+        existing = [row[1] for row in self.conn.execute('PRAGMA table_info(%s)' % FTS_TABLE)]
+
+        if existing and existing != columns:
+            # 索引的字段变了，旧的索引已经不能用，需要执行 rebuild_index
+            self.log.warning("Search index fields changed from %s to %s, the index is emptied.", existing, columns)
+            self.drop_tables()
+
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS %s ('
+                              'rowid INTEGER PRIMARY KEY, %s TEXT UNIQUE NOT NULL, %s TEXT NOT NULL, '
+                              '%s TEXT NOT NULL, data TEXT NOT NULL)' % (DOCUMENT_TABLE, ID, DJANGO_CT, DJANGO_ID))
+            self.conn.execute('CREATE INDEX IF NOT EXISTS %s_ct ON %s (%s)' % (DOCUMENT_TABLE, DOCUMENT_TABLE, DJANGO_CT))
+            self.conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s)' % (FTS_TABLE, ', '.join(columns)))
+            self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5vocab(%s, 'row')" % (VOCAB_TABLE, FTS_TABLE))
+
+    def drop_tables(self):
+        with self.conn:
+            for table in (VOCAB_TABLE, FTS_TABLE, DOCUMENT_TABLE):
+                self.conn.execute('DROP TABLE IF EXISTS %s' % table)
+
+    def update(self, index, iterable, commit=True):
+        self.apply_batch(index, iterable)
+
+    def apply_batch(self, index, iterable, remove_identifiers=()):
+        """在同一个事务中删除和写入一批文档"""
+        if not self.setup_complete:
+            self.setup()
+
+        try:
+            with self.conn:
+                for identifier in remove_identifiers:
+                    self._delete_document(identifier)
+                for obj in iterable:
+                    self._write_document(index, obj)
+        except sqlite3.Error as e:
+            if not self.silently_fail:
+                raise
+
+            self.log.error("Failed to update the SQLite search index: %s", e, exc_info=True)
+
+    def _write_document(self, index, obj):
+        try:
+            doc = index.full_prepare(obj)
+        except SkipDocument:
+            self.log.debug("Indexing for object `%s` skipped", obj)
+            return
+
+        doc.pop('boost', None)
+        self._delete_document(doc[ID])
+        stored = {key: self._from_python(value) for key, value in doc.items()
+                  if key not in (ID, DJANGO_CT, DJANGO_ID)}
+        cursor = self.conn.execute(
+            'INSERT INTO %s (%s, %s, %s, data) VALUES (?, ?, ?, ?)' % (DOCUMENT_TABLE, ID, DJANGO_CT, DJANGO_ID),
+            (doc[ID], doc[DJANGO_CT], force_text(doc[DJANGO_ID]), json.dumps(stored)))
+
+        columns = sorted(self.fields)
+        values = [' '.join(index_tokens(self._to_text(doc.get(column)))) for column in columns]
+        self.conn.execute('INSERT INTO %s (rowid, %s) VALUES (?%s)' % (FTS_TABLE, ', '.join(columns), ', ?' * len(columns)),
+                          [cursor.lastrowid] + values)
+
+    def _delete_document(self, identifier):
+        row = self.conn.execute('SELECT rowid FROM %s WHERE %s = ?' % (DOCUMENT_TABLE, ID), (identifier,)).fetchone()
+        if row is not None:
+            self.conn.execute('DELETE FROM %s WHERE rowid = ?' % FTS_TABLE, row)
+            self.conn.execute('DELETE FROM %s WHERE rowid = ?' % DOCUMENT_TABLE, row)
+
+    def indexed_ids(self, model):
+        """索引中这个模型的所有文档的 django_id"""
+        if not self.setup_complete:
+            self.setup()
+
+        return [row[0] for row in self.conn.execute('SELECT %s FROM %s WHERE %s = ? ORDER BY rowid'
+                                                    % (DJANGO_ID, DOCUMENT_TABLE, DJANGO_CT), (get_model_ct(model),))]
+
+    def remove(self, obj_or_string, commit=True):
+        if not self.setup_complete:
+            self.setup()
+
+        identifier = get_identifier(obj_or_string)
+
+        try:
+            with self.conn:
+                self._delete_document(identifier)
+        except sqlite3.Error as e:
+            if not self.silently_fail:
+                raise
+
+            self.log.error("Failed to remove document '%s' from the SQLite search index: %s", identifier, e, exc_info=True)
+
+    def clear(self, models=None, commit=True):
+        if not self.setup_complete:
+            self.setup()
+
+        try:
+            if models is None:
+                self.drop_tables()
+                self.create_tables()
+                return
+
+            model_cts = [get_model_ct(model) for model in models]
+            where = '%s IN (%s)' % (DJANGO_CT, ', '.join('?' * len(model_cts)))
+            with self.conn:
+                self.conn.execute('DELETE FROM %s WHERE rowid IN (SELECT rowid FROM %s WHERE %s)'
+                                  % (FTS_TABLE, DOCUMENT_TABLE, where), model_cts)
+                self.conn.execute('DELETE FROM %s WHERE %s' % (DOCUMENT_TABLE, where), model_cts)
+        except sqlite3.Error as e:
+            if not self.silently_fail:
+                raise
+
+            self.log.error("Failed to clear the SQLite search index: %s", e, exc_info=True)
+
+    def optimize(self):
+        if not self.setup_complete:
+            self.setup()
+
+        with self.conn:
+            self.conn.execute("INSERT INTO %s (%s) VALUES ('optimize')" % (FTS_TABLE, FTS_TABLE))
+
+    @log_query
+    def search(self, query_string, sort_by=None, start_offset=0, end_offset=None,
+               fields='', highlight=False, facets=None, date_facets=None, query_facets=None,
+               narrow_queries=None, spelling_query=None, within=None,
+               dwithin=None, distance_point=None, models=None,
+               limit_to_registered_models=None, result_class=None, **kwargs):
+        if not self.setup_complete:
+            self.setup()
+
+        # FTS5 的 NOT 是二元运算符，haystack 生成的 "a AND NOT b" 要写成 "a NOT b"
+        query_string = re.sub(r'\bAND\s+NOT\b', 'NOT', force_text(query_string).strip())
+
+        if not query_string:
+            return {'results': [], 'hits': 0}
+
+        if facets or date_facets or query_facets:
+            warnings.warn("The SQLite FTS backend does not handle faceting.", Warning, stacklevel=2)
+
+        match_queries = [] if query_string == '*' else [query_string]
+        match_queries += list(narrow_queries or ())
+        order_by = self._order_by(sort_by, ranked=bool(match_queries))
+
+        return self._query(match_queries, order_by, start_offset, end_offset,
+                           models=models, limit_to_registered_models=limit_to_registered_models,
+                           highlight_terms=self._highlight_terms(query_string) if highlight else None,
+                           result_class=result_class)
+
+    def more_like_this(self, model_instance, additional_query_string=None,
+                       start_offset=0, end_offset=None, models=None,
+                       limit_to_registered_models=None, result_class=None, **kwargs):
+        """用这篇文档中 tf-idf 最高的几个词组成 OR 查询，排除文档本身"""
+        if not self.setup_complete:
+            self.setup()
+
+        identifier = get_identifier(model_instance)
+        row = self.conn.execute('SELECT f.%s FROM %s d JOIN %s f ON f.rowid = d.rowid WHERE d.%s = ?'
+                                % (self.content_field_name, DOCUMENT_TABLE, FTS_TABLE, ID), (identifier,)).fetchone()
+
+        if row is None:
+            return {'results': [], 'hits': 0}
+
+        term_counts = {}
+        for term in row[0].lower().split():
+            if WORD_RE.fullmatch(term):
+                term_counts[term] = term_counts.get(term, 0) + 1
+
+        terms = self._top_terms(term_counts)
+        if not terms:
+            return {'results': [], 'hits': 0}
+
+        match_queries = ['%s : (%s)' % (self.content_field_name, ' OR '.join('"%s"' % term for term in terms))]
+        if additional_query_string and additional_query_string != '*':
+            match_queries.append(additional_query_string)
+
+        return self._query(match_queries, self._order_by(None, ranked=True), start_offset, end_offset,
+                           models=models, limit_to_registered_models=limit_to_registered_models,
+                           exclude_identifier=identifier, result_class=result_class)
+
+    def _top_terms(self, term_counts, top=10):
+        doc_count = self.conn.execute('SELECT COUNT(*) FROM %s' % DOCUMENT_TABLE).fetchone()[0]
+        doc_freqs = {}
+        terms = list(term_counts)
+        # SQLite 默认最多 999 个参数
+        for i in range(0, len(terms), 500):
+            chunk = terms[i:i + 500]
+            doc_freqs.update(self.conn.execute('SELECT term, doc FROM %s WHERE term IN (%s)'
+                                               % (VOCAB_TABLE, ', '.join('?' * len(chunk))), chunk))
+
+        def tf_idf(term):
+            return term_counts[term] * (1 + doc_count) / (1 + doc_freqs.get(term, 0))
+
+        return sorted(terms, key=tf_idf, reverse=True)[:top]
+
+    def _order_by(self, sort_by, ranked):
+        if not sort_by:
+            # bm25() 越小越相关
+            return 'bm25(%s), d.rowid' % FTS_TABLE if ranked else 'd.rowid'
+
+        order_by = []
+        for field in sort_by:
+            desc = field.startswith('-')
+            field = field.lstrip('-')
+            if field not in self.fields:
+                raise SearchBackendError("The SQLite FTS backend can't sort on unknown field '%s'." % field)
+            order_by.append("json_extract(d.data, '$.%s')%s" % (field, ' DESC' if desc else ''))
+        return ', '.join(order_by)
+
+    def _query(self, match_queries, order_by, start_offset=0, end_offset=None, models=None,
+               limit_to_registered_models=None, highlight_terms=None, exclude_identifier=None,
+               result_class=None):
+        where, params = [], []
+
+        if match_queries:
+            where.append('%s MATCH ?' % FTS_TABLE)
+            params.append(' AND '.join('(%s)' % query for query in match_queries))
+
+        if models:
+            model_choices = sorted(get_model_ct(model) for model in models)
+        elif limit_to_registered_models is None or limit_to_registered_models:
+            model_choices = self.build_models_list()
+        else:
+            model_choices = []
+
+        if model_choices:
+            where.append('d.%s IN (%s)' % (DJANGO_CT, ', '.join('?' * len(model_choices))))
+            params += model_choices
+
+        if exclude_identifier is not None:
+            where.append('d.%s != ?' % ID)
+            params.append(exclude_identifier)
+
+        if match_queries:
+            # CROSS JOIN 固定连接顺序：先由全文索引找出匹配的文档，再取文档表中的数据
+            sql_from = '%s CROSS JOIN %s d ON d.rowid = %s.rowid' % (FTS_TABLE, DOCUMENT_TABLE, FTS_TABLE)
+        else:
+            sql_from = '%s d JOIN %s ON %s.rowid = d.rowid' % (DOCUMENT_TABLE, FTS_TABLE, FTS_TABLE)
+        sql_where = ' WHERE %s' % ' AND '.join(where) if where else ''
+        score = '-bm25(%s)' % FTS_TABLE if match_queries else '0'
+        limit = -1 if end_offset is None else max(end_offset - start_offset, 0)
+
+        try:
+            hits = self.conn.execute('SELECT COUNT(*) FROM %s%s' % (sql_from, sql_where), params).fetchone()[0]
+            rows = self.conn.execute('SELECT d.%s, d.%s, d.data, %s FROM %s%s ORDER BY %s LIMIT ? OFFSET ?'
+                                     % (DJANGO_CT, DJANGO_ID, score, sql_from, sql_where, order_by),
+                                     params + [limit, start_offset or 0]).fetchall()
+        except sqlite3.OperationalError as e:
+            # 通常是查询语法错误
+            if not self.silently_fail:
+                raise SearchBackendError("Failed to query the SQLite search index: %s" % e)
+
+            self.log.error("Failed to query the SQLite search index: %s", e, exc_info=True)
+            return {'results': [], 'hits': 0}
+
+        return self._process_results(rows, hits, highlight_terms, result_class)
+
+    def _process_results(self, rows, hits, highlight_terms=None, result_class=None):
+        from haystack import connections
+        unified_index = connections[self.connection_alias].get_unified_index()
+        indexed_models = unified_index.get_indexed_models()
+        result_class = result_class or SearchResult
+        results = []
+
+        for django_ct, django_id, data, score in rows:
+            app_label, model_name = django_ct.split('.')
+            model = haystack_get_model(app_label, model_name)
+
+            if not model or model not in indexed_models:
+                hits -= 1
+                continue
+
+            index = unified_index.get_index(model)
+            additional_fields = {}
+            for key, value in json.loads(data).items():
+                if key in index.fields and hasattr(index.fields[key], 'convert'):
+                    additional_fields[key] = index.fields[key].convert(value)
+                else:
+                    additional_fields[key] = value
+
+            if highlight_terms is not None:
+                additional_fields['highlighted'] = {
+                    self.content_field_name: [highlight_text(additional_fields.get(self.content_field_name) or '',
+                                                             highlight_terms)],
+                }
+
+            results.append(result_class(app_label, model_name, django_id, score, **additional_fields))
+
+        return {
+            'results': results,
+            'hits': hits,
+            'facets': {},
+            'spelling_suggestion': None,
+        }
+
+    def _highlight_terms(self, query_string):
+        """查询语句中的词，去掉字段名和 FTS5 的关键字"""
+        query_string = re.sub(r'\w+\s*:|,\s*\d+\s*\)', ' ', query_string)
+        return [term for term in WORD_RE.findall(query_string) if term not in RESERVED_WORDS]
+
+    def _from_python(self, value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, (set, tuple)):
+            return list(value)
+        return value
+
+    def _to_text(self, value):
+        if value is None:
+            return ''
+        if isinstance(value, (list, tuple, set)):
+            return ' '.join(force_text(v) for v in value)
+        return force_text(self._from_python(value))
+
+
+def highlight_text(text, terms, max_length=200, tag='em'):
+    """截取第一个匹配的词附近的一段文本，用 <em> 标出所有匹配的词"""
+    if not terms:
+        return escape(text[:max_length])
+
+    pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.I)
+    match = pattern.search(text)
+    start = max(match.start() - max_length // 4, 0) if match else 0
+    window = escape(text[start:start + max_length])
+    return pattern.sub(lambda m: '<%s>%s</%s>' % (tag, m.group(0), tag), window)
+
+
+class SQLiteFTSSearchQuery(BaseSearchQuery):
+
+    def clean(self, query_fragment):
+        """
+        用 jieba 分词，只保留由字母、数字和非 ASCII 字符组成的词
+
+        FTS5 中空格分隔的词之间是 AND 关系，引号、括号、星号等都有特殊含义，直接去掉。
+        """
+        return ' '.join(query_tokens(query_fragment))
+
+    def build_exact_query(self, query_string):
+        tokens = query_tokens(query_string)
+        if len(tokens) == 1:
+            return tokens[0]
+        # 索引时的搜索引擎模式会在词之间插入切分出的短词，用 NEAR 代替短语查询
+        return 'NEAR(%s, %d)' % (' '.join(tokens), len(tokens) * 2)
+
+    def build_query_fragment(self, field, filter_type, value):
+        from haystack import connections
+
+        if not hasattr(value, 'input_type_name'):
+            if hasattr(value, 'values_list'):
+                value = list(value)
+
+            if isinstance(value, str) and value != ' ':
+                value = Clean(value)
+            else:
+                value = PythonData(value)
+
+        prepared_value = value.prepare(self)
+
+        if field == 'content':
+            if not self.backend.setup_complete:
+                self.backend.setup()
+            index_fieldname = self.backend.content_field_name
+        else:
+            index_fieldname = connections[self._using].get_unified_index().get_index_fieldname(field)
+
+        if value.post_process is False or value.input_type_name == 'exact':
+            query_frag = prepared_value
+        elif filter_type in ('content', 'fuzzy'):
+            query_frag = self.clean(self.backend._to_text(prepared_value))
+        elif filter_type in ('contains', 'startswith'):
+            # FTS5 只支持前缀查询
+            query_frag = ' '.join('%s*' % token for token in query_tokens(self.backend._to_text(prepared_value)))
+        elif filter_type == 'exact':
+            query_frag = self.build_exact_query(self.backend._to_text(prepared_value))
+        elif filter_type == 'in':
+            query_frag = ' OR '.join(self.build_exact_query(self.backend._to_text(v)) for v in prepared_value)
+        else:
+            raise SearchBackendError("The SQLite FTS backend does not support the '%s' filter." % filter_type)
+
+        if not query_frag:
+            return ''
+
+        return '%s : (%s)' % (index_fieldname, query_frag)
+
+
+class SQLiteFTSEngine(BaseEngine):
+    backend = SQLiteFTSSearchBackend
+    query = SQLiteFTSSearchQuery
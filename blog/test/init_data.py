@@ -12,6 +12,7 @@
 
 import datetime
 
+from django.db import connection
 from django.utils.timezone import make_aware
 from blog.models import Article, Author, Tag, Category
 
@@ -32,6 +33,7 @@ def init_data(cls):
     cls.author2 = Author.objects.create_user(username='loo2', id=2, email='loo2@gmail.com', password='A1B2C34G56LZ')
     cls.author3 = Author.objects.create_user(username='loo3', id=3, email='loo3@gmail.com', password='A1B2C34G56LZ')
     cls.category1 = Category.objects.create(name='category1', id=1)
+    updated_time = make_aware(datetime.datetime(2019, 9, 10, 11, 45, 24, 284292))
     for i in range(1, 31):
         content = f'{text[i % len(text)]}'
         setattr(cls, f'article{i}', Article.objects.create(
@@ -44,9 +46,23 @@ def init_data(cls):
             content_html=f'<p>{content}</p>',
             views=i % 2,  # range 0, 1
             created_time=make_aware(datetime.datetime(2019 - i % 2, i % 7 + 1, 10, 10, 45, 24, 284292)),
-            updated_time=make_aware(datetime.datetime(2019, 9, 10, 11, 45, 24, 284292)),
+            updated_time=updated_time,
             status='p' if i % 10 else 'd',  # 10, 20, 30 is 'd'
         ))
         if not getattr(cls, f'tag{i % 7}', None):
             setattr(cls, f'tag{i % 7}', Tag.objects.get_or_create(name=f'tag{i % 7}')[0])
         getattr(cls, f'article{i}').tags.add(getattr(cls, f'tag{i % 7}'))
+    # 添加标签时更新了 updated_time，恢复成固定的时间
+    Article.objects.update(updated_time=updated_time)
+    for article in Article.objects.all():
+        setattr(cls, f'article{article.pk}', article)
+    # 测试数据相当于已经提交
+    run_commit_hooks()
+
+
+def run_commit_hooks():
+    """TestCase 中的事务不会提交，手动执行 transaction.on_commit 注册的回调"""
+    while connection.run_on_commit:
+        callbacks, connection.run_on_commit = connection.run_on_commit, []
+        for _sids, func in callbacks:
+            func()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_archives.py
+@Version : v1.0
+@History :
+@Desc    : 归档页
+"""
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from blog.models import Article
+from .init_data import init_data, run_commit_hooks
+
+
+# 这里测试的是视图本身，不经过整页缓存
+@override_settings(PAGE_CACHE_ENABLED=False)
+class ArchivesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        init_data(cls)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_overview(self):
+        res = self.client.get('/archives/')
+        archives = res.context['archives']
+        # 草稿(10, 20, 30)不计入归档
+        self.assertEqual([(year, count) for year, count, _ in archives], [(2019, 12), (2018, 15)])
+        year, count, months = archives[0]
+        self.assertEqual(sum(month_count for _, month_count in months), count)
+        self.assertEqual([month for month, _ in months], sorted((month for month, _ in months), reverse=True))
+        # 文章列表按需加载，归档页本身不包含文章
+        self.assertNotContains(res, self.article1.article_title)
+        self.assertContains(res, '/archives/2019/')
+
+    def test_overview_cached_until_publish(self):
+        self.client.get('/archives/')
+        # 归档和导航栏中的分类都已经缓存
+        with self.assertNumQueries(0):
+            self.client.get('/archives/')
+
+        article = Article.objects.get(pk=10)
+        article.status = 'p'
+        article.save()
+        # 事务提交之后缓存才失效
+        res = self.client.get('/archives/')
+        self.assertEqual([(year, count) for year, count, _ in res.context['archives']], [(2019, 12), (2018, 15)])
+        run_commit_hooks()
+        res = self.client.get('/archives/')
+        self.assertEqual([(year, count) for year, count, _ in res.context['archives']], [(2019, 13), (2018, 15)])
+
+        # 修改标题不影响归档
+        article.article_title = 'new title'
+        article.save()
+        run_commit_hooks()
+        with self.assertNumQueries(0):
+            self.client.get('/archives/')
+
+    def test_year_articles(self):
+        with self.assertNumQueries(1):
+            res = self.client.get('/archives/2018/')
+        article_list = list(res.context['article_list'])
+        self.assertEqual(len(article_list), 15)
+        self.assertTrue(all(article.status == 'p' for article in article_list))
+        self.assertEqual(set(article_list[0].get_deferred_fields()) & {'content_md', 'content_html'},
+                         {'content_md', 'content_html'})
+        self.assertContains(res, Article.objects.get(pk=1).get_absolute_url())
+        self.assertNotContains(res, '<html')
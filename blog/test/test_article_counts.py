@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_article_counts.py
+@Version : v1.0
+@History :
+@Desc    : Tag/Category 中冗余的已发布文章数量
+"""
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from blog.forms import ArticlePostForm
+from blog.models import Article, Category, Tag
+from .init_data import init_data
+
+
+class ArticleCountTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        init_data(cls)
+
+    def assertCountsConsistent(self):
+        for tag in Tag.objects.all():
+            self.assertEqual(tag.article_count, tag.article_set.filter(status='p').count(), tag)
+        for category in Category.objects.all():
+            self.assertEqual(category.article_count, category.article_set.filter(status='p').count(),
+                             category)
+
+    def test_initial_counts(self):
+        # tag1: article1, 8, 15, 22, 29; article10, 20, 30 是草稿
+        self.assertEqual(Tag.objects.get(name='tag1').article_count, 5)
+        self.assertEqual(Category.objects.get(pk=1).article_count, 27)
+        self.assertCountsConsistent()
+
+    def test_form_edit(self):
+        category2 = Category.objects.create(name='category2')
+        post_data = {
+            'article_title': 'edited', 'content': '修改过的文章内容，修改过的文章内容',
+            'tags': 'tag2 new_tag', 'category': category2.pk, 'status': 'p',
+        }
+        form = ArticlePostForm(data=post_data)
+        self.assertTrue(form.is_valid())
+        form.save(self.author1.id, article_id=1)
+        self.assertEqual(Category.objects.get(pk=category2.pk).article_count, 1)
+        self.assertEqual(Tag.objects.get(name='new_tag').article_count, 1)
+        self.assertCountsConsistent()
+
+        post_data['status'] = 'd'
+        form = ArticlePostForm(data=post_data)
+        self.assertTrue(form.is_valid())
+        form.save(self.author1.id, article_id=1)
+        self.assertEqual(Category.objects.get(pk=category2.pk).article_count, 0)
+        self.assertCountsConsistent()
+
+    def test_publish_and_delete(self):
+        article = Article.objects.get(pk=10)
+        article.status = 'p'
+        article.save()
+        self.assertCountsConsistent()
+        Article.objects.get(pk=3).delete()
+        self.assertCountsConsistent()
+        self.tag1.article_set.add(Article.objects.get(pk=2))
+        self.tag2.article_set.clear()
+        self.assertEqual(Tag.objects.get(pk=self.tag2.pk).article_count, 0)
+        Article.objects.get(pk=4).tags.clear()
+        self.assertCountsConsistent()
+
+    def test_reconcile(self):
+        Tag.objects.update(article_count=100)
+        Category.objects.update(article_count=0)
+        out = StringIO()
+        call_command('reconcile_article_counts', stdout=out)
+        self.assertIn('共有 8 条记录存在偏差', out.getvalue())
+        self.assertCountsConsistent()
@@ -10,17 +10,25 @@
 @Desc    :
 """
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
+from blog.models import Article
+from blog.views import article_view_counter
 from .init_data import init_data
 
 
+# 这里测试的是视图本身，不经过整页缓存
+@override_settings(PAGE_CACHE_ENABLED=False)
 class DetailViewTest(TestCase):
 
     @classmethod
     def setUpTestData(cls):
         init_data(cls)
 
+    def setUp(self):
+        article_view_counter.clear()
+        self.addCleanup(article_view_counter.clear)
+
     def test_get_detail_by_link(self):
         res = self.client.get('/article/loo1/article1.html')
         self.assertEqual(res.status_code, 200)
@@ -48,6 +56,16 @@ class DetailViewTest(TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(res.context['article'].views, 2)
 
+    def test_views_are_buffered(self):
+        self.client.get('/article/loo1/article1.html')
+        res = self.client.get('/article/loo1/article1.html')
+        self.assertEqual(res.context['article'].views, 3)
+        # 浏览量还在缓冲区中，数据库里的值没有变化
+        self.assertEqual(Article.objects.get(pk=1).views, 1)
+        self.assertEqual(article_view_counter.flush(), 2)
+        self.assertEqual(Article.objects.get(pk=1).views, 3)
+        self.assertEqual(article_view_counter.pending(1), 0)
+
     def test_visit_draft_article(self):
         self.client.post('/accounts/login/',
                          {'username': 'loo1', 'password': 'A1B2C34G56LZ'})
@@ -10,10 +10,14 @@
 @Desc    :
 """
 
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 from django.utils.translation import gettext_lazy as _
 
-from blog.forms import RegisterForm
+from blog.forms import ArticlePostForm, RegisterForm
+from blog.models import Article
 from .init_data import init_data
 
 
@@ -61,3 +65,51 @@ class FormTest(TestCase):
         }
         form = RegisterForm(data=post_data)
         self.assertTrue(form.is_valid())
+
+    def test_article_post_form_excerpt(self):
+        post_data = {
+            'article_title': 'excerpt', 'content': ' '.join(['word'] * 80),
+            'tags': 'tag1', 'category': self.category1.pk, 'status': 'p',
+        }
+        form = ArticlePostForm(data=post_data)
+        self.assertTrue(form.is_valid())
+        article = form.save(self.author1.id)
+        article.refresh_from_db()
+        self.assertEqual(article.excerpt_html, '<p>' + ' '.join(['word'] * 50) + ' …</p>')
+        self.assertEqual(article.excerpt_text, ' '.join(['word'] * 50) + ' …')
+
+    def test_backfill_excerpts(self):
+        Article.objects.update(excerpt_html='', excerpt_text='')
+        out = StringIO()
+        call_command('backfill_excerpts', stdout=out)
+        self.assertIn('30', out.getvalue())
+        self.assertEqual(Article.objects.get(pk=1).excerpt_html, '<p>我大胆走过你身旁</p>')
+        self.assertEqual(Article.objects.get(pk=1).excerpt_text, '我大胆走过你身旁')
+
+    def test_excerpt_follows_content(self):
+        # 不经过 ArticlePostForm 修改内容(后台、脚本)，摘要也要跟着更新
+        article = Article.objects.get(pk=1)
+        article.content_html = '<p>新的内容</p>'
+        article.save(update_fields=['content_html'])
+        self.assertEqual(Article.objects.get(pk=1).excerpt_html, '<p>新的内容</p>')
+        self.assertEqual(Article.objects.get(pk=1).excerpt_text, '新的内容')
+
+        # 没有修改内容时不重新生成
+        article.excerpt_html = '<p>手写的摘要</p>'
+        article.save()
+        self.assertEqual(Article.objects.get(pk=1).excerpt_html, '<p>手写的摘要</p>')
+
+    def test_article_post_form_edit(self):
+        Article.objects.filter(pk=1).update(views=10)
+        post_data = {
+            'article_title': 'edited', 'content': '修改过的文章内容，修改过的文章内容',
+            'tags': 'tag1 new_tag', 'category': self.category1.pk, 'status': 'd',
+        }
+        form = ArticlePostForm(data=post_data)
+        self.assertTrue(form.is_valid())
+        article = form.save(self.author1.id, article_id=1)
+        article = Article.objects.get(pk=article.pk)
+        self.assertEqual(article.article_title, 'edited')
+        self.assertEqual(article.status, 'd')
+        self.assertEqual(article.views, 10)
+        self.assertEqual(sorted(article.tags_split()), ['new_tag', 'tag1'])
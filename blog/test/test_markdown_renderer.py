@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_markdown_renderer.py
+@Version : v1.0
+@History :
+@Desc    : Markdown 渲染器的复用和渲染缓存
+"""
+
+import markdown
+from django.test import SimpleTestCase
+
+from blog.forms import ARTICLE_MARKDOWN_EXTENSIONS
+from blog.lib.markdown_renderer import MarkdownRenderer
+
+
+class MarkdownRendererTest(SimpleTestCase):
+
+    def setUp(self):
+        self.renderer = MarkdownRenderer(extensions=ARTICLE_MARKDOWN_EXTENSIONS, cache_size=2)
+
+    def render_directly(self, text):
+        return markdown.markdown(text, extensions=list(ARTICLE_MARKDOWN_EXTENSIONS))
+
+    def test_same_output_as_markdown(self):
+        text = '# 标题\n\n第一行\n第二行\n\n| a | b |\n| - | - |\n| 1 | 2 |'
+        self.assertEqual(self.renderer.render(text), self.render_directly(text))
+
+    def test_state_is_reset_between_documents(self):
+        first = '正文[^1]\n\n[^1]: 脚注一'
+        second = '没有脚注的正文'
+        self.renderer.render(first)
+        self.assertEqual(self.renderer.render(second), self.render_directly(second))
+
+    def test_cache(self):
+        self.renderer.render('hello')
+        self.renderer.render('hello')
+        self.assertEqual(self.renderer.cache.stats()['hits'], 1)
+        self.renderer.render('world')
+        self.renderer.render('django')
+        # 容量为 2，最早的 'hello' 已经被淘汰
+        self.assertNotIn((self.renderer.content_hash('hello'), self.renderer.extensions),
+                         self.renderer.cache)
+        self.assertEqual(len(self.renderer.cache), 2)
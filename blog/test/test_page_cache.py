@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_page_cache.py
+@Version : v1.0
+@History :
+@Desc    : 匿名用户整页缓存
+"""
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from blog.forms import ArticlePostForm
+from blog.lib.page_cache import CSRF_PLACEHOLDER
+from blog.models import Article, Author, Tag
+from blog.page_cache import page_cache, purge_author_pages
+from blog.views import article_view_counter
+from .init_data import init_data, run_commit_hooks
+
+
+class PageCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        init_data(cls)
+
+    def setUp(self):
+        cache.clear()
+        article_view_counter.clear()
+        self.addCleanup(article_view_counter.clear)
+
+    def assertCached(self, url):
+        with self.assertNumQueries(0):
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNone(res.context)
+        return res
+
+    def assertNotCached(self, url):
+        res = self.client.get(url)
+        self.assertIsNotNone(res.context)
+        return res
+
+    def edit_article(self, article, **data):
+        post_data = {
+            'article_title': article.article_title, 'content': article.content_md + ' edited',
+            'tags': ','.join(tag.name for tag in article.tags.all()),
+            'category': article.category_id, 'status': article.status,
+        }
+        post_data.update(data)
+        form = ArticlePostForm(data=post_data)
+        self.assertTrue(form.is_valid(), form.errors)
+        article = form.save(article.author_id, article.id)
+        run_commit_hooks()
+        return article
+
+    def test_anonymous_pages_are_cached(self):
+        for url in ('/', '/?page=2', '/tag/tag1', '/category/category1', '/archives/',
+                    self.article1.get_absolute_url()):
+            self.assertNotCached(url)
+            self.assertCached(url)
+
+    def test_authenticated_not_cached(self):
+        self.assertNotCached('/')
+        self.client.login(username='loo1', password='A1B2C34G56LZ')
+        self.assertNotCached('/')
+        self.assertNotCached('/')
+
+    def test_csrf_token_per_user(self):
+        self.assertNotCached('/')
+        res = self.assertCached('/')
+        self.assertNotContains(res, CSRF_PLACEHOLDER)
+        self.assertContains(res, 'name="csrfmiddlewaretoken"')
+        self.assertIn('csrftoken', res.cookies)
+
+    def test_cached_detail_still_counts_views(self):
+        url = self.article1.get_absolute_url()
+        self.assertNotCached(url)
+        self.assertCached(url)
+        self.assertEqual(article_view_counter.pending(self.article1.id), 2)
+
+    def test_edit_purges_affected_pages(self):
+        urls = ['/', '/tag/tag1', '/tag/tag2', '/category/category1', '/archives/',
+                self.article1.get_absolute_url(), self.article2.get_absolute_url(),
+                self.article3.get_absolute_url(), self.article5.get_absolute_url()]
+        for url in urls:
+            self.assertNotCached(url)
+
+        # article1 有标签 tag1，article2 的页面上有指向 article1 的链接
+        self.edit_article(self.article1, article_title='new title')
+        for url in ('/', '/tag/tag1', '/category/category1', '/archives/',
+                    self.article1.get_absolute_url(), self.article2.get_absolute_url()):
+            self.assertNotCached(url)
+        # 标签、上一篇/下一篇都与 article1 无关的页面不受影响
+        for url in ('/tag/tag2', self.article3.get_absolute_url(), self.article5.get_absolute_url()):
+            self.assertCached(url)
+
+    def test_publish_purges_neighbours(self):
+        # article10 是草稿，发布后 article9 和 article11 的上一篇/下一篇链接会指向它
+        urls = [self.article9.get_absolute_url(), self.article11.get_absolute_url(),
+                self.article5.get_absolute_url()]
+        for url in urls:
+            self.assertNotCached(url)
+        self.edit_article(self.article10, status='p')
+        self.assertNotCached(urls[0])
+        self.assertNotCached(urls[1])
+        self.assertCached(urls[2])
+
+    def test_purge_after_commit(self):
+        self.assertNotCached('/')
+        form = ArticlePostForm(data={'article_title': 'new title', 'content': 'new content ' * 10,
+                                     'tags': 'tag1', 'category': 1, 'status': 'p'})
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save(self.article1.author_id, self.article1.id)
+        # 事务提交之前，并发的请求读到的还是旧数据，页面不能在这时被清除
+        self.assertCached('/')
+        run_commit_hooks()
+        self.assertNotCached('/')
+
+    def test_edit_draft_purges_nothing(self):
+        self.assertNotCached('/')
+        self.edit_article(self.article10)
+        self.assertCached('/')
+
+    def test_delete_purges_pages(self):
+        self.assertNotCached('/tag/tag3')
+        self.client.login(username='loo3', password='A1B2C34G56LZ')
+        author = Author.objects.get(pk=3)
+        author.is_superuser = True
+        author.save()
+        self.client.delete('/delete/article/3', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.client.logout()
+        run_commit_hooks()
+        self.assertNotCached('/tag/tag3')
+
+    def test_author_purge(self):
+        url = self.article1.get_absolute_url()
+        self.assertNotCached(url)
+        self.assertNotCached('/')
+        purge_author_pages(self.author1)
+        run_commit_hooks()
+        self.assertNotCached(url)
+        self.assertCached('/')
+
+    def test_purge_while_rendering(self):
+        request = RequestFactory().get('/')
+        snapshot = page_cache.snapshot()
+        # 渲染期间文章被修改，页面内容可能是旧的，不能写入缓存
+        page_cache.purge('list')
+        page_cache.set(request, HttpResponse('stale'), ['site', 'list'], snapshot)
+        self.assertIsNone(page_cache.get(request))
+
+        snapshot = page_cache.snapshot()
+        page_cache.set(request, HttpResponse('fresh'), ['site', 'list'], snapshot)
+        self.assertEqual(page_cache.get(request)[0].content, b'fresh')
+
+
+@override_settings(PAGE_CACHE_ENABLED=False)
+class FragmentCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        init_data(cls)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fragment_follows_updated_time(self):
+        self.client.get('/')
+        # 直接修改数据库，updated_time 没有变化，继续使用缓存的片段
+        article = Article.posted.first()
+        tag = article.tags.first()
+        Tag.objects.filter(pk=tag.pk).update(name='fragment')
+        self.assertNotContains(self.client.get('/'), 'fragment')
+
+        # 不经过表单修改标签或者标签改名，updated_time 都会更新
+        tag.name = 'fragment'
+        tag.save()
+        self.assertContains(self.client.get('/'), 'fragment')
+        article.tags.set([Tag.objects.create(name='tag-set')])
+        self.assertContains(self.client.get('/'), 'tag-set')
+
+    def test_fragment_follows_related_changes(self):
+        list_url = '/user/loo1'
+        self.client.get(list_url)
+        self.client.get(self.article1.get_absolute_url())
+
+        # 在后台或者脚本中修改文章
+        article = Article.objects.get(pk=1)
+        article.article_title = 'new title'
+        article.save()
+        self.assertContains(self.client.get(list_url), 'new title')
+
+        # 作者改名之后页面的地址也变了，片段中的作者链接需要更新
+        author = Author.objects.get(pk=1)
+        author.username = 'loorenamed'
+        author.save()
+        article.refresh_from_db()
+        self.assertContains(self.client.get(article.get_absolute_url()), '/user/loorenamed')
+
+        # 删除标签不会发送 m2m_changed
+        tag = Tag.objects.get(name='tag1')
+        tag_url = tag.get_absolute_url()
+        self.assertContains(self.client.get(article.get_absolute_url()), tag_url)
+        tag.delete()
+        self.assertNotContains(self.client.get(article.get_absolute_url()), tag_url)
+
+    def test_edit_link_not_cached(self):
+        url = '/user/loo1'
+        edit_url = '/edit/article/loo1/article1.html'
+        self.assertNotContains(self.client.get(self.article1.get_absolute_url()), edit_url)
+        self.client.login(username='loo1', password='A1B2C34G56LZ')
+        self.assertContains(self.client.get(self.article1.get_absolute_url()), edit_url)
+        self.client.logout()
+
+        author = Author.objects.get(pk=1)
+        author.is_staff = True
+        author.save()
+        self.client.login(username='loo1', password='A1B2C34G56LZ')
+        self.assertContains(self.client.get(url), edit_url)
+        self.client.logout()
+        self.assertNotContains(self.client.get('/archives/2018/'), edit_url)
+
+    def test_views_not_cached(self):
+        article_view_counter.clear()
+        self.addCleanup(article_view_counter.clear)
+        url = self.article1.get_absolute_url()
+        self.client.get(url)
+        res = self.client.get(url)
+        self.assertContains(res, '&times;%d' % (self.article1.views + 2))
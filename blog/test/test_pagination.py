@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_pagination.py
+@Version : v1.0
+@History :
+@Desc    : 游标分页
+"""
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from blog.lib.paginator import InvalidCursor, KeysetPaginator
+from blog.models import Article
+from .init_data import init_data
+
+
+class KeysetPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        init_data(cls)
+
+    def setUp(self):
+        self.queryset = Article.posted.all()
+        self.expected = list(self.queryset.order_by('-created_time', '-pk'))
+
+    def test_walk_forward_and_back(self):
+        paginator = KeysetPaginator(self.queryset, 10)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [10, 10, 7])
+        self.assertEqual([obj for page in pages for obj in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+        self.assertIsNone(pages[-1].next_cursor)
+
+        previous = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual(previous.object_list, pages[1].object_list)
+        self.assertTrue(previous.has_next())
+        first = paginator.page(previous.previous_cursor)
+        self.assertEqual(first.object_list, pages[0].object_list)
+        self.assertFalse(first.has_previous())
+
+    def test_ties_on_created_time(self):
+        # created_time 相同的文章按 id 区分，不会重复也不会遗漏
+        Article.objects.update(created_time=self.article1.created_time)
+        paginator = KeysetPaginator(self.queryset, 4)
+        page, seen = paginator.page(), []
+        seen.extend(page)
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            seen.extend(page)
+        self.assertEqual([a.pk for a in seen], sorted((a.pk for a in self.expected), reverse=True))
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(self.queryset, 10)
+        for cursor in ('abc', 'W10', paginator.encode_cursor(self.article1, 'x')):
+            with self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+
+class CursorViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        init_data(cls)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_category_uses_cursor(self):
+        res = self.client.get('/category/category1')
+        self.assertIsNone(res.context['paginator'])
+        self.assertEqual(len(res.context['article_list']), 20)
+        self.assertContains(res, '共 27 篇文章')
+        next_cursor = res.context['page_obj'].next_cursor
+        self.assertContains(res, '?cursor=%s' % next_cursor)
+
+        res = self.client.get('/category/category1', {'cursor': next_cursor})
+        self.assertEqual(len(res.context['article_list']), 7)
+        self.assertFalse(res.context['page_obj'].has_next())
+
+    def test_index_cursor_optional(self):
+        res = self.client.get('/')
+        self.assertIsNotNone(res.context['paginator'])
+        res = self.client.get('/', {'cursor': ''})
+        self.assertIsNone(res.context['paginator'])
+        self.assertEqual(len(res.context['article_list']), 10)
+
+    def test_invalid_cursor_404(self):
+        self.assertEqual(self.client.get('/', {'cursor': 'abc'}).status_code, 404)
+        self.assertEqual(self.client.get('/tag/tag1', {'cursor': 'abc'}).status_code, 404)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_query_count.py
+@Version : v1.0
+@History :
+@Desc    : 列表页的查询次数不应随文章数量增长
+"""
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from blog.models import Article, Tag
+from .init_data import init_data
+
+
+class QueryCountTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        init_data(cls)
+
+    def add_articles(self, count=15):
+        start = Article.objects.count() + 1
+        tags = list(Tag.objects.all())
+        for i in range(start, start + count):
+            article = Article.objects.create(
+                id=i, article_link=f'article{i}', article_title=f'django 使用分享{i}',
+                author_id=i % 3 + 1, category_id=1, content_md='content',
+                content_html='<p>content</p>', views=0, status='p')
+            article.tags.add(*tags[:i % 3 + 1])
+
+    def assertConstantQueries(self, url, num):
+        cache.clear()
+        with self.assertNumQueries(num):
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.add_articles()
+        cache.clear()
+        with self.assertNumQueries(num):
+            self.client.get(url)
+
+    def test_index(self):
+        # categories, COUNT, articles + author + category, tags
+        self.assertConstantQueries('/', 4)
+
+    def test_index_cursor(self):
+        # categories, articles + author + category, tags
+        self.assertConstantQueries('/?cursor=', 3)
+
+    def test_tag_filter(self):
+        # categories, tag, articles + author
+        self.assertConstantQueries('/tag/tag1', 3)
+
+    def test_category_filter(self):
+        # categories, category, articles + author
+        self.assertConstantQueries('/category/category1', 3)
+
+    def test_user_info(self):
+        # categories, author, articles
+        self.assertConstantQueries('/user/loo1', 3)
+
+    def test_archives(self):
+        # categories, articles + author
+        self.assertConstantQueries('/archives/', 2)
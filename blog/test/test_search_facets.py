@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_search_facets.py
+@Version : v1.0
+@History :
+@Desc    : 按标签、分类和年份统计搜索结果
+"""
+
+import datetime
+
+from django.urls import reverse
+from django.utils.timezone import make_aware
+
+from blog.models import Article
+from .test_whoosh_backend import RamIndexTestCase
+
+
+class FacetTest(RamIndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend.update(self.index, self.index.index_queryset())
+        self.backend.result_cache.clear()
+        self.backend.facet_cache.clear()
+
+    def search(self, query='django', **kwargs):
+        return self.backend.search(query, facets={'tags': {}, 'category': {}}, date_facets={'created_time': {
+            'start_date': make_aware(datetime.datetime(2017, 1, 1)),
+            'end_date': make_aware(datetime.datetime(2020, 1, 1)),
+            'gap_by': 'year', 'gap_amount': 1}}, query_facets=[('author', 'loo1')], **kwargs)['facets']
+
+    def test_facet_counts(self):
+        facets = self.search()
+        self.assertEqual(facets['fields']['category'], [('category1', 27)])
+        # 草稿 10、20、30 不在索引中
+        self.assertEqual(facets['fields']['tags'][:2], [('tag1', 5), ('tag0', 4)])
+        self.assertEqual(sum(count for _tag, count in facets['fields']['tags']), 27)
+        self.assertEqual([(start.year, count) for start, count in facets['dates']['created_time']],
+                         [(2018, 15), (2019, 12)])
+        self.assertEqual(facets['queries'], {'author_loo1': 9})
+
+        facets = self.search(narrow_queries={'tags:tag1'})
+        self.assertEqual(facets['fields']['tags'], [('tag1', 5)])
+
+    def test_cached_per_generation(self):
+        self.search()
+        self.search(narrow_queries={'tags:tag1'})
+        # 字段值每个 generation 只读取一次
+        self.assertEqual(self.backend.facet_cache.stats()['misses'], 2)
+        self.assertEqual(self.backend.facet_cache.stats()['hits'], 2)
+        self.search()
+        self.assertEqual(self.backend.result_cache.stats()['hits'], 1)
+
+        self.backend.remove(self.article1)
+        self.assertEqual(dict(self.search()['fields']['tags'])['tag1'], 4)
+        self.assertEqual(self.backend.facet_cache.stats()['misses'], 4)
+
+    def test_search_view(self):
+        url = reverse('blog:haystack_search')
+        facets = self.client.get(url, {'q': 'django'}).context['facets']
+        self.assertEqual(facets['fields']['tags'][0], ('tag1', 5))
+        self.assertEqual(dict((start.year, count) for start, count in facets['dates']['created_time']),
+                         {2018: 15, 2019: 12})
+
+        response = self.client.get(url, {'q': 'django', 'selected_facets': ['year:2019', 'tags:tag1']})
+        self.assertEqual(sorted(int(result.pk) for result in response.context['page'].object_list), [8, 22])
+        self.assertEqual(response.context['selected_facets'], [('year', 2019), ('tags', 'tag1')])
+        self.assertContains(response, 'selected_facets=tags%3Atag1')
+
+        # 格式不对的分面被忽略
+        response = self.client.get(url, {'q': 'django', 'selected_facets': ['year:abc', 'views:1']})
+        self.assertEqual(response.context['paginator'].count, Article.posted.count())
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_search_indexes.py
+@Version : v1.0
+@History :
+@Desc    : ArticleIndex 的文档内容和字段
+"""
+
+import datetime
+
+from django.utils.timezone import make_aware
+from haystack.query import SearchQuerySet
+
+from blog.models import Article
+from .test_whoosh_backend import RamIndexTestCase
+
+
+class ArticleIndexTest(RamIndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend.update(self.index, self.index.index_queryset())
+
+    def test_prepare(self):
+        doc = self.index.full_prepare(self.article8)
+        self.assertEqual(doc['text'], 'django 使用分享8\ntag1\n我美丽的新娘\nloo2')
+        self.assertEqual(doc['tags'], ['tag1'])
+        self.assertEqual(doc['author'], 'loo2')
+        self.assertEqual(doc['category'], 'category1')
+        self.assertEqual(doc['created_time'], self.article8.created_time)
+
+    def test_constant_queries(self):
+        # 文章、标签两次查询，和文章数量无关
+        with self.assertNumQueries(2):
+            for obj in self.index.index_queryset():
+                self.index.full_prepare(obj)
+
+    def search(self, **filters):
+        return sorted(int(result.pk) for result in SearchQuerySet().filter(content='django', **filters))
+
+    def test_filter_fields(self):
+        self.assertEqual(self.search(tags='tag1'), [1, 8, 15, 22, 29])
+        self.assertEqual(self.search(author='loo1'), [1, 4, 7, 13, 16, 19, 22, 25, 28])
+        self.assertEqual(len(self.search(category='category1')), 27)
+        # created_time 是 2018 年或者 2019 年
+        since = make_aware(datetime.datetime(2019, 1, 1))
+        self.assertEqual(self.search(created_time__gte=since),
+                         sorted(Article.posted.filter(created_time__gte=since).values_list('pk', flat=True)))
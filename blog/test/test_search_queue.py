@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_search_queue.py
+@Version : v1.0
+@History :
+@Desc    : 队列化的搜索索引更新
+"""
+
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from blog.models import Article, Author, Category, IndexQueue, Tag
+from blog.search_queue import drain_queue
+from blog.whoosh_cn_backend import WhooshSearchBackend
+from .init_data import init_data
+
+
+@mock.patch.object(WhooshSearchBackend, 'apply_batch')
+class SearchQueueTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        init_data(cls)
+
+    def setUp(self):
+        IndexQueue.objects.all().delete()
+
+    def queued(self):
+        return list(IndexQueue.objects.values_list('identifier', 'action'))
+
+    def test_save_and_delete_are_queued(self, apply_batch):
+        article = Article.objects.get(pk=1)
+        article.article_title = 'new title'
+        article.save()
+        Article.objects.get(pk=2).delete()
+        self.assertEqual(self.queued(), [('blog.article.1', 'u'), ('blog.article.2', 'r')])
+        apply_batch.assert_not_called()
+
+    def test_updates_are_coalesced(self, apply_batch):
+        article = Article.objects.get(pk=1)
+        for i in range(3):
+            article.content_md = f'content {i}'
+            article.save()
+        IndexQueue.objects.create(identifier='blog.article.3', action='u')
+        Article.objects.get(pk=3).delete()
+        # article10 是草稿，不应该出现在索引中
+        IndexQueue.objects.create(identifier='blog.article.10', action='u')
+
+        self.assertEqual(drain_queue(), 6)
+        self.assertEqual(apply_batch.call_count, 1)
+        index, objects, remove_identifiers = apply_batch.call_args[0]
+        self.assertEqual(objects, [article])
+        self.assertEqual(sorted(remove_identifiers), ['blog.article.10', 'blog.article.3'])
+        self.assertFalse(IndexQueue.objects.exists())
+
+    def test_unchanged_save_is_skipped(self, apply_batch):
+        article = Article.objects.get(pk=1)
+        article.save()
+        article.updated_time = timezone.now()
+        article.save()
+        Article.objects.get(pk=4).save(update_fields=['views'])
+        self.assertEqual(self.queued(), [])
+
+    def test_drafts_are_not_indexed(self, apply_batch):
+        draft = Article.objects.get(pk=10)
+        draft.content_md = 'autosave'
+        draft.save()
+        draft.tags.add(self.tag1)
+        self.assertEqual(self.queued(), [])
+
+    def test_unpublish_removes_document(self, apply_batch):
+        article = Article.objects.get(pk=1)
+        article.status = 'd'
+        article.save()
+        self.assertEqual(self.queued(), [('blog.article.1', 'r')])
+
+    def test_publish_and_tags_change(self, apply_batch):
+        article = Article.objects.get(pk=10)
+        article.status = 'p'
+        article.save()
+        Article.objects.get(pk=2).tags.add(self.tag1)
+        self.tag3.article_set.add(Article.objects.get(pk=4))
+        self.assertEqual(self.queued(), [('blog.article.10', 'u'), ('blog.article.2', 'u'),
+                                         ('blog.article.4', 'u')])
+
+    def test_reverse_clear(self, apply_batch):
+        # tag.article_set.clear() 时 pk_set 为 None，清除之前记下了文章
+        self.tag1.article_set.clear()
+        self.assertEqual(sorted(self.queued()), [('blog.article.1', 'u'), ('blog.article.15', 'u'),
+                                                 ('blog.article.22', 'u'), ('blog.article.29', 'u'),
+                                                 ('blog.article.8', 'u')])
+
+    def test_related_renamed(self, apply_batch):
+        # 只保存登录时间之类的字段，不需要重新索引
+        Author.objects.get(pk=2).save(update_fields=['last_login'])
+        tag = Tag.objects.get(name='tag2')
+        tag.save()
+        self.assertEqual(self.queued(), [])
+
+        # 草稿 30 不在索引中
+        tag.name = 'tagtwo'
+        tag.save()
+        self.assertEqual(sorted(self.queued()), [('blog.article.16', 'u'), ('blog.article.2', 'u'),
+                                                 ('blog.article.23', 'u'), ('blog.article.9', 'u')])
+
+        IndexQueue.objects.all().delete()
+        author = Author.objects.get(pk=3)
+        author.username = 'loo33'
+        author.save()
+        category = Category.objects.get(pk=1)
+        category.name = 'category'
+        category.save()
+        self.assertEqual(len(self.queued()), 9 + 27)
+
+    def test_process_search_queue_command(self, apply_batch):
+        IndexQueue.objects.create(identifier='blog.article.5', action='u')
+        call_command('process_search_queue', stdout=mock.Mock())
+        self.assertEqual(apply_batch.call_count, 1)
+        self.assertFalse(IndexQueue.objects.exists())
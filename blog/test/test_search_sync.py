@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_search_sync.py
+@Version : v1.0
+@History :
+@Desc    : 按水位增量同步搜索索引
+"""
+
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+
+from blog.models import Article, Author, Tag
+from blog.search_sync import get_watermark, sync_index
+from .test_whoosh_backend import RamIndexTestCase
+
+
+class SyncIndexTest(RamIndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        settings_override = override_settings(HAYSTACK_WATERMARK_FILE=os.path.join(tmp_dir, 'watermark'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def search(self, query):
+        return sorted(int(result.pk) for result in self.backend.search(query)['results'])
+
+    def test_sync(self):
+        # 没有水位时同步所有已发布的文章
+        self.assertIsNone(get_watermark())
+        self.assertEqual(sync_index(), (27, 0))
+        watermark = get_watermark()
+        self.assertIsNotNone(watermark)
+
+        # 不通过信号修改数据库，模拟索引队列丢失的情况
+        Article.objects.filter(pk=1).update(content_md='我美丽的新娘', updated_time=timezone.now())
+        Article.objects.filter(pk=2).update(status='d')
+        Article.objects.filter(pk=3).delete()
+        self.backend.update(self.index, [self.article10])
+
+        self.assertEqual(sync_index(), (1, 3))
+        self.assertGreater(get_watermark(), watermark)
+        self.assertEqual(self.search('新娘'), [1, 8, 16, 24])
+        self.assertEqual(sorted(map(int, self.backend.indexed_ids(Article))),
+                         [1] + [pk for pk in range(4, 30) if pk % 10])
+
+        # 没有新的变化；默认从水位之前 60 秒开始，刚刚修改的文章会再索引一次
+        self.assertEqual(sync_index(), (1, 0))
+        self.assertEqual(sync_index(overlap=0), (0, 0))
+
+    def test_edits_outside_form(self):
+        sync_index()
+        # 在后台或者脚本中修改文章、标签，以及标签、作者改名，都会更新 updated_time
+        article = Article.objects.get(pk=4)
+        article.article_title = 'new title'
+        article.save()
+        self.assertEqual(sync_index(overlap=0), (1, 0))
+
+        Article.objects.get(pk=5).tags.add(self.tag3)
+        self.assertEqual(sync_index(overlap=0), (1, 0))
+
+        tag = Tag.objects.get(name='tag2')
+        tag.name = 'tagtwo'
+        tag.save()
+        self.assertEqual(sync_index(overlap=0), (4, 0))
+        self.assertEqual(self.search('tagtwo'), [2, 9, 16, 23])
+
+        author = Author.objects.get(pk=2)
+        author.username = 'loo22'
+        author.save()
+        self.assertEqual(sync_index(overlap=0), (9, 0))
+
+        Article.objects.get(pk=6).save(update_fields=['views'])
+        author.save(update_fields=['last_login'])
+        self.assertEqual(sync_index(overlap=0), (0, 0))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('sync_search_index', full=True, stdout=out)
+        self.assertIn('更新 27 个、删除 0 个', out.getvalue())
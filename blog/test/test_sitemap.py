@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_sitemap.py
+@Version : v1.0
+@History :
+@Desc    : 分片的 sitemap
+"""
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils.http import http_date
+
+from blog.models import Article
+from blog.views import BlogSitemap
+from .init_data import init_data
+
+
+class SitemapTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        init_data(cls)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index(self):
+        with mock.patch.object(BlogSitemap, 'limit', 10):
+            res = self.client.get('/sitemap.xml')
+        content = res.content.decode()
+        self.assertIn('<sitemapindex', content)
+        for page in (1, 2, 3):
+            self.assertIn('http://testserver/sitemap-%d.xml' % page, content)
+        self.assertNotIn('sitemap-4.xml', content)
+
+    def test_shards(self):
+        urls = []
+        with mock.patch.object(BlogSitemap, 'limit', 10):
+            for page in (1, 2, 3):
+                with self.assertNumQueries(1):
+                    res = self.client.get('/sitemap-%d.xml' % page)
+                    content = b''.join(res.streaming_content).decode()
+                urls.extend(line for line in content.splitlines() if line.startswith('<url>'))
+            self.assertEqual(self.client.get('/sitemap-4.xml').status_code, 404)
+
+        self.assertEqual(len(urls), 27)
+        self.assertIn('<loc>http://testserver/article/loo1/article1.html</loc><lastmod>2019-09-10</lastmod>', urls[0])
+
+    def test_cached_with_last_modified(self):
+        res = self.client.get('/sitemap-1.xml')
+        content = b''.join(res.streaming_content)
+        with self.assertNumQueries(0):
+            res = self.client.get('/sitemap-1.xml')
+        self.assertEqual(res.content, content)
+        last_modified = http_date(Article.posted.latest('updated_time').updated_time.timestamp())
+        self.assertEqual(res['Last-Modified'], last_modified)
+
+        res = self.client.get('/sitemap-1.xml', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(res.status_code, 304)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_sqlite_fts_backend.py
+@Version : v1.0
+@History :
+@Desc    : SQLite FTS5 搜索后端
+"""
+
+from django.test import TestCase
+from django.urls import reverse
+from haystack import connections
+from haystack.query import SearchQuerySet
+
+from blog.models import Article
+from .init_data import init_data
+
+
+class SQLiteFTSBackendTest(TestCase):
+    """使用内存中的 SQLite 数据库"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.connection_info = connections.connections_info['default']
+        connections.connections_info['default'] = {
+            'ENGINE': 'blog.sqlite_fts_backend.SQLiteFTSEngine', 'PATH': ':memory:'}
+        connections.reload('default')
+
+    @classmethod
+    def tearDownClass(cls):
+        connections.connections_info['default'] = cls.connection_info
+        connections.reload('default')
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        init_data(cls)
+
+    def setUp(self):
+        self.backend = connections['default'].get_backend()
+        self.index = connections['default'].get_unified_index().get_index(Article)
+        self.backend.clear()
+        self.backend.update(self.index, Article.posted.all())
+
+    def search(self, query):
+        return sorted(int(result.pk) for result in SearchQuerySet().auto_query(query))
+
+    def test_search(self):
+        # 标题是 "django 使用分享<i>"，草稿(10、20、30)不在索引中
+        self.assertEqual(len(self.search('django')), 27)
+        self.assertEqual(self.search('使用分享12'), [12])
+        self.assertEqual(self.search('新娘'), [8, 16, 24])
+        self.assertEqual(self.search('新娘 -使用分享16'), [8, 24])
+        self.assertEqual(self.search('"走过你身旁"'), [1, 9, 17, 25])
+        self.assertEqual(self.search('不存在'), [])
+
+    def test_update_and_remove(self):
+        self.backend.remove(self.article8)
+        self.assertEqual(self.search('新娘'), [16, 24])
+
+        article = Article.objects.get(pk=1)
+        article.content_md = '我美丽的新娘'
+        self.backend.update(self.index, [article])
+        self.assertEqual(self.search('新娘'), [1, 16, 24])
+
+        self.backend.clear(models=[Article])
+        self.assertEqual(self.search('django'), [])
+
+    def test_pagination_and_hits(self):
+        sqs = SearchQuerySet().auto_query('django')
+        self.assertEqual(sqs.count(), 27)
+        self.assertEqual(len(sqs[5:10]), 5)
+        self.assertEqual(len(SearchQuerySet().all()), 27)
+
+    def test_highlight(self):
+        result = self.backend.search('新娘', highlight=True)['results'][0]
+        self.assertIn('<em>新娘</em>', result.highlighted['text'][0])
+
+    def test_more_like_this(self):
+        results = self.backend.more_like_this(self.article8)['results']
+        pks = [int(result.pk) for result in results]
+        self.assertNotIn(8, pks)
+        # 内容完全相同的文章最相似
+        self.assertEqual(sorted(pks[:2]), [16, 24])
+
+    def test_search_view_ignores_facets(self):
+        response = self.client.get(reverse('blog:haystack_search'),
+                                   {'q': 'django', 'selected_facets': ['year:2019', 'tags:tag1']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['paginator'].count, 27)
+        self.assertEqual(response.context['selected_facets'], [])
@@ -10,17 +10,27 @@
 @Desc    :
 """
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
 
-from .init_data import init_data
+from blog.lib.tag_cloud import get_font_sizes
+from blog.context_processors import category_nav
+from blog.lib.navigation import CategoryNav
+from blog.models import Article, Category
+from .init_data import init_data, run_commit_hooks
 
 
+# 这里测试的是视图本身，不经过整页缓存
+@override_settings(PAGE_CACHE_ENABLED=False)
 class TagFilterTest(TestCase):
 
     @classmethod
     def setUpTestData(cls):
         init_data(cls)
 
+    def setUp(self):
+        cache.clear()
+
     def test_get_tag_name(self):
         res = self.client.get('/tag/tag1')
         self.assertEqual(res.status_code, 200)
@@ -38,3 +48,97 @@ class TagFilterTest(TestCase):
         # tag_dict: {'tag0': 3, 'tag1': 5, 'tag2': 5, 'tag3': 3, ...}
         sorted_tag_dict = sorted(res.context['tag_dict'].items(), key=lambda x: x[-1])
         self.assertTrue(sorted_tag_dict[-1][0] in ['tag1', 'tag2'])
+
+    def test_tags_single_query(self):
+        # categories, tag counts
+        with self.assertNumQueries(2):
+            self.client.get('/tags/')
+        # 标签云和导航栏中的分类都已经缓存
+        with self.assertNumQueries(0):
+            self.client.get('/tags/')
+
+    def test_tag_cloud_only_counts_published(self):
+        for article in Article.objects.filter(tags=self.tag1):
+            article.status = 'd'
+            article.save()
+        res = self.client.get('/tags/')
+        self.assertNotIn('tag1', res.context['tag_dict'])
+        self.assertIn('tag6', res.context['tag_dict'])
+
+    def test_tag_cloud_invalidation(self):
+        self.client.get('/tags/')
+        self.article3.tags.add(self.tag6)
+        # 事务提交之后缓存才失效，避免并发的请求用提交之前的数据重新填充
+        with self.assertNumQueries(0):
+            self.client.get('/tags/')
+        run_commit_hooks()
+        with self.assertNumQueries(1):
+            res = self.client.get('/tags/')
+        self.assertIn('tag6', res.context['tag_dict'])
+        # 修改浏览量之类的字段不会使缓存失效
+        article = Article.objects.get(pk=4)
+        article.views += 1
+        article.save()
+        with self.assertNumQueries(0):
+            self.client.get('/tags/')
+
+
+class FontSizeTest(SimpleTestCase):
+
+    def test_empty(self):
+        self.assertEqual(get_font_sizes({}), {})
+
+    def test_same_count(self):
+        self.assertEqual(get_font_sizes({'a': 3, 'b': 3}), {'a': 4, 'b': 4})
+
+    def test_two_counts(self):
+        self.assertEqual(get_font_sizes({'a': 1, 'b': 9, 'c': 1}), {'a': 3, 'b': 5, 'c': 3})
+
+    def test_range(self):
+        sizes = get_font_sizes({'t%d' % i: i for i in range(1, 16)})
+        self.assertEqual(sizes['t1'], 1)
+        self.assertEqual(sizes['t15'], 8)
+        ordered_sizes = [sizes['t%d' % i] for i in range(1, 16)]
+        self.assertEqual(ordered_sizes, sorted(ordered_sizes))
+        self.assertTrue(all(1 <= size <= 8 for size in sizes.values()))
+
+
+class CategoryNavTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        init_data(cls)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_lazy(self):
+        # 模板中没有用到分类的响应(归档页中按年加载的文章列表)不会查询分类
+        with self.assertNumQueries(1):
+            self.client.get('/archives/2018/')
+        with self.assertNumQueries(1):
+            category_nav.get_categories()
+
+    def test_invalidation(self):
+        self.assertEqual([(c.name, c.article_count) for c in category_nav.get_categories()], [('category1', 27)])
+        Category.objects.create(name='category2')
+        # 事务提交之后才失效，否则并发的请求会把提交之前的分类一直留在进程中
+        self.assertEqual([c.name for c in category_nav.get_categories()], ['category1'])
+        run_commit_hooks()
+        self.assertEqual([c.name for c in category_nav.get_categories()], ['category1', 'category2'])
+
+        article = Article.objects.get(pk=10)
+        article.status = 'p'
+        article.save()
+        run_commit_hooks()
+        self.assertEqual(category_nav.get_categories()[0].article_count, 28)
+        with self.assertNumQueries(0):
+            category_nav.get_categories()
+
+    def test_invalidation_across_processes(self):
+        # 每个进程有自己的 CategoryNav，通过共享缓存中的版本号得知失效
+        other_process = CategoryNav(Category)
+        self.assertEqual(len(other_process.get_categories()), 1)
+        Category.objects.create(name='category2')
+        run_commit_hooks()
+        self.assertEqual(len(other_process.get_categories()), 2)
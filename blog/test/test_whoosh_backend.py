@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@File    : test_whoosh_backend.py
+@Version : v1.0
+@History :
+@Desc    : whoosh 搜索后端
+"""
+
+import itertools
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from haystack import connections
+from haystack.query import SearchQuerySet
+import jieba
+from whoosh.collectors import TimeLimit, TopCollector
+from whoosh.fields import ID, TEXT, Schema
+from whoosh.filedb.filestore import RamStorage
+from whoosh.query import Term
+
+from blog.models import Article
+from blog.search_rebuild import rebuild_index, split_pks
+from blog.whoosh_cn_backend import DeadlineCollector, FieldCorrector, SearcherManager
+from .init_data import init_data
+
+
+class SearcherManagerTest(SimpleTestCase):
+
+    def setUp(self):
+        self.index = RamStorage().create_index(Schema(id=ID(stored=True, unique=True), text=TEXT))
+        self.add_document('1')
+        self.manager = SearcherManager(self.index)
+
+    def add_document(self, doc_id):
+        writer = self.index.writer()
+        writer.update_document(id=doc_id, text='hello world')
+        writer.commit()
+
+    def test_shared_until_commit(self):
+        with self.manager.searcher() as first:
+            with self.manager.searcher() as second:
+                self.assertIs(first, second)
+        with self.manager.searcher() as searcher:
+            self.assertIs(searcher, first)
+            self.assertEqual(searcher.doc_count(), 1)
+
+        self.add_document('2')
+        with self.manager.searcher() as searcher:
+            self.assertIsNot(searcher, first)
+            self.assertEqual(searcher.doc_count(), 2)
+        # 没有正在使用的搜索时，旧的 searcher 在切换时就被关闭了
+        self.assertTrue(first.is_closed)
+        self.assertFalse(searcher.is_closed)
+
+    def test_in_flight_searcher_kept_open(self):
+        old = self.manager.acquire()
+        self.add_document('2')
+        with self.manager.searcher() as new:
+            self.assertIsNot(new, old)
+        # 旧的 searcher 还在使用中，释放之后才关闭
+        self.assertFalse(old.is_closed)
+        self.assertEqual(old.doc_count(), 1)
+        self.manager.release(old)
+        self.assertTrue(old.is_closed)
+
+    def test_invalidate(self):
+        with self.manager.searcher() as first:
+            pass
+        self.manager.invalidate()
+        self.assertTrue(first.is_closed)
+        with self.manager.searcher() as searcher:
+            self.assertIsNot(searcher, first)
+
+    def test_recreated_index(self):
+        with self.manager.searcher() as first:
+            pass
+        # 其他进程删除并重建了索引，generation 又从 0 开始
+        storage = self.index.storage
+        storage.clean()
+        self.index = storage.create_index(first.schema)
+        self.add_document('2')
+        with self.manager.searcher() as searcher:
+            self.assertEqual(searcher.reader().generation(), first.reader().generation())
+            self.assertIsNot(searcher, first)
+            self.assertEqual([doc['id'] for doc in searcher.documents()], ['2'])
+
+
+class DeadlineCollectorTest(SimpleTestCase):
+
+    def setUp(self):
+        ix = RamStorage().create_index(Schema(id=ID(stored=True), text=TEXT))
+        with ix.writer() as writer:
+            for i in range(10):
+                writer.add_document(id=str(i), text='hello')
+        self.searcher = ix.searcher()
+        self.addCleanup(self.searcher.close)
+
+    @mock.patch('blog.whoosh_cn_backend.time.monotonic')
+    def test_partial(self, monotonic):
+        # 第一个匹配之后每个匹配检查一次时间，第 4 次检查时超时
+        monotonic.side_effect = itertools.count()
+        collector = DeadlineCollector(TopCollector(limit=100), deadline=3, check_every=1)
+        with self.assertRaises(TimeLimit):
+            self.searcher.search_with_collector(Term('text', 'hello'), collector)
+        self.assertTrue(collector.timedout)
+        self.assertEqual(len(collector.results().top_n), 4)
+
+    def test_first_match_collected(self):
+        # 开始收集时已经超时，也至少返回一个结果
+        collector = DeadlineCollector(TopCollector(limit=100), deadline=0, check_every=1)
+        with self.assertRaises(TimeLimit):
+            self.searcher.search_with_collector(Term('text', 'hello'), collector)
+        self.assertEqual(len(collector.results().top_n), 1)
+
+    def test_in_time(self):
+        collector = DeadlineCollector(TopCollector(limit=100), deadline=time.monotonic() + 60)
+        self.searcher.search_with_collector(Term('text', 'hello'), collector)
+        self.assertFalse(collector.timedout)
+        self.assertEqual(len(collector.results()), 10)
+
+
+class RamIndexTestCase(TestCase):
+    """使用内存中的 whoosh 索引"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.connection_info = connections.connections_info['default']
+        connections.connections_info['default'] = {
+            'ENGINE': 'blog.whoosh_cn_backend.WhooshEngine', 'STORAGE': 'ram'}
+        connections.reload('default')
+
+    @classmethod
+    def tearDownClass(cls):
+        connections.connections_info['default'] = cls.connection_info
+        connections.reload('default')
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        init_data(cls)
+
+    def setUp(self):
+        self.backend = connections['default'].get_backend()
+        self.index = connections['default'].get_unified_index().get_index(Article)
+        self.backend.clear()
+
+
+class ResultCacheTest(RamIndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend.update(self.index, Article.posted.all())
+        self.backend.result_cache.clear()
+        # 同一个内存索引的缓存是进程共享的，可能已经由其他测试创建
+        self.backend.result_cache.maxsize = 2
+        self.backend.narrow_cache.clear()
+
+    def search(self, query):
+        return [result.pk for result in self.backend.search(query, end_offset=5)['results']]
+
+    def test_hits_and_misses(self):
+        first = self.search('django')
+        self.assertEqual(self.search(' django  '), first)
+        self.assertEqual(self.backend.result_cache.stats()['hits'], 1)
+        self.assertEqual(self.backend.result_cache.stats()['misses'], 1)
+
+        # 容量上限为 2
+        self.search('使用')
+        self.search('分享')
+        self.assertEqual(self.backend.result_cache.stats()['size'], 2)
+
+    def test_commit_invalidates(self):
+        first = self.search('django')
+        self.backend.remove(self.article4)
+        second = self.search('django')
+        self.assertNotIn('4', second)
+        self.assertIn('4', first)
+        self.assertEqual(self.backend.result_cache.stats()['misses'], 2)
+
+    def test_recreated_index(self):
+        self.assertIn('4', self.search('django'))
+        self.assertEqual(self.backend.narrow_cache.stats()['misses'], 1)
+        # 其他进程执行了 rebuild_index：本进程的缓存没有被清空，generation 也相同
+        self.backend.storage.clean()
+        self.backend.index = self.backend.storage.create_index(self.backend.schema)
+        self.backend.update(self.index, Article.posted.exclude(pk=4))
+        self.assertNotIn('4', self.search('django'))
+        self.assertEqual(self.backend.result_cache.stats()['misses'], 2)
+        self.assertEqual(self.backend.narrow_cache.stats()['misses'], 2)
+
+    def test_results_copied(self):
+        first = self.backend.search('django', end_offset=5)['results']
+        first[0].score = None
+        second = self.backend.search('django', end_offset=5)['results']
+        self.assertEqual(self.backend.result_cache.stats()['hits'], 1)
+        self.assertIsNot(second[0], first[0])
+        self.assertEqual(second[0].pk, first[0].pk)
+        self.assertIsNotNone(second[0].score)
+
+    def test_narrow_filter_cached(self):
+        self.search('django')
+        self.search('使用')
+        # 两次搜索的模型过滤条件相同，只计算一次
+        self.assertEqual(self.backend.narrow_cache.stats()['misses'], 1)
+        self.assertEqual(self.backend.narrow_cache.stats()['hits'], 1)
+
+        self.backend.remove(self.article4)
+        self.search('分享')
+        self.assertEqual(self.backend.narrow_cache.stats()['misses'], 2)
+
+    def test_narrow_queries(self):
+        results = self.backend.search('django', end_offset=5, narrow_queries={'id:blog.article.4'})
+        self.assertEqual([result.pk for result in results['results']], ['4'])
+        results = self.backend.search('django', end_offset=5, narrow_queries={'id:blog.article.100'})
+        self.assertEqual(results['hits'], 0)
+
+
+class HighlightTest(RamIndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend.update(self.index, [self.article8])
+
+    def test_highlight(self):
+        result = self.backend.search('新娘', highlight=True)['results'][0]
+        self.assertIn('我美丽的<em>新娘</em>', result.highlighted['text'][0])
+        # 查询中的字段前缀不是需要高亮的词，其他位置的同名单词是
+        self.assertEqual(self.backend._highlight_terms('text:(美丽的新娘) AND Django'),
+                         {'美丽', '新娘', 'django'})
+        self.assertEqual(self.backend._highlight_terms('text author:loo1'), {'text', 'loo1'})
+
+    def test_window(self):
+        self.addCleanup(setattr, self.backend, 'highlight_window', self.backend.highlight_window)
+        self.backend.highlight_window = 100
+        text = '前言' * 1000 + '我美丽的新娘' + '后记' * 1000
+        highlighted = self.backend._highlight(text, {'新娘'})
+        self.assertIn('<em>新娘</em>', highlighted)
+        self.assertLess(len(highlighted), 200)
+        # 前 highlight_scan 个字符中没有出现查询的词，返回开头部分
+        self.assertEqual(self.backend._highlight(text, {'django'}), '前言' * 50)
+        self.assertEqual(self.backend._highlight('<p>django</p>', set()), '&lt;p&gt;django&lt;/p&gt;')
+
+    def test_english_stems(self):
+        self.addCleanup(setattr, self.backend, 'highlight_window', self.backend.highlight_window)
+        self.backend.highlight_window = 100
+        terms = self.backend._highlight_terms('happy easily go')
+        self.assertEqual(terms, {'happi', 'easili', 'go'})
+        text = 'django ' + 'intro ' * 500 + 'we are happy to go there easily'
+        highlighted = self.backend._highlight(text, terms)
+        self.assertIn('<em>happy</em> to <em>go</em> there <em>easily</em>', highlighted)
+        self.assertLess(len(highlighted), 200)
+
+
+class SpellingTest(RamIndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # 分两次提交，得到多个段
+        self.backend.update(self.index, Article.posted.filter(pk__lt=15))
+        self.backend.update(self.index, Article.posted.filter(pk__gte=15))
+
+    def test_same_as_reader_corrector(self):
+        with self.backend.searcher_manager.searcher() as searcher:
+            reader = searcher.reader()
+            expected = reader.corrector('text')
+            corrector = FieldCorrector(reader, 'text')
+            for word in ('djang', 'dajngo', '新狼', '使用', 'loo9', 'xyz'):
+                self.assertEqual(corrector.suggest(word, limit=3), expected.suggest(word, limit=3))
+
+    def test_cached_per_generation(self):
+        self.assertEqual(self.backend.create_spelling_suggestion('djang'), 'django')
+        self.assertEqual(self.backend.create_spelling_suggestion('djang'), 'django')
+        self.assertEqual(self.backend.spelling_cache.stats()['hits'], 1)
+        self.assertEqual(self.backend.corrector_cache.stats()['misses'], 1)
+
+        self.backend.create_spelling_suggestion('dajngo')
+        self.assertEqual(self.backend.corrector_cache.stats()['hits'], 1)
+
+        # 提交之后重新建立
+        self.backend.remove(self.article1)
+        self.backend.create_spelling_suggestion('djang')
+        self.assertEqual(self.backend.corrector_cache.stats()['misses'], 2)
+
+
+class ParallelRebuildTest(RamIndexTestCase):
+
+    def search(self, query):
+        return sorted(result.pk for result in self.backend.search(query)['results'])
+
+    def test_split_pks(self):
+        self.assertEqual(split_pks(Article.posted.all(), 10), [(1, 11, 10), (12, 22, 10), (23, 29, 7)])
+
+    def test_rebuild(self):
+        self.backend.update(self.index, Article.posted.all())
+        expected = [self.search(query) for query in ('django', '新娘', '使用分享12')]
+        # 重建之前索引中多余的文档会被清除
+        self.backend.update(self.index, [self.article10])
+
+        progress = []
+        total = rebuild_index(workers=1, batch_size=7, progress=lambda done, total: progress.append(done))
+        self.assertEqual(total, 27)
+        self.assertEqual(progress, [7, 14, 21, 27])
+        self.assertEqual([self.search(query) for query in ('django', '新娘', '使用分享12')], expected)
+        self.assertEqual(self.backend.index.doc_count(), 27)
+
+    def test_command(self):
+        call_command('rebuild_index_parallel', workers=1, verbosity=0, stdout=StringIO())
+        self.assertEqual(len(self.search('django')), 27)
+
+
+@mock.patch.object(DeadlineCollector, 'check_every', 1)
+class TimeBudgetTest(RamIndexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend.update(self.index, Article.posted.all())
+        self.backend.result_cache.clear()
+        self.backend.budget_stats.clear()
+        self.addCleanup(setattr, self.backend, 'time_limit', self.backend.time_limit)
+
+    def test_no_limit(self):
+        self.backend.time_limit = None
+        results = self.backend.search('django')
+        self.assertFalse(results['partial'])
+        self.assertEqual(results['hits'], 27)
+        self.assertEqual(self.backend.budget_stats.stats(), {})
+
+    def test_in_time(self):
+        self.backend.time_limit = 60
+        self.assertFalse(self.backend.search('django')['partial'])
+        self.assertFalse(self.backend.more_like_this(self.article1)['partial'])
+        self.assertEqual(self.backend.budget_stats.stats(), {
+            'search': {'calls': 1, 'exceeded': 0},
+            'more_like_this': {'calls': 1, 'exceeded': 0},
+        })
+
+    def test_exceeded(self):
+        self.backend.time_limit = 0
+        with self.assertLogs('haystack', 'WARNING'):
+            results = self.backend.search('django')
+        self.assertTrue(results['partial'])
+        # 部分结果不缓存
+        self.assertEqual(self.backend.result_cache.stats()['size'], 0)
+        with self.assertLogs('haystack', 'WARNING'):
+            self.assertTrue(self.backend.more_like_this(self.article1)['partial'])
+        self.assertEqual(self.backend.create_spelling_suggestion('django'), '')
+        self.assertEqual(self.backend.budget_stats.stats(), {
+            'search': {'calls': 1, 'exceeded': 1},
+            'more_like_this': {'calls': 1, 'exceeded': 1},
+            'spelling': {'calls': 1, 'exceeded': 1},
+        })
+
+    def test_search_query_partial(self):
+        self.backend.time_limit = 0
+        sqs = SearchQuerySet().filter(content='django')
+        with self.assertLogs('haystack', 'WARNING'):
+            len(sqs)
+        self.assertTrue(sqs.query.is_partial())
+
+    def test_parse_not_in_budget(self):
+        # 例如 jieba 第一次使用时加载词典
+        parse = self.backend.parser.parse
+        self.backend.time_limit = 0.5
+
+        def slow_parse(*args, **kwargs):
+            time.sleep(0.6)
+            return parse(*args, **kwargs)
+
+        with mock.patch.object(self.backend.parser, 'parse', slow_parse):
+            results = self.backend.search('django')
+        self.assertFalse(results['partial'])
+        self.assertEqual(results['hits'], 27)
+
+    def test_analyzer_warmed_up(self):
+        self.backend.setup()
+        self.assertTrue(jieba.dt.initialized)
@@ -2,39 +2,143 @@
 # -*- coding: utf-8 -*-
 # Author: LooEv
 
+import itertools
+import math
 import os
 from contextlib import suppress
+from xml.sax.saxutils import escape as xml_escape
 
+from django.conf import settings
 from django.core.paginator import Paginator, Page
-from django.views.generic import ListView, FormView, DetailView
+from django.views.generic import ListView, FormView, DetailView, TemplateView, View
 from django.contrib.sitemaps import Sitemap
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import Permission
 from django.contrib.auth.decorators import login_required
 from django.core.mail import send_mail
 from django.urls import reverse
-from django.http import Http404, JsonResponse
+from django.http import Http404, HttpResponse, QueryDict, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from haystack.query import SearchQuerySet
+from haystack.views import FacetedSearchView
 
 from .models import Article, Author, Category, Tag
-from .forms import ArticlePostForm, RegisterForm
+from .forms import ArticlePostForm, ArticleSearchForm, RegisterForm, supports_facets
+from .lib.archives import ArchivesOverview
+from .lib.paginator import CachedCountPaginator, InvalidCursor, KeysetPaginator, KnownCountPaginator
 from .lib.tag_cloud import TagCloud
+from .lib.view_counter import ViewCounter
+from .page_cache import article_page_tags, page_cache, purge_author_pages, purge_pages
 
 DEFAULT_AVATAR_PATH = getattr(Author, '_meta').get_field('avatar').get_default()
 
+article_view_counter = ViewCounter(
+    Article,
+    flush_threshold=getattr(settings, 'VIEW_COUNTER_FLUSH_THRESHOLD', 100),
+    flush_interval=getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 10),
+)
 
-class ArticleListView(ListView):
+
+class PageCacheMixin:
+    """
+    匿名用户的 GET 请求整页缓存(见 blog/page_cache.py)，命中时不再查询数据库和渲染模板。
+    get_page_cache_tags 返回页面依赖的标签，这些标签被清除时页面失效。
+    """
+
+    def get_page_cache_tags(self):
+        return []
+
+    def get_page_cache_extra(self):
+        return None
+
+    def page_cache_hit(self, response, extra):
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if not page_cache.is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+        cached = page_cache.get(request)
+        if cached is not None:
+            response, extra = cached
+            return self.page_cache_hit(response, extra)
+
+        # 必须在查询数据库之前记下，渲染期间发生的清除才能被发现
+        snapshot = page_cache.snapshot()
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        tags = ['site'] + self.get_page_cache_tags()
+        if response.streaming:
+            response.streaming_content = self.cache_streaming_content(
+                request, response, response.streaming_content, tags, snapshot)
+        elif hasattr(response, 'add_post_render_callback'):
+            extra = self.get_page_cache_extra()
+            response.add_post_render_callback(lambda r: page_cache.set(request, r, tags, snapshot, extra))
+        return response
+
+    def cache_streaming_content(self, request, response, streaming_content, tags, snapshot):
+        """流式响应边输出边收集内容，全部输出之后再写入缓存"""
+        chunks = []
+        for chunk in streaming_content:
+            chunks.append(chunk)
+            yield chunk
+        page_cache.set(request, response, tags, snapshot, self.get_page_cache_extra(),
+                       content=b''.join(chunks))
+
+
+class KeysetPaginationMixin:
+    """
+    请求中带有 ?cursor= 参数时使用游标分页(见 KeysetPaginator)，深层页面不再需要 OFFSET；
+    否则使用原来的页码分页。default_to_cursor 为 True 时，没有 ?page= 参数也使用游标分页。
+    """
+    cursor_kwarg = 'cursor'
+    default_to_cursor = False
+
+    def use_cursor(self):
+        params = self.request.GET
+        if self.cursor_kwarg in params:
+            return True
+        return self.default_to_cursor and self.page_kwarg not in params
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg) or None)
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return None, page, page.object_list, page.has_other_pages()
+
+
+class ArticleListView(PageCacheMixin, KeysetPaginationMixin, ListView):
     template_name = 'blog/index.html'
     context_object_name = 'article_list'
-    queryset = Article.posted.all()
+    # 列表页只显示摘要，不加载完整的文章内容
+    queryset = Article.posted.with_relations().defer(*Article.CONTENT_FIELDS)
     paginate_by = 10
     paginate_orphans = 1
     max_display_page_buttons = 10
     half_page_buttons = max_display_page_buttons // 2
+    count_cache_key = 'blog:posted_article_count'
+
+    def get_page_cache_tags(self):
+        return ['list']
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        # 页码分页只需要一个近似的总数，缓存一分钟
+        return CachedCountPaginator(queryset, per_page, cache_key=self.count_cache_key, orphans=orphans,
+                                    allow_empty_first_page=allow_empty_first_page, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         paginator: Paginator = context['paginator']
+        if paginator is None:
+            # 游标分页没有页码
+            return context
         if paginator.num_pages <= self.max_display_page_buttons:
             page_range = paginator.page_range
         else:
@@ -53,16 +157,16 @@ class ArticleListView(ListView):
                     if len(page_range) >= self.max_display_page_buttons:
                         break
             page_range = sorted(page_range)
-            return page_range
 
         context['page_range'] = page_range
         return context
 
 
-class ArticleDetailView(DetailView):
+class ArticleDetailView(PageCacheMixin, DetailView):
     template_name = 'blog/article_detail.html'
     context_object_name = 'article'
     current_article_id = None
+    neighbour_ids = ()
 
     def get_object(self, *args, **kwargs):
         try:
@@ -74,8 +178,8 @@ class ArticleDetailView(DetailView):
             else:
                 queryset = Article.posted
             article = queryset.get(article_link=article_link, author__username=author)
-            article.views += 1
-            article.save()
+            # 浏览量先写入缓冲区，页面上显示的是数据库中的值加上还没写回的增量
+            article.views += article_view_counter.incr(article.id)
             self.current_article_id = article.id
         except Article.DoesNotExist:
             raise Http404("Article does not exist!")
@@ -100,8 +204,22 @@ class ArticleDetailView(DetailView):
                 pass
             context['previous_article'] = previous_article
             context['next_article'] = next_article
+            self.neighbour_ids = [a.pk for a in (previous_article, next_article) if a is not None]
         return context
 
+    def get_page_cache_tags(self):
+        # 上一篇/下一篇文章的标题也显示在页面上
+        return ['article:%s' % pk for pk in [self.object.pk] + self.neighbour_ids] + \
+               ['author:%s' % self.object.author_id]
+
+    def get_page_cache_extra(self):
+        return {'article_id': self.object.pk}
+
+    def page_cache_hit(self, response, extra):
+        # 缓存的页面上显示的浏览量会滞后，但是访问仍然需要计数
+        article_view_counter.incr(extra['article_id'])
+        return response
+
 
 class ArticlePostView(FormView):
     template_name = 'blog/article_post_or_edit.html'
@@ -192,9 +310,10 @@ class UserInfoView(DetailView):
         context = super().get_context_data(**kwargs)
         user = self.request.user
         if user.is_authenticated and user.username == self.user.username:
-            context['article_list'] = self.user.article_set.all()
+            article_list = self.user.article_set.all()
         else:
-            context['article_list'] = self.user.article_set.filter(status='p')
+            article_list = self.user.article_set.filter(status='p')
+        context['article_list'] = article_list.defer(*Article.CONTENT_FIELDS)
         return context
 
 
@@ -221,9 +340,24 @@ class RegisterView(FormView):
         return self.new_user.get_absolute_url()
 
 
-class TagFilterView(ListView):
+class PublishedCountMixin:
+    """标签、分类页面的文章总数直接读取冗余的 article_count 字段，分页时不再 COUNT"""
+    article_count = None
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return KnownCountPaginator(queryset, per_page, count=self.article_count, orphans=orphans,
+                                   allow_empty_first_page=allow_empty_first_page, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['article_count'] = self.article_count
+        return context
+
+
+class TagFilterView(PageCacheMixin, PublishedCountMixin, KeysetPaginationMixin, ListView):
     paginate_by = 20
     paginate_orphans = 2
+    default_to_cursor = True
     context_object_name = 'article_list'
 
     def get_template_names(self):
@@ -240,7 +374,10 @@ class TagFilterView(ListView):
         if self.kwargs['tag_or_tags'] == 'tag':
             tag_name = self.kwargs.get('tag_name')
             tag = get_object_or_404(Tag, name=tag_name)
-            article_list = tag.article_set.filter(status='p')
+            self.tag = tag
+            self.article_count = tag.article_count
+            article_list = tag.article_set.filter(status='p').select_related('author'). \
+                defer(*Article.CONTENT_FIELDS)
             return article_list
         else:
             self.paginate_by = None
@@ -248,30 +385,58 @@ class TagFilterView(ListView):
             tag_dict = TagCloud(tag_model=Tag).get_tag_cloud()
             return tag_dict
 
+    def get_page_cache_tags(self):
+        if self.kwargs['tag_or_tags'] == 'tag':
+            return ['tag:%s' % self.tag.pk]
+        return ['list']
 
-class CategoryFilterView(ListView):
+
+class CategoryFilterView(PageCacheMixin, PublishedCountMixin, KeysetPaginationMixin, ListView):
     template_name = 'blog/category.html'
     paginate_by = 20
     paginate_orphans = 2
+    default_to_cursor = True
     context_object_name = 'article_list'
 
     def get_queryset(self, *args, **kwargs):
         category_name = self.kwargs['category_name']
         category = get_object_or_404(Category, name=category_name)
-        article_list = category.article_set.filter(status='p')
+        self.category = category
+        self.article_count = category.article_count
+        article_list = category.article_set.filter(status='p').select_related('author'). \
+            defer(*Article.CONTENT_FIELDS)
         return article_list
 
+    def get_page_cache_tags(self):
+        return ['category:%s' % self.category.pk]
+
 
-class ArchivesView(ListView):
+class ArchivesView(PageCacheMixin, TemplateView):
+    """归档页只显示每年、每月的文章数量，每年的文章列表由 ArchivesYearView 按需加载"""
     template_name = 'blog/archives.html'
-    context_object_name = 'archives_dict'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['archives'] = ArchivesOverview(Article).get_overview()
+        return context
+
+    def get_page_cache_tags(self):
+        return ['list']
+
+
+class ArchivesYearView(PageCacheMixin, ListView):
+    """某一年的文章列表(HTML 片段)，只查询列表中显示的字段"""
+    template_name = 'blog/include/archives_year.html'
+    context_object_name = 'article_list'
+    # updated_time 是列表项片段缓存的 key
+    list_fields = ('article_title', 'article_link', 'created_time', 'updated_time', 'status', 'author__username')
 
     def get_queryset(self, *args, **kwargs):
-        archives_dict = {}
-        for year in Article.objects.archives():
-            archives_dict[str(year)] = Article.posted.filter(created_time__year=year). \
-                select_related('author')
-        return archives_dict
+        return Article.posted.filter(created_time__year=self.kwargs['year']). \
+            select_related('author').only(*self.list_fields)
+
+    def get_page_cache_tags(self):
+        return ['list']
 
 
 class BlogSitemap(Sitemap):
@@ -280,10 +445,126 @@ class BlogSitemap(Sitemap):
     priority = 0.5
 
     def items(self):
-        return Article.posted.all()
+        # 只取生成链接和 lastmod 需要的字段，作者的用户名通过 JOIN 一起取出
+        return Article.posted.order_by('pk').values_list('article_link', 'author__username', 'updated_time')
+
+    def location(self, item):
+        article_link, username, _ = item
+        return reverse('blog:article_detail', kwargs={'author': username, 'article_link': article_link})
 
     def lastmod(self, item):
-        return item.updated_time
+        return item[2]
+
+
+class SitemapIndexView(PageCacheMixin, View):
+    """sitemap.xml 是索引，每个分片最多包含 BlogSitemap.limit 篇文章"""
+    sitemap = BlogSitemap()
+
+    def get_page_cache_tags(self):
+        return ['list']
+
+    def get(self, request, *args, **kwargs):
+        shards = max(1, math.ceil(Article.posted.count() / self.sitemap.limit))
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+                 '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+        for page in range(1, shards + 1):
+            location = request.build_absolute_uri(reverse('blog:sitemap_shard', kwargs={'page': page}))
+            lines.append('<sitemap><loc>%s</loc></sitemap>' % xml_escape(location))
+        lines.append('</sitemapindex>\n')
+        return HttpResponse('\n'.join(lines), content_type='application/xml')
+
+
+class SitemapShardView(PageCacheMixin, View):
+    """
+    sitemap 的一个分片，一次查询取出所有链接，边生成边输出。
+    缓存的分片带有 Last-Modified(分片中最新的 updated_time)，支持 If-Modified-Since。
+    """
+    sitemap = BlogSitemap()
+    chunk_size = 100
+    last_modified = None
+
+    def get_page_cache_tags(self):
+        return ['list']
+
+    def get_page_cache_extra(self):
+        # 时间戳，分片为空时是 None
+        return {'last_modified': self.last_modified and int(self.last_modified.timestamp())}
+
+    def page_cache_hit(self, response, extra):
+        last_modified = extra.get('last_modified')
+        if last_modified is None:
+            return response
+        response['Last-Modified'] = http_date(last_modified)
+        return get_conditional_response(self.request, last_modified=last_modified, response=response)
+
+    def get(self, request, *args, **kwargs):
+        page = int(self.kwargs['page'])
+        start = (page - 1) * self.sitemap.limit
+        items = self.sitemap.items()[start:start + self.sitemap.limit].iterator()
+        first = next(items, None)
+        if first is None and page > 1:
+            raise Http404('sitemap 分片不存在')
+        items = itertools.chain([first], items) if first is not None else items
+        return StreamingHttpResponse(self.generate(request, items), content_type='application/xml')
+
+    def generate(self, request, items):
+        base_url = request.build_absolute_uri('/')[:-1]
+        yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        chunk = []
+        for item in items:
+            lastmod = self.sitemap.lastmod(item)
+            if self.last_modified is None or lastmod > self.last_modified:
+                self.last_modified = lastmod
+            chunk.append('<url><loc>%s</loc><lastmod>%s</lastmod><changefreq>%s</changefreq>'
+                         '<priority>%s</priority></url>\n' % (
+                             xml_escape(base_url + self.sitemap.location(item)),
+                             timezone.localtime(lastmod).date().isoformat(),
+                             self.sitemap.changefreq, self.sitemap.priority))
+            if len(chunk) >= self.chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+        chunk.append('</urlset>\n')
+        yield ''.join(chunk)
+
+
+class ArticleSearchView(FacetedSearchView):
+    """
+    搜索结果按标签、分类和年份统计数量，数量由搜索引擎在同一次搜索中计算，不查询数据库
+    """
+    facet_years = getattr(settings, 'SEARCH_FACET_YEARS', 10)
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('form_class', ArticleSearchForm)
+        super().__init__(*args, **kwargs)
+
+    def build_form(self, form_kwargs=None):
+        form_kwargs = form_kwargs or {}
+        # 年份的范围和当前时间有关，每个请求重新生成
+        form_kwargs['searchqueryset'] = self.get_searchqueryset()
+        return super().build_form(form_kwargs)
+
+    def get_searchqueryset(self):
+        this_year = timezone.localtime().year
+        start = timezone.make_aware(timezone.datetime(this_year - self.facet_years + 1, 1, 1))
+        end = start.replace(year=this_year + 1)
+        sqs = SearchQuerySet()
+        if not supports_facets(sqs):
+            return sqs
+        return sqs.facet('tags').facet('category').date_facet('created_time', start, end, 'year')
+
+    def extra_context(self):
+        extra = super().extra_context()
+        selected_facets = self.form.get_selected_facets() if self.query else []
+        params = QueryDict(mutable=True)
+        params['q'] = self.query
+        params.setlist('selected_facets', ['%s:%s' % facet for facet in selected_facets])
+        extra['selected_facets'] = selected_facets
+        # 搜索超时只返回了部分结果(只有 whoosh 后端支持)
+        extra['partial'] = getattr(self.results.query, 'is_partial', bool)()
+        # 分页和分面链接使用的查询参数
+        extra['search_params'] = params.urlencode()
+        return extra
 
 
 def about_view(request):
@@ -296,7 +577,10 @@ def delete_article(request, article_id):
     article = get_object_or_404(Article, pk=article_id)
     if request.user.has_perm('blog.delete_article') and \
             request.method == 'DELETE' and request.is_ajax():
+        page_tags = article_page_tags(article, article.tags.values_list('pk', flat=True),
+                                      [article.category_id], status_changed=True) if article.status == 'p' else []
         article.delete()
+        purge_pages(*page_tags)
         msg = 'success'
     else:
         msg = 'failed'
@@ -317,6 +601,7 @@ def change_avatar(request, username):
                 image.name = user.username + '.' + file_suffix
                 user.avatar = image
                 user.save()
+                purge_author_pages(user)
                 return JsonResponse({'msg': '修改头像成功', 'status': 'OK',
                                      'img_url': user.avatar.url})
             else:
@@ -2,16 +2,19 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import copy
 import json
 import os
 import re
 import shutil
 import threading
-import warnings
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
-from django.utils import six
+from django.utils import six, timezone
 from django.utils.datetime_safe import datetime
 from django.utils.encoding import force_text
 
@@ -25,6 +28,8 @@ from haystack.utils import get_identifier, get_model_ct
 from haystack.utils.app_loading import haystack_get_model
 from jieba.analyse import ChineseAnalyzer
 
+from .lib.lru import LRUCache
+
 try:
     import whoosh
 except ImportError:
@@ -35,19 +40,27 @@ if not hasattr(whoosh, '__version__') or whoosh.__version__ < (2, 5, 0):
     raise MissingDependency("The 'whoosh' backend requires version 2.5.0 or greater.")
 
 # Bubble up the correct error.
-from whoosh import index
-from whoosh.analysis import StemmingAnalyzer
+from whoosh import index, query as whoosh_query, sorting
+from whoosh.automata.fsa import find_all_matches
+from whoosh.automata.lev import levenshtein_automaton
+from whoosh.collectors import TimeLimit, TimeLimitCollector
 from whoosh.fields import ID as WHOOSH_ID
 from whoosh.fields import BOOLEAN, DATETIME, IDLIST, KEYWORD, NGRAM, NGRAMWORDS, NUMERIC, Schema, TEXT
 from whoosh.filedb.filestore import FileStorage, RamStorage
 from whoosh.highlight import highlight as whoosh_highlight
-from whoosh.highlight import ContextFragmenter, HtmlFormatter
+from whoosh.highlight import ContextFragmenter, HtmlFormatter, htmlescape
+from whoosh.idsets import BitSet
+from whoosh.index import TOC, EmptyIndexError
 from whoosh.qparser import QueryParser
 from whoosh.searching import ResultsPage
-from whoosh.writing import AsyncWriter
+from whoosh.spelling import Corrector
+from whoosh.support.relativedelta import relativedelta
+from whoosh.writing import AsyncWriter, SegmentWriter
 
 
 DATETIME_REGEX = re.compile('^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})T(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})(\.\d{3,6}Z?)?$')
+# A field prefix in a query, e.g. "text:" in "text:(django whoosh)".
+FIELD_PREFIX_REGEX = re.compile(r'(^|[\s(])(\w+):(?=\S)')
 LOCALS = threading.local()
 LOCALS.RAM_STORE = None
 
@@ -61,6 +74,291 @@ class WhooshHtmlFormatter(HtmlFormatter):
     template = '<%(tag)s>%(t)s</%(tag)s>'
 
 
+def searcher_identity(searcher):
+    """
+    Identifies the version of the index a searcher reads: its generation and
+    the ids of its segments.
+
+    The generation alone isn't enough, a deleted and recreated index (e.g. by
+    ``rebuild_index`` in another process) starts again from generation 0, but
+    segment ids are random, so the pair doesn't repeat. Computed once per
+    searcher.
+    """
+    identity = getattr(searcher, '_haystack_identity', None)
+
+    if identity is None:
+        reader = searcher.reader()
+        segments = sorted(leaf.segment().segment_id() for leaf, _offset in reader.leaf_readers()
+                          if hasattr(leaf, 'segment'))
+        identity = searcher._haystack_identity = (reader.generation(), tuple(segments))
+
+    return identity
+
+
+class SearcherManager(object):
+    """
+    Shares one searcher per version of the index between all the threads of a process.
+
+    Opening a searcher reads the TOC and opens every segment, so instead of
+    doing that for each query, ``acquire()`` only reads the latest TOC's
+    generation and segment ids (without unpickling the schema) and compares
+    them with the current searcher's, opening a new one after a commit or
+    after the index was recreated. Searchers are reference counted: a
+    superseded searcher stays open until the last in-flight search using it
+    calls ``release()``, and is closed then.
+    """
+
+    def __init__(self, ix):
+        self.index = ix
+        self._lock = threading.Lock()
+        self._current = None
+        self._identity = None
+        self._schema = None
+        self._refcounts = {}
+
+    def latest_identity(self):
+        """
+        The identity of the latest TOC, in the format of ``searcher_identity``,
+        or None if it can't be read (no index, or a TOC being replaced).
+        """
+        try:
+            toc = TOC.read(self.index.storage, self.index.indexname, schema=self._schema)
+        except (EmptyIndexError, IOError, OSError):
+            return None
+
+        self._schema = toc.schema
+        return toc.generation, tuple(sorted(segment.segment_id() for segment in toc.segments))
+
+    def acquire(self):
+        latest = self.latest_identity()
+
+        with self._lock:
+            if self._current is None or latest is None or self._identity != latest:
+                searcher = self.index.searcher()
+                # The manager holds one reference to its current searcher.
+                self._refcounts[searcher] = 1
+                self._swap(searcher, searcher_identity(searcher))
+
+            self._refcounts[self._current] += 1
+            return self._current
+
+    def release(self, searcher):
+        with self._lock:
+            self._decref(searcher)
+
+    @contextmanager
+    def searcher(self):
+        searcher = self.acquire()
+
+        try:
+            yield searcher
+        finally:
+            self.release(searcher)
+
+    def invalidate(self):
+        """
+        Drops the current searcher, e.g. after the index was deleted and
+        recreated in this process.
+        """
+        with self._lock:
+            self._swap(None, None)
+
+    def _swap(self, searcher, identity):
+        old = self._current
+        self._current, self._identity = searcher, identity
+
+        if old is not None:
+            self._decref(old)
+
+    def _decref(self, searcher):
+        self._refcounts[searcher] -= 1
+
+        if self._refcounts[searcher] <= 0:
+            del self._refcounts[searcher]
+            searcher.close()
+
+
+class CachedValuesFacet(sorting.FacetType):
+    """
+    Groups documents by precomputed field values.
+
+    ``values`` is a list indexed by (top-level) document number holding the
+    values of every document, so grouping a hit is a list lookup instead of
+    reading the column or walking the terms of each segment again. A document
+    may have several values (e.g. tags), so groups can overlap.
+    """
+
+    def __init__(self, values, maptype=None):
+        self.values = values
+        self.maptype = maptype
+
+    def categorizer(self, global_searcher):
+        return CachedValuesCategorizer(self.values)
+
+
+class CachedValuesCategorizer(sorting.Categorizer):
+    allow_overlap = True
+
+    def __init__(self, values):
+        self.values = values
+        self._offset = 0
+
+    def set_searcher(self, segment_searcher, docoffset):
+        self._offset = docoffset
+
+    def keys_for(self, matcher, docid):
+        return self.values[self._offset + docid] or [None]
+
+    def key_for(self, matcher, docid):
+        return self.keys_for(matcher, docid)[0]
+
+
+class DeadlineCollector(TimeLimitCollector):
+    """
+    A ``TimeLimitCollector`` that stops at an absolute ``time.monotonic()``
+    deadline, so one budget covers every step of a request (search, spelling).
+
+    It checks the clock every ``check_every`` matches instead of starting a
+    timer thread per search, and never uses SIGALRM, which can only be
+    handled in the main thread (not in the threads of a WSGI server). The
+    first match is always collected, so a search that starts late still
+    returns something.
+    """
+    check_every = 64
+
+    def __init__(self, child, deadline, check_every=None):
+        super(DeadlineCollector, self).__init__(child, None, use_alarm=False)
+        self.deadline = deadline
+
+        if check_every is not None:
+            self.check_every = check_every
+
+    def prepare(self, top_searcher, q, context):
+        self.child.prepare(top_searcher, q, context)
+        self.timedout = False
+
+    def collect_matches(self):
+        child = self.child
+
+        for i, sub_docnum in enumerate(child.matches()):
+            if i and not i % self.check_every and time.monotonic() >= self.deadline:
+                self.timedout = True
+                raise TimeLimit
+
+            child.collect(sub_docnum)
+
+    def finish(self):
+        self.child.finish()
+
+
+class FieldCorrector(Corrector):
+    """
+    Suggests the same corrections as ``reader.corrector(fieldname)``, from a
+    sorted list of the field's terms and their frequencies loaded once per
+    version of the index.
+
+    Like Whoosh does within a single segment, a Levenshtein automaton of the
+    word skips through the sorted terms (here with a bisection in memory),
+    instead of computing the edit distance to every term of the lexicon,
+    which is what ``ReaderCorrector`` does on a multi-segment reader.
+    """
+
+    def __init__(self, reader, fieldname):
+        fieldobj = reader.schema[fieldname]
+        self.frequencies = {}
+
+        for btext in reader.lexicon(fieldobj.spelling_fieldname(fieldname)):
+            word = fieldobj.from_bytes(btext)
+            self.frequencies[word] = reader.frequency(fieldname, word) or 1
+
+        self.words = sorted(self.frequencies)
+
+    def _first_from(self, text):
+        # The first word greater than or equal to text.
+        i = bisect_left(self.words, text)
+        return self.words[i] if i < len(self.words) else None
+
+    def _suggestions(self, text, maxdist, prefix):
+        dfa = levenshtein_automaton(text, maxdist, prefix).to_dfa()
+
+        for word in find_all_matches(dfa, self._first_from):
+            # Same score as ReaderCorrector: higher frequencies first.
+            yield (0 - (maxdist + (1.0 / self.frequencies[word] * 0.5)), word)
+
+
+class TimeBudgetStats(object):
+    """
+    Counts, per operation (search, more_like_this, spelling), how many calls
+    ran with a time budget and how many of them ran out of it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, operation, exceeded):
+        with self._lock:
+            counts = self._counts.setdefault(operation, {'calls': 0, 'exceeded': 0})
+            counts['calls'] += 1
+            counts['exceeded'] += bool(exceeded)
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+    def stats(self):
+        with self._lock:
+            return {operation: dict(counts) for operation, counts in self._counts.items()}
+
+
+_PROCESS_LOCALS = {}
+_PROCESS_LOCALS_LOCK = threading.Lock()
+
+
+def process_local(key, factory):
+    """
+    Returns the object stored under ``key`` for the current process, creating
+    it with ``factory()`` the first time. Haystack creates one backend per
+    thread, so state shared by all the threads (searchers, result cache) can't
+    live on the backend itself.
+    """
+    # Forked children must not share the parent's searchers or locks.
+    key = (os.getpid(),) + tuple(key)
+
+    with _PROCESS_LOCALS_LOCK:
+        if key not in _PROCESS_LOCALS:
+            _PROCESS_LOCALS[key] = factory()
+
+        return _PROCESS_LOCALS[key]
+
+
+def freeze(value):
+    """Turns (nested) facet options into something hashable for cache keys."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    elif isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    elif isinstance(value, set):
+        return frozenset(freeze(item) for item in value)
+
+    return value
+
+
+def to_index_datetime(value):
+    """Aware datetimes are indexed as naive UTC datetimes (Whoosh drops tzinfo)."""
+    if hasattr(value, 'hour') and timezone.is_aware(value):
+        value = timezone.make_naive(value, timezone.utc)
+
+    return value
+
+
+def from_index_datetime(value):
+    if settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.localtime(timezone.make_aware(value, timezone.utc))
+
+    return value
+
+
 class WhooshSearchBackend(BaseSearchBackend):
     # Word reserved by Whoosh for special use.
     RESERVED_WORDS = (
@@ -82,6 +380,18 @@ class WhooshSearchBackend(BaseSearchBackend):
         self.setup_complete = False
         self.use_file_storage = True
         self.post_limit = getattr(connection_options, 'POST_LIMIT', 128 * 1024 * 1024)
+        # Number of search results kept per process, 0 disables the cache.
+        self.result_cache_size = connection_options.get('RESULT_CACHE_SIZE', 256)
+        # Seconds a search (including more like this and spelling) may take
+        # before the hits found so far are returned as partial, None disables it.
+        self.time_limit = connection_options.get('TIME_LIMIT')
+        # Highlighting only looks at this many characters of a document,
+        # starting a little before the first occurrence of a query term...
+        self.highlight_window = connection_options.get('HIGHLIGHT_WINDOW', 1000)
+        # ...which is searched for in this many characters at the start of the document.
+        self.highlight_scan = connection_options.get('HIGHLIGHT_SCAN', 10000)
+        self.highlight_formatter = WhooshHtmlFormatter('em')
+        self.highlight_fragmenter = ContextFragmenter()
         self.path = connection_options.get('PATH')
 
         if connection_options.get('STORAGE', 'file') != 'file':
@@ -119,6 +429,9 @@ class WhooshSearchBackend(BaseSearchBackend):
 
         self.content_field_name, self.schema = self.build_schema(connections[self.connection_alias].get_unified_index().all_searchfields())
         self.parser = QueryParser(self.content_field_name, schema=self.schema)
+        # jieba loads its dictionary the first time it is used, which takes
+        # seconds: do it now rather than in the time budget of the first query.
+        list(self.schema[self.content_field_name].analyzer('warm up'))
 
         if new_index is True:
             self.index = self.storage.create_index(self.schema)
@@ -128,6 +441,15 @@ class WhooshSearchBackend(BaseSearchBackend):
             except index.EmptyIndexError:
                 self.index = self.storage.create_index(self.schema)
 
+        index_key = self.path if self.use_file_storage else self.storage
+        self.searcher_manager = process_local(('searchers', index_key), lambda: SearcherManager(self.index))
+        self.result_cache = process_local(('results', index_key), lambda: LRUCache(self.result_cache_size))
+        self.narrow_cache = process_local(('narrow', index_key), lambda: LRUCache(32))
+        self.facet_cache = process_local(('facets', index_key), lambda: LRUCache(16))
+        self.budget_stats = process_local(('budget', index_key), TimeBudgetStats)
+        # Spelling correctors (keyed by index identity) and query -> suggestion memo.
+        self.corrector_cache = process_local(('correctors', index_key), lambda: LRUCache(2))
+        self.spelling_cache = process_local(('spelling', index_key), lambda: LRUCache(256))
         self.setup_complete = True
 
     def build_schema(self, fields):
@@ -180,7 +502,40 @@ class WhooshSearchBackend(BaseSearchBackend):
 
         self.index = self.index.refresh()
         writer = AsyncWriter(self.index)
+        self._write_documents(writer, index, iterable)
+
+        if len(iterable) > 0:
+            # For now, commit no matter what, as we run into locking issues otherwise.
+            writer.commit()
+
+    def apply_batch(self, index, iterable, remove_identifiers=()):
+        """
+        Applies a batch of updates and removals through a single writer and
+        commits once, instead of one writer & one new segment per object.
+        """
+        if not self.setup_complete:
+            self.setup()
+
+        if not len(iterable) and not remove_identifiers:
+            return
 
+        self.index = self.index.refresh()
+        writer = AsyncWriter(self.index)
+
+        for whoosh_id in remove_identifiers:
+            try:
+                writer.delete_by_term(ID, whoosh_id)
+            except Exception as e:
+                if not self.silently_fail:
+                    writer.cancel()
+                    raise
+
+                self.log.error("Failed to remove document '%s' from Whoosh: %s", whoosh_id, e, exc_info=True)
+
+        self._write_documents(writer, index, iterable)
+        writer.commit()
+
+    def _write_documents(self, writer, index, iterable, update=True):
         for obj in iterable:
             try:
                 doc = index.full_prepare(obj)
@@ -197,7 +552,10 @@ class WhooshSearchBackend(BaseSearchBackend):
                     del doc['boost']
 
                 try:
-                    writer.update_document(**doc)
+                    if update:
+                        writer.update_document(**doc)
+                    else:
+                        writer.add_document(**doc)
                 except Exception as e:
                     if not self.silently_fail:
                         raise
@@ -209,9 +567,81 @@ class WhooshSearchBackend(BaseSearchBackend):
                                    exc_info=True, extra={"data": {"index": index,
                                                                   "object": get_identifier(obj)}})
 
-        if len(iterable) > 0:
-            # For now, commit no matter what, as we run into locking issues otherwise.
-            writer.commit()
+    def write_segment(self, index, iterable):
+        """
+        Writes ``iterable`` into a new segment of the index and returns it,
+        without adding it to the TOC (None if every document was skipped).
+
+        Used by the parallel rebuild: worker processes analyse their share
+        of the documents (jieba runs here) into their own segments, which
+        ``rebuild_segments`` then commits.
+        """
+        if not self.setup_complete:
+            self.setup()
+
+        # The lock is held by rebuild_segments() in the parent process.
+        writer = SegmentWriter(self.index, _lk=False)
+        # Every document is new, no need to look for older versions to delete.
+        self._write_documents(writer, index, iterable, update=False)
+
+        if not writer._added:
+            writer.cancel()
+            return None
+
+        # Not _finish(): it would remove the temporary directory the parent's
+        # writer shares with us.
+        return writer._finalize_segment()
+
+    @contextmanager
+    def rebuild_segments(self):
+        """
+        Replaces the whole content of the index with the segments collected
+        in the yielded list, in one commit.
+
+        This is how Whoosh's own multi-process writer (``MpWriter`` with
+        ``multisegment=True``) commits the segments of its sub-writers: the
+        write lock is held until a TOC listing only the new segments is
+        written. Searches keep using the old segments meanwhile, and queued
+        updates wait for the lock (``AsyncWriter``) and apply on top.
+        """
+        if not self.setup_complete:
+            self.setup()
+
+        self.index = self.index.refresh()
+        writer = self.index.writer()
+        segments = []
+
+        try:
+            yield segments
+            writer._close_segment()
+            writer._commit_toc([segment for segment in segments if segment is not None])
+        except BaseException:
+            writer.cancel()
+            raise
+
+        writer._finish()
+
+    def indexed_ids(self, model):
+        """
+        Returns the ``django_id`` of every live document of ``model`` in the
+        index. Read from the terms of the unique ID field, so no stored
+        fields are loaded.
+        """
+        if not self.setup_complete:
+            self.setup()
+
+        prefix = u'%s.' % get_model_ct(model)
+        ids = []
+
+        with self.searcher_manager.searcher() as searcher:
+            reader = searcher.reader()
+
+            for term in reader.expand_prefix(ID, prefix):
+                # Terms of deleted documents stay in the lexicon until their segment is merged.
+                if any(not reader.is_deleted(docnum) for docnum in reader.postings(ID, term).all_ids()):
+                    ids.append(term.decode('utf-8')[len(prefix):])
+
+        return ids
 
     def remove(self, obj_or_string, commit=True):
         if not self.setup_complete:
@@ -267,6 +697,14 @@ class WhooshSearchBackend(BaseSearchBackend):
 
         # Recreate everything.
         self.setup()
+        # Entries of the old index can't match the new one (see searcher_identity),
+        # drop them rather than wait for the LRU to.
+        self.searcher_manager.invalidate()
+        self.result_cache.clear()
+        self.narrow_cache.clear()
+        self.facet_cache.clear()
+        self.corrector_cache.clear()
+        self.spelling_cache.clear()
 
     def optimize(self):
         if not self.setup_complete:
@@ -356,18 +794,6 @@ class WhooshSearchBackend(BaseSearchBackend):
 
             sort_by = sort_by_list[0]
 
-        if facets is not None:
-            warnings.warn("Whoosh does not handle faceting.", Warning, stacklevel=2)
-
-        if date_facets is not None:
-            warnings.warn("Whoosh does not handle date faceting.", Warning, stacklevel=2)
-
-        if query_facets is not None:
-            warnings.warn("Whoosh does not handle query faceting.", Warning, stacklevel=2)
-
-        narrowed_results = None
-        self.index = self.index.refresh()
-
         if limit_to_registered_models is None:
             limit_to_registered_models = getattr(settings, 'HAYSTACK_LIMIT_TO_REGISTERED_MODELS', True)
 
@@ -386,31 +812,45 @@ class WhooshSearchBackend(BaseSearchBackend):
 
             narrow_queries.add(' OR '.join(['%s:%s' % (DJANGO_CT, rm) for rm in model_choices]))
 
-        narrow_searcher = None
-
-        if narrow_queries is not None:
-            # Potentially expensive? I don't see another way to do it in Whoosh...
-            narrow_searcher = self.index.searcher()
-
-            for nq in narrow_queries:
-                recent_narrowed_results = narrow_searcher.search(self.parser.parse(force_text(nq)),
-                                                                 limit=None)
-
-                if len(recent_narrowed_results) <= 0:
-                    return {
-                        'results': [],
-                        'hits': 0,
-                    }
+        # Narrowing and the search itself use the same (shared) searcher, so they
+        # see the same version of the index.
+        with self.searcher_manager.searcher() as searcher:
+            # The index identity is part of the key, so a commit invalidates every entry.
+            cache_key = (searcher_identity(searcher), ' '.join(query_string.split()), sort_by, reverse,
+                         start_offset, end_offset, frozenset(narrow_queries or ()), highlight,
+                         spelling_query, result_class, freeze(facets), freeze(date_facets),
+                         freeze(query_facets))
+            results = self.result_cache.get(cache_key)
+
+            if results is None:
+                results = self._search(searcher, query_string, sort_by=sort_by, reverse=reverse,
+                                       start_offset=start_offset, end_offset=end_offset,
+                                       highlight=highlight, facets=facets, date_facets=date_facets,
+                                       query_facets=query_facets, narrow_queries=narrow_queries,
+                                       spelling_query=spelling_query, result_class=result_class)
+
+                # Partial results depend on the load of the moment, don't keep them.
+                if not results.get('partial'):
+                    self.result_cache.set(cache_key, results)
+
+        # Callers may modify the list or the results (e.g. load ``object``),
+        # don't hand out the cached ones.
+        results = dict(results)
+        results['results'] = [copy.copy(result) for result in results['results']]
+        return results
 
-                if narrowed_results:
-                    narrowed_results.filter(recent_narrowed_results)
-                else:
-                   narrowed_results = recent_narrowed_results
+    def _search(self, searcher, query_string, sort_by=None, reverse=False, start_offset=0, end_offset=None,
+                highlight=False, facets=None, date_facets=None, query_facets=None, narrow_queries=None,
+                spelling_query=None, result_class=None, deadline=None):
+        narrowed_results = self._narrow_filter(searcher, narrow_queries)
 
-        self.index = self.index.refresh()
+        if narrowed_results is not None and not len(narrowed_results):
+            return {
+                'results': [],
+                'hits': 0,
+            }
 
-        if self.index.doc_count():
-            searcher = self.index.searcher()
+        if searcher.doc_count():
             parsed_query = self.parser.parse(query_string)
 
             # In the event of an invalid/stopworded query, recover gracefully.
@@ -420,10 +860,14 @@ class WhooshSearchBackend(BaseSearchBackend):
                     'hits': 0,
                 }
 
+            # The budget is for running the query, parsing it doesn't count.
+            if deadline is None:
+                deadline = self._deadline()
+
             page_num, page_length = self.calculate_page(start_offset, end_offset)
 
             search_kwargs = {
-                'pagelen': page_length,
+                'limit': page_num * page_length,
                 'sortedby': sort_by,
                 'reverse': reverse,
             }
@@ -432,12 +876,15 @@ class WhooshSearchBackend(BaseSearchBackend):
             if narrowed_results is not None:
                 search_kwargs['filter'] = narrowed_results
 
+            groupedby = self._build_facets(searcher, facets, date_facets, query_facets)
+
+            if groupedby is not None:
+                search_kwargs['groupedby'] = groupedby
+
+            raw_results, partial = self._collect(searcher, parsed_query, deadline, 'search', **search_kwargs)
+
             try:
-                raw_page = searcher.search_page(
-                    parsed_query,
-                    page_num,
-                    **search_kwargs
-                )
+                raw_page = ResultsPage(raw_results, page_num, page_length)
             except ValueError:
                 if not self.silently_fail:
                     raise
@@ -446,6 +893,7 @@ class WhooshSearchBackend(BaseSearchBackend):
                     'results': [],
                     'hits': 0,
                     'spelling_suggestion': None,
+                    'partial': partial,
                 }
 
             # Because as of Whoosh 2.5.1, it will return the wrong page of
@@ -455,21 +903,22 @@ class WhooshSearchBackend(BaseSearchBackend):
                     'results': [],
                     'hits': 0,
                     'spelling_suggestion': None,
+                    'partial': partial,
                 }
 
-            results = self._process_results(raw_page, highlight=highlight, query_string=query_string, spelling_query=spelling_query, result_class=result_class)
-            searcher.close()
+            results = self._process_results(raw_page, highlight=highlight, query_string=query_string, spelling_query=spelling_query, result_class=result_class, deadline=deadline)
+            results['partial'] = partial
 
-            if hasattr(narrow_searcher, 'close'):
-                narrow_searcher.close()
+            if groupedby is not None:
+                results['facets'] = self._facet_counts(raw_page.results)
 
             return results
         else:
             if self.include_spelling:
                 if spelling_query:
-                    spelling_suggestion = self.create_spelling_suggestion(spelling_query)
+                    spelling_suggestion = self.create_spelling_suggestion(spelling_query, deadline=deadline)
                 else:
-                    spelling_suggestion = self.create_spelling_suggestion(query_string)
+                    spelling_suggestion = self.create_spelling_suggestion(query_string, deadline=deadline)
             else:
                 spelling_suggestion = None
 
@@ -491,8 +940,6 @@ class WhooshSearchBackend(BaseSearchBackend):
 
         field_name = self.content_field_name
         narrow_queries = set()
-        narrowed_results = None
-        self.index = self.index.refresh()
 
         if limit_to_registered_models is None:
             limit_to_registered_models = getattr(settings, 'HAYSTACK_LIMIT_TO_REGISTERED_MODELS', True)
@@ -515,75 +962,222 @@ class WhooshSearchBackend(BaseSearchBackend):
         if additional_query_string and additional_query_string != '*':
             narrow_queries.add(additional_query_string)
 
-        narrow_searcher = None
+        deadline = None
 
-        if narrow_queries is not None:
-            # Potentially expensive? I don't see another way to do it in Whoosh...
-            narrow_searcher = self.index.searcher()
+        # The searcher is released on every return path, including the early ones.
+        with self.searcher_manager.searcher() as searcher:
+            narrowed_results = self._narrow_filter(searcher, narrow_queries)
 
-            for nq in narrow_queries:
-                recent_narrowed_results = narrow_searcher.search(self.parser.parse(force_text(nq)),
-                                                                 limit=None)
+            if narrowed_results is not None and not len(narrowed_results):
+                return {
+                    'results': [],
+                    'hits': 0,
+                }
 
-                if len(recent_narrowed_results) <= 0:
-                    return {
-                        'results': [],
-                        'hits': 0,
-                    }
+            page_num, page_length = self.calculate_page(start_offset, end_offset)
 
-                if narrowed_results:
-                    narrowed_results.filter(recent_narrowed_results)
-                else:
-                   narrowed_results = recent_narrowed_results
+            raw_results = EmptyResults()
+            partial = False
+
+            if searcher.doc_count():
+                query = "%s:%s" % (ID, get_identifier(model_instance))
+                parsed_query = self.parser.parse(query)
+                results = searcher.search(parsed_query)
+
+                if len(results):
+                    # What Hit.more_like_this does, but within the time budget.
+                    docnum = results[0].docnum
+                    key_terms = searcher.key_terms([docnum], field_name, numterms=5, normalize=True)
+                    similar_query = whoosh_query.Or([whoosh_query.Term(field_name, word, boost=weight)
+                                                     for word, weight in key_terms])
+                    deadline = self._deadline()
+                    # Handle the case where the results have been narrowed.
+                    raw_results, partial = self._collect(searcher, similar_query, deadline, 'more_like_this',
+                                                         limit=end_offset, filter=narrowed_results,
+                                                         mask={docnum})
 
-        page_num, page_length = self.calculate_page(start_offset, end_offset)
+            try:
+                raw_page = ResultsPage(raw_results, page_num, page_length)
+            except ValueError:
+                if not self.silently_fail:
+                    raise
 
-        self.index = self.index.refresh()
-        raw_results = EmptyResults()
+                return {
+                    'results': [],
+                    'hits': 0,
+                    'spelling_suggestion': None,
+                    'partial': partial,
+                }
+
+            # Because as of Whoosh 2.5.1, it will return the wrong page of
+            # results if you request something too high. :(
+            if raw_page.pagenum < page_num:
+                return {
+                    'results': [],
+                    'hits': 0,
+                    'spelling_suggestion': None,
+                    'partial': partial,
+                }
 
-        if self.index.doc_count():
-            query = "%s:%s" % (ID, get_identifier(model_instance))
-            searcher = self.index.searcher()
-            parsed_query = self.parser.parse(query)
-            results = searcher.search(parsed_query)
+            results = self._process_results(raw_page, result_class=result_class, deadline=deadline)
+            results['partial'] = partial
+            return results
 
-            if len(results):
-                raw_results = results[0].more_like_this(field_name, top=end_offset)
+    def _deadline(self):
+        if self.time_limit is None:
+            return None
 
-            # Handle the case where the results have been narrowed.
-            if narrowed_results is not None and hasattr(raw_results, 'filter'):
-                raw_results.filter(narrowed_results)
+        return time.monotonic() + self.time_limit
+
+    def _collect(self, searcher, parsed_query, deadline, operation, **search_kwargs):
+        """
+        Runs ``parsed_query`` like ``searcher.search(**search_kwargs)``, but
+        stops collecting at ``deadline`` (when there is one). Returns the
+        results and whether they are partial: the hits collected before the
+        deadline, ranked among themselves, with a lower bound for the total.
+        """
+        collector = searcher.collector(**search_kwargs)
+
+        if deadline is None:
+            searcher.search_with_collector(parsed_query, collector)
+            return collector.results(), False
+
+        collector = DeadlineCollector(collector, deadline)
 
         try:
-            raw_page = ResultsPage(raw_results, page_num, page_length)
-        except ValueError:
-            if not self.silently_fail:
-                raise
+            searcher.search_with_collector(parsed_query, collector)
+        except TimeLimit:
+            self.log.warning("Whoosh %s ran out of its %ss time budget, returning partial results.",
+                             operation, self.time_limit)
 
-            return {
-                'results': [],
-                'hits': 0,
-                'spelling_suggestion': None,
-            }
+        self.budget_stats.record(operation, collector.timedout)
+        return collector.results(), collector.timedout
 
-        # Because as of Whoosh 2.5.1, it will return the wrong page of
-        # results if you request something too high. :(
-        if raw_page.pagenum < page_num:
-            return {
-                'results': [],
-                'hits': 0,
-                'spelling_suggestion': None,
-            }
+    def _narrow_filter(self, searcher, narrow_queries):
+        """
+        Returns the document numbers matching all the ``narrow_queries`` as a
+        ``BitSet`` that can be passed as a search filter, or None when there is
+        nothing to narrow.
+
+        Matching documents are only enumerated (no scoring, no Hit objects), and
+        since document numbers are stable within a version of the index the
+        sets are cached per (index identity, narrow queries); the model narrowing that every
+        search carries costs a dictionary lookup after the first query.
+        """
+        if not narrow_queries:
+            return None
 
-        results = self._process_results(raw_page, result_class=result_class)
-        searcher.close()
+        cache_key = (searcher_identity(searcher), frozenset(narrow_queries))
+        docset = self.narrow_cache.get(cache_key)
 
-        if hasattr(narrow_searcher, 'close'):
-            narrow_searcher.close()
+        if docset is None:
+            docnums = None
 
-        return results
+            for nq in narrow_queries:
+                matched = set(searcher.docs_for_query(self.parser.parse(force_text(nq))))
+                docnums = matched if docnums is None else docnums & matched
+
+                if not docnums:
+                    break
+
+            docset = BitSet(docnums, size=searcher.doc_count_all())
+            self.narrow_cache.set(cache_key, docset)
+
+        return docset
+
+    def _field_values(self, searcher, field_name):
+        """
+        Returns the values of ``field_name`` for every document of the
+        searcher's version of the index, as a list of value lists indexed by
+        document number.
+
+        Single-valued fields are read from their column, multi-valued
+        (KEYWORD) fields from their terms and postings. Both are read once per
+        index identity and field, so faceting a query only costs the lookups of
+        its hits.
+        """
+        if field_name not in self.schema:
+            raise SearchBackendError("Can't facet on unknown field '%s'." % field_name)
 
-    def _process_results(self, raw_page, highlight=False, query_string='', spelling_query=None, result_class=None):
+        reader = searcher.reader()
+        cache_key = (searcher_identity(searcher), field_name)
+        values = self.facet_cache.get(cache_key)
+
+        if values is None:
+            field = self.schema[field_name]
+            values = [[] for _ in range(reader.doc_count_all())]
+
+            if reader.has_column(field_name) and not isinstance(field, KEYWORD):
+                for docnum, value in enumerate(reader.column_reader(field_name)):
+                    if value:
+                        values[docnum].append(value)
+            else:
+                for btext in reader.lexicon(field_name):
+                    text = field.from_bytes(btext)
+
+                    for docnum in reader.postings(field_name, btext).all_ids():
+                        values[docnum].append(text)
+
+            self.facet_cache.set(cache_key, values)
+
+        return values
+
+    def _build_facets(self, searcher, facets=None, date_facets=None, query_facets=None):
+        """
+        Builds the ``groupedby`` argument of a search from Haystack's facet
+        options, or returns None when nothing is faceted. Facet names are
+        prefixed with their kind so ``_facet_counts`` can sort them out.
+        """
+        groupedby = sorting.Facets()
+
+        for field_name in facets or ():
+            groupedby.add_facet('fields:%s' % field_name,
+                                CachedValuesFacet(self._field_values(searcher, field_name), maptype=sorting.Count))
+
+        for field_name, options in (date_facets or {}).items():
+            gap = relativedelta(**{'%ss' % options.get('gap_by', 'day'): options.get('gap_amount', 1)})
+            groupedby.add_facet('dates:%s' % field_name,
+                                sorting.DateRangeFacet(field_name, to_index_datetime(options['start_date']),
+                                                       to_index_datetime(options['end_date']), gap,
+                                                       maptype=sorting.Count))
+
+        for field_name, query in query_facets or ():
+            parsed_query = self.parser.parse('%s:%s' % (field_name, query))
+            groupedby.add_facet('queries:%s_%s' % (field_name, query),
+                                sorting.QueryFacet({True: parsed_query}, maptype=sorting.Count))
+
+        return groupedby if groupedby.names() else None
+
+    def _facet_counts(self, raw_results):
+        """
+        Converts the groups of a faceted search to Haystack's format: lists of
+        ``(value, count)`` for fields (most frequent first) and dates (by
+        start date), and one count per query facet.
+        """
+        facets = {
+            'fields': {},
+            'dates': {},
+            'queries': {},
+        }
+
+        for name in raw_results.facet_names():
+            kind, field_name = name.split(':', 1)
+            groups = raw_results.groups(name)
+
+            if kind == 'fields':
+                facets['fields'][field_name] = sorted(((value, count) for value, count in groups.items()
+                                                       if value is not None), key=lambda item: (-item[1], item[0]))
+            elif kind == 'dates':
+                # Documents outside of the range are grouped under None.
+                facets['dates'][field_name] = sorted((from_index_datetime(key[0]), count)
+                                                     for key, count in groups.items() if isinstance(key, tuple))
+            else:
+                facets['queries'][field_name] = groups.get(True, 0)
+
+        return facets
+
+    def _process_results(self, raw_page, highlight=False, query_string='', spelling_query=None, result_class=None,
+                         deadline=None):
         from haystack import connections
         results = []
 
@@ -599,6 +1193,10 @@ class WhooshSearchBackend(BaseSearchBackend):
         unified_index = connections[self.connection_alias].get_unified_index()
         indexed_models = unified_index.get_indexed_models()
 
+        if highlight:
+            # The query is analyzed once for the whole page, not once per result.
+            highlight_terms = self._highlight_terms(query_string)
+
         for doc_offset, raw_result in enumerate(raw_page):
             score = raw_page.score(doc_offset) or 0
             app_label, model_name = raw_result[DJANGO_CT].split('.')
@@ -626,19 +1224,10 @@ class WhooshSearchBackend(BaseSearchBackend):
                 del(additional_fields[DJANGO_ID])
 
                 if highlight:
-                    sa = StemmingAnalyzer()
-                    formatter = WhooshHtmlFormatter('em')
-                    terms = [token.text for token in sa(query_string)]
-
-                    whoosh_result = whoosh_highlight(
-                        additional_fields.get(self.content_field_name),
-                        terms,
-                        sa,
-                        ContextFragmenter(),
-                        formatter
-                    )
                     additional_fields['highlighted'] = {
-                        self.content_field_name: [whoosh_result],
+                        self.content_field_name: [
+                            self._highlight(additional_fields.get(self.content_field_name), highlight_terms),
+                        ],
                     }
 
                 result = result_class(app_label, model_name, raw_result[DJANGO_ID], score, **additional_fields)
@@ -648,9 +1237,9 @@ class WhooshSearchBackend(BaseSearchBackend):
 
         if self.include_spelling:
             if spelling_query:
-                spelling_suggestion = self.create_spelling_suggestion(spelling_query)
+                spelling_suggestion = self.create_spelling_suggestion(spelling_query, deadline=deadline)
             else:
-                spelling_suggestion = self.create_spelling_suggestion(query_string)
+                spelling_suggestion = self.create_spelling_suggestion(query_string, deadline=deadline)
 
         return {
             'results': results,
@@ -659,10 +1248,53 @@ class WhooshSearchBackend(BaseSearchBackend):
             'spelling_suggestion': spelling_suggestion,
         }
 
-    def create_spelling_suggestion(self, query_string):
+    def _highlight_terms(self, query_string):
+        """
+        Analyzes the query with the analyzer of the content field (jieba), so
+        the terms are the ones the index was built with (e.g. stemmed). Field
+        prefixes (``field:``) are removed first, the same words elsewhere in
+        the query are terms.
+        """
+        analyzer = self.schema[self.content_field_name].analyzer
+        query_string = FIELD_PREFIX_REGEX.sub(lambda match: match.group(1) if match.group(2) in self.schema else
+                                              match.group(0), force_text(query_string))
+        return frozenset(token.text for token in analyzer(query_string))
+
+    def _highlight(self, text, terms):
+        """
+        Highlights ``terms`` in a window of ``highlight_window`` characters of
+        ``text`` around the first occurrence of any of them, instead of
+        analyzing the whole document.
+
+        The first occurrence is the first token of the analyzed (at most
+        ``highlight_scan`` characters long) start of the text that is one of
+        the terms, so stemmed terms and whole words match like in the index.
+        Without one, the start of the text is returned unhighlighted.
+        """
+        if not text:
+            return ''
+
+        analyzer = self.schema[self.content_field_name].analyzer
+        start = 0
+
+        if terms:
+            for token in analyzer(text[:self.highlight_scan], chars=True, mode='query', removestops=False):
+                if token.text in terms:
+                    # Keep some context before the match for the fragmenter.
+                    start = max(0, token.startchar - self.highlight_fragmenter.surround * 2)
+                    break
+
+        window = text[start:start + self.highlight_window]
+        highlighted = ''
+
+        if terms:
+            highlighted = whoosh_highlight(window, terms, analyzer, self.highlight_fragmenter,
+                                           self.highlight_formatter)
+
+        return highlighted or htmlescape(window)
+
+    def create_spelling_suggestion(self, query_string, deadline=None):
         spelling_suggestion = None
-        reader = self.index.reader()
-        corrector = reader.corrector(self.content_field_name)
         cleaned_query = force_text(query_string)
 
         if not query_string:
@@ -679,13 +1311,45 @@ class WhooshSearchBackend(BaseSearchBackend):
         query_words = cleaned_query.split()
         suggested_words = []
 
-        for word in query_words:
-            suggestions = corrector.suggest(word, limit=1)
+        if deadline is None:
+            deadline = self._deadline()
 
-            if len(suggestions) > 0:
-                suggested_words.append(suggestions[0])
+        exceeded = False
+
+        with self.searcher_manager.searcher() as searcher:
+            identity = searcher_identity(searcher)
+            memo_key = (identity, tuple(query_words))
+            spelling_suggestion = self.spelling_cache.get(memo_key)
+
+            if spelling_suggestion is not None:
+                return spelling_suggestion
+
+            corrector = self.corrector_cache.get(identity)
+
+            if corrector is None:
+                corrector = FieldCorrector(searcher.reader(), self.content_field_name)
+                self.corrector_cache.set(identity, corrector)
+
+            for word in query_words:
+                # A single suggestion can't be interrupted, stop between words.
+                if deadline is not None and time.monotonic() >= deadline:
+                    exceeded = True
+                    break
+
+                suggestions = corrector.suggest(word, limit=1)
+
+                if len(suggestions) > 0:
+                    suggested_words.append(suggestions[0])
+
+        if deadline is not None:
+            self.budget_stats.record('spelling', exceeded)
 
         spelling_suggestion = ' '.join(suggested_words)
+
+        # A suggestion cut short by the time budget isn't kept.
+        if not exceeded:
+            self.spelling_cache.set(memo_key, spelling_suggestion)
+
         return spelling_suggestion
 
     def _from_python(self, value):
@@ -749,6 +1413,29 @@ class WhooshSearchBackend(BaseSearchBackend):
 
 
 class WhooshSearchQuery(BaseSearchQuery):
+    def __init__(self, *args, **kwargs):
+        super(WhooshSearchQuery, self).__init__(*args, **kwargs)
+        self._partial = False
+
+    def run(self, spelling_query=None, **kwargs):
+        """Same as ``BaseSearchQuery.run``, but also keeps the ``partial`` flag."""
+        final_query = self.build_query()
+        search_kwargs = self.build_params(spelling_query=spelling_query)
+
+        if kwargs:
+            search_kwargs.update(kwargs)
+
+        results = self.backend.search(final_query, **search_kwargs)
+        self._results = results.get('results', [])
+        self._hit_count = results.get('hits', 0)
+        self._facet_counts = self.post_process_facets(results)
+        self._spelling_suggestion = results.get('spelling_suggestion', None)
+        self._partial = results.get('partial', False)
+
+    def is_partial(self):
+        """Whether the last run ran out of its time budget (see ``TIME_LIMIT``)."""
+        return self._partial
+
     def _convert_datetime(self, date):
         if hasattr(date, 'hour'):
             return force_text(date.strftime('%Y%m%d%H%M%S'))
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/1.9/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -109,17 +110,29 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# 也可以使用 SQLite FTS5 的后端(不依赖其他服务)，切换后需要执行 rebuild_index；
+# 它不支持分面，搜索页不再显示按标签、分类和年份的统计，URL 中的 selected_facets 被忽略：
+#     'ENGINE': 'blog.sqlite_fts_backend.SQLiteFTSEngine',
+#     'PATH': os.path.join(BASE_DIR, 'search_index.sqlite3'),
 HAYSTACK_CONNECTIONS = {
     'default': {
         'ENGINE': 'blog.whoosh_cn_backend.WhooshEngine',
         'PATH': os.path.join(BASE_DIR, 'whoosh_index'),
+        # 每次搜索最多用时(秒)，超时返回已经找到的部分结果，None 表示不限制
+        'TIME_LIMIT': 0.5,
     },
 }
 
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+# 保存文章时只把索引操作放入队列，由后台线程或者 process_search_queue 命令批量写入索引
+HAYSTACK_SIGNAL_PROCESSOR = 'blog.search_queue.QueuedSignalProcessor'
+HAYSTACK_QUEUE_FLUSH_INTERVAL = 10  # in seconds
+HAYSTACK_QUEUE_BATCH_SIZE = 500
 
 HAYSTACK_SEARCH_RESULTS_PER_PAGE = 10
 
+# sync_search_index 命令记录上一次同步时间的文件
+HAYSTACK_WATERMARK_FILE = os.path.join(BASE_DIR, 'search_index.watermark')
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.9/topics/i18n/
 
@@ -161,6 +174,33 @@ DATETIME_FORMAT = 'Y-m-d H:i:s D'
 SESSION_COOKIE_AGE = 60 * 10  # in seconds
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
+# 文章浏览量缓冲写回
+VIEW_COUNTER_FLUSH_THRESHOLD = 100  # 缓冲的访问次数达到此值时立即写回数据库
+VIEW_COUNTER_FLUSH_INTERVAL = 10  # in seconds
+
+# 缓存最近渲染过的 Markdown 文章数量
+MARKDOWN_RENDER_CACHE_SIZE = 128
+
+# 缓存必须由所有 worker 进程共享：分类导航、标签云、归档的版本号和整页缓存的标签都在这里失效，
+# 使用进程内的 LocMemCache 时，其他进程看不到失效，会一直使用旧的数据
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    },
+}
+if sys.argv[1:2] == ['test']:
+    # 测试中的 cache.clear() 不能清空真正的缓存目录，测试之间也不能共享上一次运行留下的缓存
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
+# 匿名用户整页缓存的过期时间，文章发布、修改后会立即清除受影响的页面(见 blog/page_cache.py)
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_TIMEOUT = 60 * 10  # in seconds
+
 # 发送邮件相关设置
 # EMAIL_HOST =
 # EMAIL_PORT = 25
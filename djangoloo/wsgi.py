@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djangoloo.settings")
 
 application = get_wsgi_application()
+
+# 只在 Web 服务进程中启动后台刷新线程(浏览量写回、搜索索引队列)
+from blog.lib.periodic import PeriodicWorker  # noqa: E402
+
+PeriodicWorker.enable()